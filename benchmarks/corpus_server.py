@@ -0,0 +1,135 @@
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Trang challenge giả lập (chứa marker mà http_fetch.is_challenge_page nhận ra)
+CHALLENGE_HTML = (
+    "<html><head><title>Just a moment...</title></head>"
+    "<body><div id='challenge-platform'>cf-browser-verification</div></body></html>"
+)
+ERROR_HTML = "<html><head><title>500</title></head><body>Internal Server Error</body></html>"
+
+
+class FaultProfile:
+    """
+    Cấu hình độ trễ và lỗi giả lập cho server.
+    Random có seed để các lần benchmark với cùng cấu hình nhận cùng chuỗi lỗi.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0,
+                 block_rate: float = 0.0, stall_rate: float = 0.0, stall_seconds: float = 20.0, seed: int = 42):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.block_rate = block_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Trả về (độ trễ, lỗi) cho 1 request: lỗi là None, 'fail', 'block' hoặc 'stall'"""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+        if roll < self.block_rate:
+            return delay, "block"
+        roll -= self.block_rate
+        if roll < self.fail_rate:
+            return delay, "fail"
+        roll -= self.fail_rate
+        if roll < self.stall_rate:
+            return delay + self.stall_seconds, "stall"
+        return delay, None
+
+
+class CorpusServer:
+    """
+    HTTP server local phục vụ corpus trang đã ghi (manifest.json: path -> file HTML).
+    Lỗi/độ trễ chỉ áp dụng cho trang trong corpus, các request khác (ảnh, script, ...) trả 404 ngay.
+    """
+
+    def __init__(self, corpus_dir, faults: Optional[FaultProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        self.corpus_dir = Path(corpus_dir)
+        manifest = json.loads((self.corpus_dir / "manifest.json").read_text(encoding="utf-8"))
+        self.pages: Dict[str, str] = manifest["pages"]
+        self.faults = faults or FaultProfile()
+        self.counters = {"served": 0, "fail": 0, "block": 0, "stall": 0, "not_found": 0}
+        self._counter_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status: int, body: str) -> None:
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                path = urlsplit(self.path).path.rstrip("/") or "/"
+                file_name = server.pages.get(path)
+                if file_name is None:
+                    server._count("not_found")
+                    self._send(404, "")
+                    return
+
+                delay, fault = server.faults.draw()
+                if delay:
+                    time.sleep(delay)
+                if fault == "block":
+                    server._count("block")
+                    self._send(429, CHALLENGE_HTML)
+                elif fault == "fail":
+                    server._count("fail")
+                    self._send(500, ERROR_HTML)
+                else:
+                    if fault == "stall":
+                        server._count("stall")
+                    server._count("served")
+                    self._send(200, (server.corpus_dir / file_name).read_text(encoding="utf-8"))
+
+            def log_message(self, format, *args):
+                logger.debug("%s - %s", self.address_string(), format % args)
+
+        return Handler
+
+    def start(self) -> "CorpusServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Corpus server chạy ở {self.base_url} ({len(self.pages)} trang)")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,171 @@
+"""
+Tạo corpus trang cho benchmark offline.
+- record: tải main page + listing thật (HTTP thuần, HTML server-render) và lưu lại
+- synthetic: sinh corpus giả có cùng cấu trúc HTML với selector trong CrawlConfig.LISTING_FIELDS
+
+VD:
+    python benchmarks/record_corpus.py record --pages 2 --listings 20 --out benchmarks/corpus/recorded
+    python benchmarks/record_corpus.py synthetic --pages 5 --listings 20 --out benchmarks/corpus/synthetic
+"""
+import argparse
+import asyncio
+import html
+import json
+import logging
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+EXTRACT_DIR = Path(__file__).resolve().parents[1] / "src" / "extract"
+if str(EXTRACT_DIR) not in sys.path:
+    sys.path.insert(0, str(EXTRACT_DIR))
+
+from config import CrawlConfig
+from http_fetch import create_http_client, is_challenge_page, parse_html, select_all
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MAIN_PATH = "/nha-dat-ban/p{page}"
+
+
+def _file_name(path: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", path.strip("/")) + ".html"
+
+
+def _write_manifest(out_dir: Path, source: str, pages: dict) -> None:
+    manifest = {
+        "source": source,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "pages": pages,
+    }
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"Đã ghi {len(pages)} trang vào {out_dir}")
+
+
+async def record(out_dir: Path, pages: int, listings: int) -> None:
+    """Ghi lại main page p0..p{pages-1} và tối đa `listings` listing mỗi trang từ CrawlConfig.BASE_URL"""
+    base_url = CrawlConfig.BASE_URL
+    out_dir.mkdir(parents=True, exist_ok=True)
+    recorded = {}
+
+    def save(path: str, body: str) -> None:
+        # Link tuyệt đối tới website được đổi thành link tương đối để trỏ về server local
+        body = body.replace(base_url + "/", "/")
+        (out_dir / _file_name(path)).write_text(body, encoding="utf-8")
+        recorded[path] = _file_name(path)
+
+    async with create_http_client() as client:
+        for page in range(pages):
+            main_path = MAIN_PATH.format(page=page)
+            response = await client.get(base_url + main_path)
+            if is_challenge_page(response.status_code, response.text):
+                logger.error(f"Bị chặn khi tải {main_path} ({response.status_code}), dừng ghi")
+                break
+            save(main_path, response.text)
+
+            links = select_all(parse_html(response.text), "a.js__product-link-for-product-id")
+            for link in links[:listings]:
+                path = urlsplit(link.attrs.get("href", "")).path
+                if not path or path in recorded:
+                    continue
+                listing = await client.get(base_url + path)
+                if listing.status_code != 200 or is_challenge_page(listing.status_code, listing.text):
+                    logger.warning(f"Bỏ qua {path} ({listing.status_code})")
+                    continue
+                save(path, listing.text)
+                if CrawlConfig.RATE_LIMIT_RPS > 0:
+                    await asyncio.sleep(1 / CrawlConfig.RATE_LIMIT_RPS)
+
+    _write_manifest(out_dir, base_url, recorded)
+
+
+SPECS = [
+    ("Khoảng giá", lambda r: f"{r.randint(2, 30)} tỷ"),
+    ("Diện tích", lambda r: f"{r.randint(30, 300)} m²"),
+    ("Mặt tiền", lambda r: f"{r.randint(3, 10)} m"),
+    ("Đường vào", lambda r: f"{r.randint(3, 12)} m"),
+    ("Hướng nhà", lambda r: r.choice(["Đông", "Tây", "Nam", "Bắc", "Đông - Nam"])),
+    ("Hướng ban công", lambda r: r.choice(["Đông", "Tây", "Nam", "Bắc"])),
+    ("Số tầng", lambda r: f"{r.randint(1, 6)} tầng"),
+    ("Số phòng ngủ", lambda r: f"{r.randint(1, 6)} phòng"),
+    ("Số phòng tắm, vệ sinh", lambda r: f"{r.randint(1, 5)} phòng"),
+    ("Pháp lý", lambda r: r.choice(["Sổ đỏ/ Sổ hồng", "Hợp đồng mua bán"])),
+    ("Nội thất", lambda r: r.choice(["Đầy đủ", "Cơ bản", "Không nội thất"])),
+]
+
+
+def _synthetic_listing(r: random.Random, post_id: int) -> str:
+    specs = "".join(
+        "<div class='re__pr-specs-content-item'>"
+        f"<span class='re__pr-specs-content-item-title'>{label}</span>"
+        f"<span class='re__pr-specs-content-item-value'>{html.escape(value(r))}</span></div>"
+        for label, value in SPECS
+    )
+    post_card = "".join(
+        f"<div class='re__pr-short-info-item js__pr-config-item'><span class='title'>{label}</span>"
+        f"<span class='value'>{value}</span></div>"
+        for label, value in [
+            ("Ngày đăng", "01/10/2026"),
+            ("Ngày hết hạn", "31/10/2026"),
+            ("Loại tin", "Tin thường"),
+            ("Mã tin", str(post_id)),
+        ]
+    )
+    project = ""
+    if r.random() < 0.4:
+        project = (
+            "<div class='re__project-title'>Dự án mẫu</div>"
+            "<span class='re__prj-card-config-value'><i class='re__icon-info-circle--sm'></i>"
+            "<span class='re__long-text'>Đã bàn giao</span></span>"
+            "<span class='re__prj-card-config-value'><i class='re__icon-office--sm'></i>"
+            "<span class='re__long-text'>Chủ đầu tư mẫu</span></span>"
+        )
+    # Đệm nội dung để kích thước trang gần với trang thật
+    filler = "<p>" + "Mô tả chi tiết bất động sản. " * 200 + "</p>"
+    return (
+        f"<html><head><title>Tin {post_id}</title></head><body><div class='re__main-content'>"
+        f"<h1 class='re__pr-title pr-title js__pr-title'>Bán nhà riêng {post_id}</h1>"
+        f"<span class='re__pr-short-description js__pr-address'>Phường {r.randint(1, 20)}, Quận {r.randint(1, 12)}, Hồ Chí Minh</span>"
+        f"<div class='re__pr-specs-content'>{specs}</div>{filler}{post_card}{project}"
+        "</div></body></html>"
+    )
+
+
+def synthetic(out_dir: Path, pages: int, listings: int, seed: int = 42) -> None:
+    """Sinh corpus giả: `pages` main page, mỗi trang `listings` listing"""
+    r = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    recorded = {}
+    post_id = 40000000
+    for page in range(pages):
+        links = []
+        for _ in range(listings):
+            post_id += 1
+            path = f"/ban-nha-rieng-duong-mau/ban-nha-mau-pr{post_id}"
+            (out_dir / _file_name(path)).write_text(_synthetic_listing(r, post_id), encoding="utf-8")
+            recorded[path] = _file_name(path)
+            links.append(f"<a class='js__product-link-for-product-id' href='{path}'>Tin {post_id}</a>")
+        main_path = MAIN_PATH.format(page=page)
+        (out_dir / _file_name(main_path)).write_text(
+            f"<html><body><div class='js__product-list'>{''.join(links)}</div></body></html>", encoding="utf-8"
+        )
+        recorded[main_path] = _file_name(main_path)
+    _write_manifest(out_dir, "synthetic", recorded)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo corpus trang cho benchmark offline")
+    parser.add_argument("mode", choices=["record", "synthetic"])
+    parser.add_argument("--pages", type=int, default=2, help="Số main page (p0..p{pages-1})")
+    parser.add_argument("--listings", type=int, default=20, help="Số listing tối đa mỗi main page")
+    parser.add_argument("--out", type=Path, required=True, help="Thư mục lưu corpus")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        asyncio.run(record(args.out, args.pages, args.listings))
+    else:
+        synthetic(args.out, args.pages, args.listings)
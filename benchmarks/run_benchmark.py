@@ -0,0 +1,201 @@
+"""
+Benchmark crawler offline: chạy crawl.main() với corpus trang đã ghi phục vụ bởi server local,
+có thể giả lập độ trễ / lỗi / trang chặn. Kết quả (listings/sec, CPU, RSS của Chrome, latency từng pha)
+được in ra và ghi vào benchmarks/results/ để so sánh giữa các lần thay đổi.
+
+VD:
+    python benchmarks/record_corpus.py synthetic --pages 3 --listings 20 --out benchmarks/corpus/synthetic
+    python benchmarks/run_benchmark.py --corpus benchmarks/corpus/synthetic --latency 0.3 --fail-rate 0.05
+    python benchmarks/run_benchmark.py --corpus benchmarks/corpus/synthetic --browser-only --concurrency 8 --label c8
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict
+
+import psutil
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+EXTRACT_DIR = BENCHMARK_DIR.parent / "src" / "extract"
+if str(EXTRACT_DIR) not in sys.path:
+    sys.path.insert(0, str(EXTRACT_DIR))
+
+from config import get_rate_limiter, get_subpage_semaphore
+from corpus_server import CorpusServer, FaultProfile
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceMonitor:
+    """Lấy mẫu CPU và RSS của process hiện tại và các process con (Chrome) trong lúc benchmark"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.process = psutil.Process()
+        self._cpu_first: Dict[int, float] = {}
+        self._cpu_last: Dict[int, float] = {}
+        self.rss_samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        chrome_rss = 0
+        for proc in [self.process] + self.process.children(recursive=True):
+            try:
+                times = proc.cpu_times()
+                cpu = times.user + times.system
+                # Process con xuất hiện sau khi bắt đầu đo thì tính CPU từ 0
+                self._cpu_first.setdefault(proc.pid, cpu if proc.pid == self.process.pid else 0.0)
+                self._cpu_last[proc.pid] = cpu
+                if proc.pid != self.process.pid:
+                    chrome_rss += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        self.rss_samples.append(chrome_rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "ResourceMonitor":
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        own_pid = self.process.pid
+        chrome_cpu = sum(self._cpu_last[pid] - self._cpu_first[pid] for pid in self._cpu_last if pid != own_pid)
+        samples = [rss for rss in self.rss_samples if rss]
+        return {
+            "cpu_seconds_python": round(self._cpu_last[own_pid] - self._cpu_first[own_pid], 2),
+            "cpu_seconds_chrome": round(chrome_cpu, 2),
+            "chrome_rss_peak_mb": round(max(samples, default=0) / (1024 * 1024), 1),
+            "chrome_rss_mean_mb": round(sum(samples) / len(samples) / (1024 * 1024), 1) if samples else 0.0,
+        }
+
+
+def crawl_overrides(args, base_url: str) -> dict:
+    """Tham số truyền thẳng vào crawl.main() thay cho CrawlConfig (không sửa CrawlConfig)"""
+    return {
+        "base_url": base_url,
+        "seen_freshness_hours": 0,
+        # Số main page cố định để các lần benchmark so sánh được với nhau
+        "auto_pagination": False,
+        "http_first": not args.browser_only,
+        "block_resources": not args.no_blocking,
+        "subpage_semaphore": get_subpage_semaphore(fixed_limit=args.concurrency or None, rate_limit_rps=args.rps),
+        "rate_limiter": get_rate_limiter(rate=args.rps, cooldown_seconds=args.cooldown),
+    }
+
+
+def count_rows(files) -> Dict[str, int]:
+    rows = complete = 0
+    for path in files:
+        with open(path, newline="", encoding="utf-8-sig") as csvfile:
+            for row in csv.DictReader(csvfile):
+                rows += 1
+                if row.get("title") and row.get("post_id"):
+                    complete += 1
+    return {"rows": rows, "complete_rows": complete}
+
+
+def run(args) -> dict:
+    faults = FaultProfile(
+        latency=args.latency,
+        jitter=args.jitter,
+        fail_rate=args.fail_rate,
+        block_rate=args.block_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        seed=args.seed,
+    )
+    with CorpusServer(args.corpus, faults) as server, tempfile.TemporaryDirectory(prefix="crawl_bench_") as work_dir:
+        import nodriver as uc
+        from crawl import main
+        from metrics import tracer
+
+        main_pages = sorted(path for path in server.pages if path.startswith("/nha-dat-ban/p"))
+        end_page = args.pages - 1 if args.pages else len(main_pages) - 1
+
+        monitor = ResourceMonitor().start()
+        started = time.monotonic()
+        result = uc.loop().run_until_complete(main(
+            start_page=0,
+            end_page=end_page,
+            output_dir=str(Path(work_dir) / "raw"),
+            state_dir=str(Path(work_dir) / "state"),
+            report_dir=str(Path(work_dir) / "reports"),
+            seen_dir=str(Path(work_dir) / "seen"),
+            **crawl_overrides(args, server.base_url),
+        ))
+        wall = time.monotonic() - started
+        resources = monitor.stop()
+        rows = count_rows(result.get("files", []))
+
+        return {
+            "label": args.label,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "corpus": str(args.corpus),
+            "settings": {
+                name: value for name, value in vars(args).items() if name not in ("corpus", "out")
+            },
+            "wall_seconds": round(wall, 2),
+            **rows,
+            "listings_per_sec": round(rows["complete_rows"] / wall, 3) if wall else 0.0,
+            **resources,
+            "server": dict(server.counters),
+            "phases": tracer.summary(),
+            "counters": dict(tracer.counters),
+        }
+
+
+def print_summary(report: dict) -> None:
+    print(f"\n=== Benchmark {report['label'] or ''} ===")
+    for key in ("wall_seconds", "rows", "complete_rows", "listings_per_sec", "cpu_seconds_python",
+                "cpu_seconds_chrome", "chrome_rss_peak_mb", "chrome_rss_mean_mb"):
+        print(f"{key:<22}{report[key]}")
+    print(f"{'server':<22}{report['server']}")
+    print(f"\n{'phase':<28}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for phase, stats in report["phases"].items():
+        print(f"{phase:<28}{stats['count']:>7}{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark crawler với corpus trang đã ghi (không cần mạng)")
+    parser.add_argument("--corpus", type=Path, required=True, help="Thư mục corpus (có manifest.json)")
+    parser.add_argument("--pages", type=int, default=0, help="Số main page cần cào (mặc định toàn bộ corpus)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ trung bình mỗi trang (giây)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Độ lệch ngẫu nhiên của độ trễ (giây)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Tỷ lệ trang trả về 500")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="Tỷ lệ trang trả về 429 + challenge")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Tỷ lệ trang bị treo --stall-seconds giây")
+    parser.add_argument("--stall-seconds", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=42, help="Seed cho độ trễ/lỗi giả lập")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="Số subpage đồng thời cố định (mặc định dùng AdaptiveLimiter)")
+    parser.add_argument("--rps", type=float, default=0.0, help="RATE_LIMIT_RPS (mặc định 0 = tắt)")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="RATE_LIMIT_COOLDOWN khi gặp trang chặn")
+    parser.add_argument("--browser-only", action="store_true", help="Tắt HTTP_FIRST, mọi listing đi qua browser")
+    parser.add_argument("--no-blocking", action="store_true", help="Tắt BLOCK_RESOURCES")
+    parser.add_argument("--label", default="", help="Tên lần chạy (dùng trong tên file kết quả)")
+    parser.add_argument("--out", type=Path, default=BENCHMARK_DIR / "results", help="Thư mục ghi kết quả")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_summary(report)
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    result_path = args.out / f"bench_{timestamp}{'_' + args.label if args.label else ''}.json"
+    result_path.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    print(f"\nĐã ghi kết quả vào {result_path}")
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import math
+import statistics
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from errors import BLOCKED, BROWSER_DEAD, NAVIGATION_TIMEOUT, PROTOCOL, classify_error
+
+logger = logging.getLogger(__name__)
+
+# Lỗi cho thấy hệ thống/website đang quá tải nên giảm ngay, không chờ hết cửa sổ
+BACKOFF_ERRORS = {PROTOCOL, NAVIGATION_TIMEOUT, BROWSER_DEAD}
+# Trang chặn đã được xử lý bằng cooldown của rate limiter (dừng cả host), không giảm concurrency nữa
+# để 1 sự kiện không bị phạt 2 lần
+COOLDOWN_ERRORS = {BLOCKED}
+
+
+class AdaptiveLimiter:
+    """
+    Giới hạn số subpage xử lý đồng thời theo kiểu AIMD (cộng tăng, nhân giảm).
+    Dùng như Semaphore: `async with limiter: ...`.
+    - Sau mỗi cửa sổ `limit` listing: latency p50 và tỷ lệ lỗi ổn, RSS của Chrome dưới ngưỡng → limit += increase_step
+    - Ngược lại, hoặc gặp lỗi trong BACKOFF_ERRORS → limit *= decrease_factor
+      (lỗi trong COOLDOWN_ERRORS không tính vào tỷ lệ lỗi: rate limiter đã cooldown)
+    - rate_limit_rps > 0: limit không vượt quá rate_limit_rps * p50 (số listing cần chạy song song để dùng hết
+      tốc độ của rate limiter), thêm slot nữa chỉ làm listing xếp hàng chờ token
+    Latency không tính thời gian chờ token của rate limiter (báo qua exclude_wait), nếu không thì limit càng cao
+    thì latency càng tăng và p50 phản ánh hàng đợi token chứ không phải tốc độ website.
+    min_limit == max_limit thì tương đương Semaphore cố định.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        error_rate_threshold: float,
+        rss_budget_bytes: Optional[int] = None,
+        increase_step: int = 1,
+        decrease_factor: float = 0.5,
+        history_size: int = 100,
+        rate_limit_rps: float = 0.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.latency_target = latency_target
+        self.error_rate_threshold = error_rate_threshold
+        self.rss_budget_bytes = rss_budget_bytes
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.rate_limit_rps = rate_limit_rps
+        self.rss_probe: Optional[Callable[[], Optional[int]]] = None
+
+        self._cond = asyncio.Condition()
+        self._active = 0
+        self._started: Dict[asyncio.Task, float] = {}
+        self._task_errors: Dict[asyncio.Task, str] = {}
+        self._task_waits: Dict[asyncio.Task, float] = {}
+        self._window_latencies: List[float] = []
+        self._window_errors = 0
+        self._completed = 0
+        self._completed_at_last_decrease = -1
+        self._last_rss: Optional[int] = None
+        self.decisions: deque = deque(maxlen=history_size)
+        self.counters = {"increase": 0, "decrease": 0, "completed": 0, "errors": 0}
+
+    def set_rss_probe(self, probe: Callable[[], Optional[int]]) -> None:
+        """Hàm trả về RSS (bytes) của Chrome, dùng để giảm concurrency khi RAM tăng cao"""
+        self.rss_probe = probe
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        self._started[asyncio.current_task()] = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        task = asyncio.current_task()
+        latency = time.monotonic() - self._started.pop(task, time.monotonic())
+        latency = max(0.0, latency - self._task_waits.pop(task, 0.0))
+        error = self._task_errors.pop(task, None)
+        if exc is not None and error is None:
+            error = classify_error(exc)
+        async with self._cond:
+            self._active -= 1
+            self._complete(latency, error)
+            self._cond.notify_all()
+        return False
+
+    def report_error(self, kind: str) -> None:
+        """Gọi trong khối `async with` để báo listing hiện tại bị lỗi loại `kind`"""
+        self._task_errors[asyncio.current_task()] = kind
+
+    def exclude_wait(self, seconds: float) -> None:
+        """Gọi trong khối `async with` để trừ thời gian chờ token (rate limiter) khỏi latency của listing hiện tại"""
+        task = asyncio.current_task()
+        # Request ngoài limiter (VD: main page) thì bỏ qua
+        if task in self._started:
+            self._task_waits[task] = self._task_waits.get(task, 0.0) + seconds
+
+    def _record_decision(self, action: str, reason: str, previous: int) -> None:
+        self.counters[action] += 1
+        self.decisions.append({
+            "at": time.time(),
+            "action": action,
+            "reason": reason,
+            "from": previous,
+            "to": self.limit,
+        })
+        logger.info(f"Concurrency {action}: {previous} -> {self.limit} ({reason})")
+
+    def _increase(self, reason: str) -> None:
+        previous = self.limit
+        self.limit = min(self.max_limit, self.limit + self.increase_step)
+        if self.limit != previous:
+            self._record_decision("increase", reason, previous)
+
+    def _decrease(self, reason: str) -> None:
+        previous = self.limit
+        self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        self._completed_at_last_decrease = self._completed
+        if self.limit != previous:
+            self._record_decision("decrease", reason, previous)
+
+    def _cap(self, cap: int, reason: str) -> None:
+        previous = self.limit
+        self.limit = cap
+        self._record_decision("decrease", reason, previous)
+
+    def _reset_window(self) -> None:
+        self._window_latencies = []
+        self._window_errors = 0
+
+    def _complete(self, latency: float, error: Optional[str]) -> None:
+        self._completed += 1
+        self.counters["completed"] += 1
+        self._window_latencies.append(latency)
+        if error:
+            self.counters["errors"] += 1
+            if error not in COOLDOWN_ERRORS:
+                self._window_errors += 1
+
+        # Lỗi quá tải thì giảm ngay, nhưng tối đa 1 lần mỗi `limit` listing để 1 đợt lỗi không giảm liên tục
+        if error in BACKOFF_ERRORS and self._completed - self._completed_at_last_decrease >= self.limit:
+            self._decrease(error)
+            self._reset_window()
+            return
+
+        if len(self._window_latencies) < self.limit:
+            return
+
+        p50 = statistics.median(self._window_latencies)
+        error_rate = self._window_errors / len(self._window_latencies)
+        self._reset_window()
+
+        if self.rss_probe is not None and self.rss_budget_bytes:
+            try:
+                self._last_rss = self.rss_probe()
+            except Exception as error:
+                logger.debug(f"Không đo được RSS: {error}")
+
+        rate_cap = self.max_limit
+        if self.rate_limit_rps > 0:
+            rate_cap = min(self.max_limit, max(self.min_limit, math.ceil(self.rate_limit_rps * p50)))
+
+        if self.limit > rate_cap:
+            self._cap(rate_cap, f"rate_cap={rate_cap} (rps={self.rate_limit_rps:g} p50={p50:.2f}s)")
+        elif error_rate > self.error_rate_threshold:
+            self._decrease(f"error_rate={error_rate:.2f}")
+        elif p50 > self.latency_target:
+            self._decrease(f"p50={p50:.1f}s")
+        elif self._last_rss and self.rss_budget_bytes and self._last_rss > self.rss_budget_bytes:
+            self._decrease(f"rss={self._last_rss / (1024 * 1024):.0f}MB")
+        elif self._active >= self.limit - 1 and self.limit < rate_cap:
+            # Chỉ tăng khi đang dùng gần hết limit (tăng khi không có việc thì vô nghĩa)
+            self._increase(f"p50={p50:.1f}s error_rate={error_rate:.2f}")
+
+    def metrics(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self._active,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "last_rss_mb": round(self._last_rss / (1024 * 1024), 1) if self._last_rss else None,
+            **self.counters,
+            "recent_decisions": list(self.decisions),
+        }
@@ -1,20 +1,196 @@
-import asyncio
+import os
 
 
 class CrawlConfig:
-    
+
+    # Website cần cào (benchmark đổi sang server local phục vụ trang đã ghi lại)
+    BASE_URL = "https://batdongsan.com.vn"
+
+    # Đường dẫn Chrome (mặc định là Chrome của GitHub Actions, lấy ở log github actions), đặt biến môi trường CHROME_PATH=""
+    # để nodriver tự tìm Chrome trên máy local
+    BROWSER_EXECUTABLE_PATH = os.getenv("CHROME_PATH", "/opt/hostedtoolcache/setup-chrome/chrome/stable/x64/chrome")
+
     # Semaphore cho subpage - giới hạn số lượng subpage được xử lý đồng thời cho mỗi main page
+    # Khi bật ADAPTIVE_CONCURRENCY thì đây là giá trị khởi đầu, limit sẽ tự tăng/giảm trong [ADAPTIVE_MIN_LIMIT, ADAPTIVE_MAX_LIMIT]
     SUBPAGE_SEMAPHORE_LIMIT = 10
+
+    # Tự điều chỉnh concurrency (AIMD): tăng dần khi latency/tỷ lệ lỗi ổn, giảm một nửa khi
+    # gặp ProtocolException, timeout hoặc RAM của Chrome vượt ngưỡng (trang chặn: RATE_LIMIT_COOLDOWN)
+    ADAPTIVE_CONCURRENCY = True
+    ADAPTIVE_MIN_LIMIT = 2
+    ADAPTIVE_MAX_LIMIT = 32
+    ADAPTIVE_LATENCY_TARGET = 15.0   # p50 latency (giây) mỗi listing tối đa để còn tăng concurrency
+    ADAPTIVE_ERROR_RATE = 0.1        # tỷ lệ lỗi tối đa trong 1 cửa sổ
+    ADAPTIVE_RSS_BUDGET_MB = 3000    # RSS tối đa của toàn bộ process Chrome
+    # Ngoài ra limit không vượt quá RATE_LIMIT_RPS x p50 latency (VD: 3 rps x 4s = 12), ADAPTIVE_MAX_LIMIT chỉ là trần cứng
     
+    # Số main page được thu thập đồng thời (chạy song song với việc cào subpage)
+    MAIN_PAGE_CONCURRENCY = 2
+
+    # Kích thước hàng đợi subpage URL giữa bước thu thập main page và bước cào subpage
+    SUBPAGE_QUEUE_SIZE = 100
+
     # Trang bắt đầu thu thập
     START_PAGE = 0
     
     # Chunk size cho subpage
     SUBPAGE_CHUNK_SIZE = 200
     
-    # Trang kết thúc thu thập
+    # Trang kết thúc thu thập (chỉ dùng khi AUTO_PAGINATION = False)
     END_PAGE = 1
-    
+
+    # Tự dò số trang: đi lần lượt pN từ START_PAGE và dừng khi tỷ lệ subpage của 1 trang đã có trong
+    # seen index (đã cào ở lần chạy nào đó) >= KNOWN_FRACTION_STOP, hoặc hết trang, hoặc đủ MAX_PAGES trang.
+    # Mặc định tắt: trang của 1 danh sách tin được đi tuần tự và --workers chỉ chia theo LISTING_SHARDS,
+    # nên chỉ nên bật khi seen index đã có dữ liệu và LISTING_SHARDS có nhiều danh sách
+    AUTO_PAGINATION = False
+    KNOWN_FRACTION_STOP = 0.8
+    MAX_PAGES = 200
+
+    # Các danh sách tin cần đi (path danh mục, có thể kèm query lọc giá/diện tích), trang N là {path}/pN?{query}
+    # VD: ["/ban-can-ho-chung-cu", "/ban-nha-rieng", "/ban-dat"]. Khi chạy --workers, mỗi worker nhận 1 phần danh sách
+    LISTING_SHARDS = ["/nha-dat-ban"]
+
+    # Số process cào song song (mỗi process 1 browser, chia đều đoạn START_PAGE..END_PAGE,
+    # hoặc chia LISTING_SHARDS khi AUTO_PAGINATION = True)
+    # Có thể ghi đè bằng: python src/extract/crawl.py --workers 4
+    CRAWL_WORKERS = 1
+
+    # Tin đã cào trong khoảng này (giờ) sẽ không cào lại (chỉ mục lưu ở data/state/seen_listings.sqlite)
+    # Mặc định 0 (tắt): lịch chạy 4 lần/ngày (6 giờ/lần), bỏ qua tin trong 24 giờ sẽ làm mất cập nhật giá/trạng thái.
+    # Nếu bật thì đặt nhỏ hơn khoảng cách giữa 2 lần chạy (VD: 4). Tin không đổi đã rẻ nhờ FINGERPRINT_PRECHECK
+    SEEN_FRESHNESS_HOURS = 0
+
+    # Tin đã hết hạn freshness nhưng có fingerprint trang (giá, diện tích, mã tin, text block thông số)
+    # trùng lần cào trước thì không extract đầy đủ, chỉ ghi 1 dòng "seen again" vào data/seen
+    FINGERPRINT_PRECHECK = True
+    PAGE_FINGERPRINT_FIELDS = ["post_id", "price", "area"]
+
+    # Lấy tin bằng HTTP thuần (httpx) trước, chỉ mở browser khi bị chặn hoặc thiếu trường bắt buộc
+    HTTP_FIRST = True
+    HTTP_TIMEOUT = 15.0
+    HTTP_MAX_CONNECTIONS = 20
+    # Trường "needs_scroll" (block dự án) chỉ render phía client: HTML server-render có phần tử mang class bắt đầu
+    # bằng các prefix này (khung của block dự án) mà thiếu trường needs_scroll thì chuyển sang browser
+    HTTP_LAZY_BLOCK_CLASSES = ["re__project", "re__prj-"]
+
+    # Giới hạn tốc độ request tới mỗi host (token bucket), áp dụng cho mọi lần điều hướng browser và HTTP fetch
+    # Đặt RATE_LIMIT_RPS = 0 để tắt
+    RATE_LIMIT_RPS = 3.0             # số request trung bình mỗi giây
+    RATE_LIMIT_BURST = 5             # số request tối đa được gửi dồn
+    RATE_LIMIT_JITTER = 0.3          # thêm độ trễ ngẫu nhiên 0..JITTER giây mỗi request
+    RATE_LIMIT_COOLDOWN = 60.0       # tạm dừng toàn bộ request (giây) khi gặp trang chặn / HTTP 429 (không giảm concurrency)
+
+    # Retry theo loại lỗi (xem src/extract/errors.py): listing lỗi được đưa vào hàng đợi retry và cào lại
+    # ở cuối lần chạy sau backoff * 2^(lần thử - 1) giây (tối đa RETRY_BACKOFF_MAX). retries = 0: không cào lại
+    RETRY_POLICY = {
+        "navigation_timeout": {"retries": 2, "backoff": 5.0},
+        "blocked": {"retries": 2, "backoff": 30.0},
+        "not_found": {"retries": 0, "backoff": 0.0},   # tin hết hạn / bị gỡ, cào lại vô ích
+        "partial_render": {"retries": 1, "backoff": 5.0},
+        "protocol_exception": {"retries": 2, "backoff": 2.0},
+        "browser_dead": {"retries": 2, "backoff": 10.0},
+        "unexpected_exception": {"retries": 1, "backoff": 5.0},
+    }
+    RETRY_BACKOFF_MAX = 120.0
+    NAVIGATION_TIMEOUT = 30.0        # thời gian tối đa cho 1 lần điều hướng tab (giây)
+
+    # Giám sát browser: Chrome chết / không trả lời thì khởi động lại và cào lại các listing đang dở
+    BROWSER_MAX_RESTARTS = 5         # số lần khởi động lại tối đa mỗi lần chạy
+    BROWSER_HEALTH_INTERVAL = 30.0   # chu kỳ kiểm tra sức khỏe browser (giây)
+    BROWSER_HEALTH_TIMEOUT = 10.0    # browser không trả lời Browser.getVersion trong khoảng này thì coi là chết
+    TAB_HUNG_TIMEOUT = 120.0         # 1 listing chiếm tab quá lâu thì coi là tab bị treo
+
+    # Giới hạn RAM của Chrome (RSS của toàn bộ process Chrome, đo bằng psutil) cho máy ít RAM (VD: runner 7GB)
+    MEMORY_WATCHDOG = True
+    MEMORY_SOFT_BUDGET_MB = 2500     # vượt: ngừng mở tab mới, đóng tab rảnh, làm mới browser ở ranh giới chunk kế tiếp
+    MEMORY_HARD_BUDGET_MB = 3500     # vượt: làm mới browser ngay
+    MEMORY_RESUME_RATIO = 0.8        # RSS xuống dưới SOFT * RATIO thì mở tab mới trở lại
+    MEMORY_CHECK_INTERVAL = 5.0      # chu kỳ lấy mẫu (giây)
+
+    # Tab pool cho subpage (số tab tối đa = limit tối đa của AdaptiveLimiter)
+    TAB_MAX_NAVIGATIONS = 50         # thay tab mới sau số lần điều hướng này
+    TAB_MAX_HEAP_MB = 300            # thay tab mới khi JS heap của tab vượt ngưỡng này (MB)
+
+    # Chặn tài nguyên không dùng tới khi tải subpage (ảnh, font, video, quảng cáo, tracker, bản đồ)
+    BLOCK_RESOURCES = True
+    # Loại tài nguyên bị chặn (theo CDP Network.ResourceType)
+    BLOCKED_RESOURCE_TYPES = ["Image", "Font", "Media"]
+    # Loại tài nguyên -> URL pattern vẫn cho tải dù loại đó bị chặn
+    BLOCK_ALLOW_PATTERNS = {
+        "Image": [],
+        "Font": [],
+        "Media": [],
+    }
+    # URL pattern bị chặn với mọi loại tài nguyên (wildcard '*')
+    BLOCKED_URL_PATTERNS = [
+        "*google-analytics.com*",
+        "*googletagmanager.com*",
+        "*googlesyndication.com*",
+        "*doubleclick.net*",
+        "*adservice.google.*",
+        "*maps.googleapis.com*",
+        "*maps.gstatic.com*",
+        "*connect.facebook.net*",
+        "*facebook.com/tr*",
+        "*hotjar.com*",
+        "*clarity.ms*",
+        "*criteo.*",
+        "*youtube.com/embed*",
+    ]
+    # Khi chặn tài nguyên thì trang ngắn và nhẹ hơn, chỉ cần scroll ít để render các trường có "needs_scroll"
+    SCROLL_STEPS = 6
+    SCROLL_STEPS_WITH_BLOCKING = 2
+
+    # Đo thời gian từng pha (navigate, readiness, evaluate, reload, ...) và ghi report vào data/raw/reports
+    METRICS_ENABLED = True
+    METRICS_OPENMETRICS = False      # ghi thêm file .prom (OpenMetrics text)
+    METRICS_MAX_SPANS = 200000       # số span chi tiết tối đa giữ trong RAM
+    METRICS_RESERVOIR_SIZE = 10000   # số mẫu thời lượng tối đa giữ cho mỗi pha để tính p50/p95/p99
+
+    # Thời gian chờ tối đa (giây) cho từng tín hiệu sẵn sàng của trang
+    # Trang sẵn sàng sớm thì đi tiếp ngay, không sleep cố định
+    MAIN_CONTENT_TIMEOUT = 10.0      # chờ .re__main-content xuất hiện
+    SPECS_TIMEOUT = 5.0              # chờ block thông số (specs) xuất hiện
+    NETWORK_IDLE_TIMEOUT = 5.0       # chờ mạng rảnh
+    NETWORK_IDLE_QUIET = 0.5         # mạng phải im lặng bao lâu thì coi là rảnh
+    SCROLL_IDLE_QUIET = 0.2          # sau mỗi lần scroll, chờ lazy-load im lặng bao lâu
+    MAIN_PAGE_READY_TIMEOUT = 5.0    # chờ link subpage xuất hiện ở main page
+
+    # Khai báo các trường cần lấy ở subpage (tên trường -> cách lấy)
+    # - selector: lấy text của phần tử khớp CSS selector
+    # - specs: lấy value trong block thông số (div.re__pr-specs-content-item) theo label
+    # - project_card: lấy value trong card dự án theo class của icon
+    # - post_card: lấy value trong block thông tin tin đăng theo label
+    # required: trường bắt buộc (HTTP path thiếu thì chuyển sang browser, selector rỗng thì lấy lại bằng text_from_selector)
+    # optional: trường có thể không tồn tại ở trang (VD: tin không thuộc dự án)
+    # needs_scroll: trường nằm ở cuối trang, chỉ được render sau khi scroll (các trường còn lại có sẵn trong HTML)
+    # Toàn bộ được lấy trong 1 lần evaluate nên thêm trường mới không tốn thêm round trip
+    LISTING_FIELDS = {
+        "title": {"type": "selector", "selector": "h1[class='re__pr-title pr-title js__pr-title']", "required": True},
+        "address": {"type": "selector", "selector": "span[class='re__pr-short-description js__pr-address']", "required": True},
+        "price": {"type": "specs", "label": "Khoảng giá", "required": True},
+        "area": {"type": "specs", "label": "Diện tích", "required": True},
+        "house_direction": {"type": "specs", "label": "Hướng nhà"},
+        "balcony_direction": {"type": "specs", "label": "Hướng ban công"},
+        "facade": {"type": "specs", "label": "Mặt tiền"},
+        "legal": {"type": "specs", "label": "Pháp lý"},
+        "furniture": {"type": "specs", "label": "Nội thất"},
+        "number_bedroom": {"type": "specs", "label": "Số phòng ngủ"},
+        "number_bathroom": {"type": "specs", "label": "Số phòng tắm, vệ sinh"},
+        "number_floor": {"type": "specs", "label": "Số tầng"},
+        "way_in": {"type": "specs", "label": "Đường vào"},
+        "project_name": {"type": "selector", "selector": "div[class='re__project-title']", "optional": True, "needs_scroll": True},
+        "project_status": {"type": "project_card", "icon_class": "re__icon-info-circle--sm", "needs_scroll": True},
+        "project_investor": {"type": "project_card", "icon_class": "re__icon-office--sm", "needs_scroll": True},
+        "post_id": {"type": "post_card", "label": "Mã tin", "required": True},
+        "post_start_time": {"type": "post_card", "label": "Ngày đăng"},
+        "post_end_time": {"type": "post_card", "label": "Ngày hết hạn"},
+        "post_type": {"type": "post_card", "label": "Loại tin"},
+    }
+
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
     BROWSER_ARGS = [
     '--disable-dev-shm-usage',
     '--disable-gpu',
@@ -22,7 +198,7 @@ class CrawlConfig:
     '--no-sandbox',
     '--window-size=1366,768',
     '--lang=vi-VN',
-    '--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    f'--user-agent={USER_AGENT}'
     ]
 
     STEALTH_EVASION_SCRIPT = """
@@ -92,6 +268,41 @@ class CrawlConfig:
     };
     """
 
-def get_subpage_semaphore():
-    """Trả về một instance của Semaphore cho subpage."""
-    return asyncio.Semaphore(CrawlConfig.SUBPAGE_SEMAPHORE_LIMIT)
\ No newline at end of file
+def get_subpage_semaphore(fixed_limit=None, rate_limit_rps=None):
+    """
+    Trả về limiter cho subpage (dùng như Semaphore: `async with ...`).
+    ADAPTIVE_CONCURRENCY = False thì limit cố định bằng SUBPAGE_SEMAPHORE_LIMIT.
+    fixed_limit / rate_limit_rps (nếu có) thay cho giá trị trong CrawlConfig (VD: benchmark)
+    """
+    from concurrency import AdaptiveLimiter
+
+    if fixed_limit:
+        initial_limit = min_limit = max_limit = fixed_limit
+    elif not CrawlConfig.ADAPTIVE_CONCURRENCY:
+        initial_limit = min_limit = max_limit = CrawlConfig.SUBPAGE_SEMAPHORE_LIMIT
+    else:
+        initial_limit = CrawlConfig.SUBPAGE_SEMAPHORE_LIMIT
+        min_limit, max_limit = CrawlConfig.ADAPTIVE_MIN_LIMIT, CrawlConfig.ADAPTIVE_MAX_LIMIT
+    return AdaptiveLimiter(
+        initial_limit=initial_limit,
+        min_limit=min_limit,
+        max_limit=max_limit,
+        latency_target=CrawlConfig.ADAPTIVE_LATENCY_TARGET,
+        error_rate_threshold=CrawlConfig.ADAPTIVE_ERROR_RATE,
+        rss_budget_bytes=CrawlConfig.ADAPTIVE_RSS_BUDGET_MB * 1024 * 1024,
+        rate_limit_rps=CrawlConfig.RATE_LIMIT_RPS if rate_limit_rps is None else rate_limit_rps,
+    )
+
+def get_rate_limiter(rate=None, cooldown_seconds=None):
+    """
+    Trả về rate limiter theo host dùng chung cho browser và HTTP fetch.
+    rate / cooldown_seconds (nếu có) thay cho RATE_LIMIT_RPS / RATE_LIMIT_COOLDOWN
+    """
+    from rate_limiter import HostRateLimiter
+
+    return HostRateLimiter(
+        rate=CrawlConfig.RATE_LIMIT_RPS if rate is None else rate,
+        burst=CrawlConfig.RATE_LIMIT_BURST,
+        jitter=CrawlConfig.RATE_LIMIT_JITTER,
+        cooldown_seconds=CrawlConfig.RATE_LIMIT_COOLDOWN if cooldown_seconds is None else cooldown_seconds,
+    )
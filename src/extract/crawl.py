@@ -1,19 +1,55 @@
+import argparse
 import asyncio
+import json
 import logging
-from collections import defaultdict
+import time
 from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse
+import httpx
 import nodriver as uc
 from utils import (
-    extract_value_from_specs,
+    extract_listing_fields,
     text_from_selector,
-    extract_value_from_project_card,
-    extract_value_from_post_card,
-    save_results_to_csv,
+    ChunkedCsvWriter,
+    SEEN_AGAIN_FIELDNAMES,
+    SEEN_DATA_DIR,
+    STATE_DIR,
+    extract_page_fingerprint_parts,
+    get_process_tree_rss,
     wait_for_content_load,
+    wait_for_selector,
+    get_network_tracker,
 )
-from typing import Optional, List, Tuple
-from nodriver.core.connection import ProtocolException
-from config import get_subpage_semaphore, CrawlConfig
+from typing import Callable, Optional, List, Tuple
+from config import get_subpage_semaphore, get_rate_limiter, CrawlConfig
+from tab_pool import TabPool
+from shard import run_sharded
+from frontier import UrlFrontier
+from seen_index import SeenIndex, page_fingerprint, seen_again_item
+from http_fetch import create_http_client, fetch_listing_http, is_challenge_page, is_not_found_page
+from errors import (
+    BLOCKED,
+    BROWSER_DEAD,
+    NAVIGATION_TIMEOUT,
+    NOT_FOUND,
+    PARTIAL_RENDER,
+    PROTOCOL,
+    UNEXPECTED,
+    BlockedPageError,
+    BrowserDeadError,
+    ListingNotFoundError,
+    PartialRenderError,
+    classify_error,
+    retry_budget,
+    retry_delay,
+)
+from concurrency import AdaptiveLimiter
+from rate_limiter import HostRateLimiter
+from resource_blocking import create_resource_blocker
+from metrics import tracer
+from supervisor import BrowserSupervisor
+from memory_watchdog import MemoryWatchdog
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,8 +57,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-BASE_URL = "https://batdongsan.com.vn"
-START = "/nha-dat-ban/"
+
+def main_page_url(shard: str, page: int, base_url: Optional[str] = None) -> str:
+    """
+    URL trang `page` của 1 danh sách tin (CrawlConfig.LISTING_SHARDS), base_url mặc định CrawlConfig.BASE_URL
+    VD: ("/nha-dat-ban", 2) → .../nha-dat-ban/p2, ("/ban-nha-rieng?gcn=5-ty", 2) → .../ban-nha-rieng/p2?gcn=5-ty
+    """
+    path, _, query = shard.partition("?")
+    url = f"{base_url or CrawlConfig.BASE_URL}{path.rstrip('/')}/p{page}"
+    return f"{url}?{query}" if query else url
 
 
 
@@ -31,7 +74,7 @@ async def start_browser():
         browser = await uc.start(
             headless=True,
             sandbox=False,
-            browser_executable_path="/opt/hostedtoolcache/setup-chrome/chrome/stable/x64/chrome", # Lấy cái này ở log github actions nhá
+            browser_executable_path=CrawlConfig.BROWSER_EXECUTABLE_PATH or None,
             browser_args=CrawlConfig.BROWSER_ARGS
         )
         if not getattr(browser, "connection", None):
@@ -45,24 +88,70 @@ async def start_browser():
 
 
 async def apply_stealth_and_wait(page):
+    """Inject stealth script rồi chờ danh sách tin xuất hiện và mạng rảnh thay vì sleep cố định"""
     await page.evaluate(CrawlConfig.STEALTH_EVASION_SCRIPT)
-    await asyncio.sleep(5)
-
-
-def build_main_page_payload(main_page_results: dict):
-    payload = []
-    for main_url, subpages in main_page_results.items():
-        payload.append(
-            {
-                "main_page_url": main_url,
-                "subpage_count": len(subpages),
-                "subpage_data": subpages,
-            }
-        )
-    return payload
-
 
-async def extract_subpage_urls(page):
+    started = time.monotonic()
+    tracker = await get_network_tracker(page)
+    links_ready = await wait_for_selector(
+        page, "a.js__product-link-for-product-id", CrawlConfig.MAIN_PAGE_READY_TIMEOUT
+    )
+    links_waited = time.monotonic() - started
+    idle = False
+    if tracker:
+        idle = await tracker.wait_idle(
+            quiet=CrawlConfig.NETWORK_IDLE_QUIET,
+            timeout=CrawlConfig.NETWORK_IDLE_TIMEOUT,
+        )
+    logger.info(
+        "Readiness %s: listing_links=%.3fs%s, total=%.3fs%s",
+        page.url,
+        links_waited,
+        "" if links_ready else " (timeout)",
+        time.monotonic() - started,
+        "" if idle else " (network not idle)",
+    )
+
+
+PAGE_STATE_JS = """
+JSON.stringify({
+    head: document.title + '\\n' + (document.documentElement ? document.documentElement.outerHTML.slice(0, 5000) : ''),
+    text: document.title + '\\n' + (document.body ? document.body.innerText.slice(0, 3000) : ''),
+    main: !!document.querySelector('.re__main-content'),
+})
+"""
+
+
+async def detect_page_state(page) -> str:
+    """
+    Phân loại trang đang hiển thị trong 1 lần evaluate (kèm HTTP status của document nếu có):
+    BLOCKED (trang chặn / challenge), NOT_FOUND (tin hết hạn / bị gỡ), "ok" (có nội dung tin)
+    hoặc PARTIAL_RENDER (chưa render xong / render lỗi)
+    """
+    tracker = getattr(page, "_network_idle_tracker", None)
+    status = tracker.document_status if tracker is not None else None
+    if status in (403, 429, 503):
+        return BLOCKED
+    if status in (404, 410):
+        return NOT_FOUND
+    try:
+        result = await page.evaluate(PAGE_STATE_JS, return_by_value=True)
+        if hasattr(result, "value"):
+            result = result.value
+        state = json.loads(result) if isinstance(result, str) else {}
+    except Exception as error:
+        logger.debug(f"Không kiểm tra được trạng thái trang {page.url}: {error}")
+        return PARTIAL_RENDER
+    if is_challenge_page(200, state.get("head", "")):
+        return BLOCKED
+    if state.get("main"):
+        return "ok"
+    if is_not_found_page(200, state.get("text", "")):
+        return NOT_FOUND
+    return PARTIAL_RENDER
+
+
+async def extract_subpage_urls(page, base_url: Optional[str] = None):
     # Sử dụng JavaScript để lấy tất cả các phần tử a có class js__product-link-for-product-id
     js_code = """
     Array.from(document.querySelectorAll('a.js__product-link-for-product-id'))
@@ -72,119 +161,203 @@ async def extract_subpage_urls(page):
     href_list = await page.evaluate(js_code)
     
     # Lọc các URL tương đối và chuyển đổi thành URL tuyệt đối nếu cần
+    base_url = base_url or CrawlConfig.BASE_URL
     subpage_urls = []
     for href in href_list:
         href = href.get("value")
         if href.startswith('/'):  
-            subpage_urls.append(BASE_URL + href)
-        elif href.startswith(BASE_URL):  
+            subpage_urls.append(base_url + href)
+        elif href.startswith(base_url):  
             subpage_urls.append(href)
     
     return subpage_urls
 
 
-async def extract_data_from_page(page):
-    """Extract data từ page sau khi đã load hoàn toàn và scroll"""
-
-    logger.info(f"Bắt đầu extract data từ: {page.url}")
-
-    # Chờ page load hoàn toàn và trigger lazy loading
-    await wait_for_content_load(page)
-
-    item = {}
+async def extract_data_from_page(page, allow_reload: bool = True, rate_limiter: Optional[HostRateLimiter] = None,
+                                 known_fingerprint: Optional[str] = None, url: Optional[str] = None):
+    """
+    Extract data từ page sau khi đã load hoàn toàn và scroll.
+    Chỉ reload tối đa 1 lần cho mỗi listing và chỉ khi trang render lỗi (không có .re__main-content).
+    Raise BlockedPageError / ListingNotFoundError nếu trang là trang chặn / tin không còn tồn tại
+    (reload lúc này vô ích), PartialRenderError nếu thiếu trường bắt buộc (item lấy được gắn vào error.item).
+    known_fingerprint: page fingerprint của lần cào trước, trùng thì trả về bản ghi "seen again"
+    ngay khi block thông số xuất hiện (không scroll, không extract đầy đủ).
+    url: subpage URL đã yêu cầu. Tab được dùng lại nên page.url có thể vẫn là tin trước, luôn truyền url khi có
+    """
+    url = url or page.url
 
-    item['title'] = await text_from_selector(page, "h1[class='re__pr-title pr-title js__pr-title']")
-    item['address'] = await text_from_selector(page, "span[class='re__pr-short-description js__pr-address']")
+    logger.info(f"Bắt đầu extract data từ: {url}")
 
-    item['price'] = await extract_value_from_specs(page, "Khoảng giá")
-    item['area'] = await extract_value_from_specs(page, "Diện tích")
+    fingerprint_parts = None
+    if known_fingerprint and CrawlConfig.FINGERPRINT_PRECHECK:
+        with tracer.span("fingerprint", url):
+            if await wait_for_selector(page, "div.re__pr-specs-content-item", CrawlConfig.SPECS_TIMEOUT):
+                fingerprint_parts = await extract_page_fingerprint_parts(page)
+        fingerprint = page_fingerprint(fingerprint_parts)
+        if fingerprint == known_fingerprint:
+            logger.info(f"Tin không đổi (page fingerprint trùng), bỏ qua extract: {url}")
+            return seen_again_item(url, fingerprint_parts, fingerprint)
 
-    item['house_direction'] = await extract_value_from_specs(page, "Hướng nhà")
-    item['balcony_direction'] = await extract_value_from_specs(page, "Hướng ban công")
-    item['facade'] = await extract_value_from_specs(page, "Mặt tiền")
-    item['legal'] = await extract_value_from_specs(page, "Pháp lý")
-    item['furniture'] = await extract_value_from_specs(page, "Nội thất")
-    item['number_bedroom'] = await extract_value_from_specs(page, "Số phòng ngủ")
-    item['number_bathroom'] = await extract_value_from_specs(page, "Số phòng tắm, vệ sinh")
-    item['number_floor'] = await extract_value_from_specs(page, "Số tầng")
-    item['way_in'] = await extract_value_from_specs(page, "Đường vào")
+    # Chờ page load hoàn toàn và trigger lazy loading
+    # Tab có chặn tài nguyên thì chỉ cần scroll tới các trường "needs_scroll"
+    scroll_steps = CrawlConfig.SCROLL_STEPS
+    if getattr(page, "_resource_blocker", None) is not None:
+        scroll_steps = CrawlConfig.SCROLL_STEPS_WITH_BLOCKING
+    readiness = await wait_for_content_load(page, scroll_steps=scroll_steps)
+    page_state = "ok" if readiness["main_content"]["ready"] else await detect_page_state(page)
+    if page_state == BLOCKED:
+        raise BlockedPageError(url, 200)
+    if page_state == NOT_FOUND:
+        raise ListingNotFoundError(url)
+    if page_state != "ok" and allow_reload:
+        logger.warning(f"Trang {url} render lỗi (không có .re__main-content). Reload 1 lần...")
+        tracer.count("reload.render_failed")
+        if rate_limiter is not None:
+            await rate_limiter.acquire(url)
+        with tracer.span("reload", url):
+            await page.reload()
+        fingerprint_parts = None
+        await wait_for_content_load(page, scroll_steps=scroll_steps)
+
+    # Lấy toàn bộ trường trong 1 lần evaluate thay vì mỗi trường 1 round trip
+    with tracer.span("evaluate", url):
+        item = await extract_listing_fields(page, CrawlConfig.LISTING_FIELDS)
+
+    # Trường selector bị rỗng thì lấy lại bằng text_from_selector:
+    # trường bắt buộc được chờ bằng observer, trường optional trả về None ngay nếu trang đã render xong
+    for field_name, spec in CrawlConfig.LISTING_FIELDS.items():
+        if spec.get("type") != "selector" or item.get(field_name):
+            continue
+        if spec.get("required") or spec.get("optional"):
+            with tracer.span("text_from_selector", url):
+                item[field_name] = await text_from_selector(page, spec["selector"], optional=spec.get("optional", False))
 
-    item['project_name'] = await text_from_selector(page, "div[class='re__project-title']")
-    item['project_status'] = await extract_value_from_project_card(page, "re__icon-info-circle--sm")
-    item['project_investor'] = await extract_value_from_project_card(page, "re__icon-office--sm")
-    
-    item['post_id'] = await extract_value_from_post_card(page, "Mã tin")
-    item['post_start_time'] = await extract_value_from_post_card(page, "Ngày đăng")
-    item['post_end_time'] = await extract_value_from_post_card(page, "Ngày hết hạn")
-    item['post_type'] = await extract_value_from_post_card(page, "Loại tin")
-    
     item["source"] = "batdongsan.com.vn"
-    item["url"] = page.url
+    item["url"] = url
     item["crawled_at"] = datetime.now(timezone.utc).isoformat()
-
+    if CrawlConfig.FINGERPRINT_PRECHECK:
+        # Lưu vào seen_index để lần cào sau so sánh
+        if fingerprint_parts is None:
+            fingerprint_parts = await extract_page_fingerprint_parts(page)
+        item["page_fingerprint"] = page_fingerprint(fingerprint_parts)
+
+    missing = [name for name, spec in CrawlConfig.LISTING_FIELDS.items() if spec.get("required") and not item.get(name)]
+    if missing:
+        error = PartialRenderError(f"Thiếu trường bắt buộc {missing} tại {url}", url)
+        error.item = item
+        raise error
     return item
     
 
-async def scrape_subpage(main_page_url: str, url: str, subpage_semaphore: asyncio.Semaphore, browser):
+async def scrape_subpage(main_page_url: str, url: str, subpage_semaphore: AdaptiveLimiter, tab_pool: TabPool,
+                         http_client: Optional[httpx.AsyncClient] = None,
+                         rate_limiter: Optional[HostRateLimiter] = None,
+                         known_fingerprint: Optional[str] = None,
+                         supervisor: Optional[BrowserSupervisor] = None):
     """
-    Hàm xử lý một subpage
+    Hàm xử lý một subpage (1 lần thử): thử HTTP thuần trước (nếu có http_client), không được thì dùng browser
+    (dùng lại tab trong pool thay vì mở tab mới).
+    Lỗi được phân loại (errors.classify_error) và ghi vào item["error"], việc cào lại do run_pipeline quyết định.
+    Tin có page fingerprint trùng known_fingerprint trả về bản ghi "seen again" (item["unchanged"]).
+    Phần dùng browser chạy qua supervisor.guard (nếu có): browser được khởi động lại giữa chừng thì lỗi browser_dead,
+    tab treo quá TAB_HUNG_TIMEOUT thì lỗi navigation_timeout.
+    Token của rate limiter được lấy trước khi chiếm slot của limiter / tab, listing chờ token không giữ slot.
+    Trang chặn chỉ làm rate limiter cooldown cả host, không giảm concurrency (xem concurrency.COOLDOWN_ERRORS).
     """
-    async with subpage_semaphore:  # Giới hạn 10 subpage đồng thời cho mỗi main page
-        logger.info(f"  Đang xử lý subpage: {url}")
-        item: Optional[dict] = None
-        subpage = None
-        try:
-            subpage = await browser.get(url, new_tab=True)
-            try:
-                item = await extract_data_from_page(subpage)
-            except ProtocolException as proto_error:
-                logger.warning(f"ProtocolException tại {url}: {proto_error}. Thử reload...")
+    if rate_limiter is not None:
+        await rate_limiter.acquire(url)
+    queued_at = time.monotonic()
+    async with subpage_semaphore:  # Số subpage đồng thời do AdaptiveLimiter điều chỉnh
+        tracer.observe("limiter.wait", time.monotonic() - queued_at, url)
+        with tracer.span("listing", url):
+            logger.info(f"  Đang xử lý subpage: {url}")
+            item: Optional[dict] = None
+            error_kind: Optional[str] = None
+            subpage = None
+            # Token đã lấy ở trên dành cho request đầu tiên (HTTP, hoặc browser nếu không có HTTP path)
+            has_token = True
+
+            if http_client is not None:
+                has_token = False
                 try:
-                    await subpage.reload()
-                    await asyncio.sleep(5)
-                    item = await extract_data_from_page(subpage)
-                except Exception as retry_error:
-                    logger.warning(f"Reload vẫn lỗi với {url}: {retry_error}")
-                    item = {
-                        "url": url,
-                        "source": "batdongsan.com.vn",
-                        "error": "protocol_exception"
-                    }
-            except Exception as error:
-                logger.warning(f"Lỗi không mong đợi tại {url}: {error}")
-                item = {
-                    "url": url,
-                    "source": "batdongsan.com.vn",
-                    "error": "unexpected_exception"
-                }
-        finally:
-            if subpage:
-                try:
-                    await subpage.close()
-                except Exception as close_error:
-                    logger.debug(f"Không thể đóng subpage {url}: {close_error}")
-
-        if not item:
-            item = {
-                "url": url,
-                "source": "batdongsan.com.vn",
-                "error": "empty_item"
-            }
-
-        item["main_page_url"] = main_page_url
-        logger.info(f"  Đã hoàn thành subpage: {url}")
-        return item
+                    with tracer.span("http.fetch", url):
+                        item = await fetch_listing_http(http_client, url, None, known_fingerprint)
+                except BlockedPageError as blocked:
+                    tracer.count("http.blocked")
+                    # Chỉ bỏ qua HTTP cho listing này: cooldown cả host chỉ khi browser cũng bị chặn, xem bên dưới
+                    logger.info(f"{blocked}, chuyển sang browser")
+                except ListingNotFoundError as not_found:
+                    # Tin không còn tồn tại thì mở browser cũng vô ích
+                    logger.info(f"  {not_found}")
+                    error_kind = NOT_FOUND
+                if item:
+                    tracer.count("http.success")
+                    item["main_page_url"] = main_page_url
+                    logger.info(f"  Đã hoàn thành subpage (HTTP): {url}")
+                    return item
+                if error_kind is None:
+                    tracer.count("http.fallback_to_browser")
+
+            if error_kind is None:
+                async def browse():
+                    page = await tab_pool.navigate(subpage, url)
+                    return await extract_data_from_page(
+                        page, rate_limiter=rate_limiter, known_fingerprint=known_fingerprint, url=url
+                    )
 
-
-async def collect_subpage_urls(browser, main_url: str) -> List[str]:
+                try:
+                    # Fallback sau HTTP cần token mới, lấy trước tab để không giữ tab trong lúc chờ
+                    if not has_token and rate_limiter is not None:
+                        await rate_limiter.acquire(url)
+                    # Chờ tab ngoài guard: listing đang chờ tab (VD: lúc browser được làm mới) không bị hủy
+                    with tracer.span("tab.acquire", url):
+                        subpage = await tab_pool.acquire()
+                    item = await (supervisor.guard(browse()) if supervisor is not None else browse())
+                except Exception as error:
+                    error_kind = classify_error(error)
+                    logger.warning(f"Lỗi {error_kind} tại {url}: {error}")
+                    if error_kind == BLOCKED and rate_limiter is not None:
+                        rate_limiter.cooldown(url, str(error))
+                    # Giữ lại các trường đã lấy được của trang render thiếu
+                    item = getattr(error, "item", None)
+                finally:
+                    # Tab lỗi CDP / timeout / mất kết nối có thể đang ở trạng thái hỏng nên thay tab mới
+                    broken = error_kind in (PROTOCOL, NAVIGATION_TIMEOUT, BROWSER_DEAD, UNEXPECTED)
+                    with tracer.span("tab.release", url):
+                        await tab_pool.release(subpage, discard=broken)
+
+            if error_kind is None and not item:
+                error_kind = PARTIAL_RENDER
+            if error_kind is not None:
+                subpage_semaphore.report_error(error_kind)
+                tracer.count(f"error.{error_kind}")
+                item = {**(item or {}), "source": "batdongsan.com.vn", "error": error_kind}
+
+            # Tab được dùng lại nên lấy url theo request thay vì page.url (có thể chưa cập nhật)
+            item["url"] = url
+            item["main_page_url"] = main_page_url
+            logger.info(f"  Đã hoàn thành subpage: {url}")
+            return item
+
+
+async def collect_subpage_urls(browser, main_url: str, rate_limiter: Optional[HostRateLimiter] = None) -> List[str]:
     """
     Mở main page và thu thập toàn bộ subpage URL
     """
     logger.info(f"Đang thu thập subpage từ main page: {main_url}")
-    page = await browser.get(main_url, new_tab=True)
+    if rate_limiter is not None:
+        await rate_limiter.acquire(main_url)
+    with tracer.span("main.navigate", main_url):
+        page = await browser.get(main_url, new_tab=True)
     try:
-        await apply_stealth_and_wait(page)
-        subpage_urls = await extract_subpage_urls(page)
+        with tracer.span("main.wait", main_url):
+            await apply_stealth_and_wait(page)
+        with tracer.span("main.extract_urls", main_url):
+            # Subpage cùng host với main page
+            parsed = urlparse(main_url)
+            subpage_urls = await extract_subpage_urls(page, f"{parsed.scheme}://{parsed.netloc}")
+        if not subpage_urls and rate_limiter is not None and await detect_page_state(page) == BLOCKED:
+            rate_limiter.cooldown(main_url, f"Blocked page at {main_url}")
         logger.info(f"Tìm thấy {len(subpage_urls)} subpage từ {main_url}")
         return subpage_urls
     except Exception as exc:
@@ -192,100 +365,409 @@ async def collect_subpage_urls(browser, main_url: str) -> List[str]:
         return []
     finally:
         try:
-            await page.close()
+            with tracer.span("main.close", main_url):
+                await page.close()
         except Exception as close_error:
             logger.debug(f"Không thể đóng main page {main_url}: {close_error}")
 
-async def main():
+async def run_pipeline(browser, main_urls: List[str], subpage_semaphore: AdaptiveLimiter,
+                       tab_pool: TabPool, writer: ChunkedCsvWriter, frontier: UrlFrontier,
+                       seen_index: SeenIndex, http_client: Optional[httpx.AsyncClient] = None,
+                       rate_limiter: Optional[HostRateLimiter] = None,
+                       seen_writer: Optional[ChunkedCsvWriter] = None,
+                       walk_shards: Optional[List[str]] = None, walk_start_page: int = 0,
+                       supervisor: Optional[BrowserSupervisor] = None,
+                       on_phase: Optional[Callable[[str], None]] = None,
+                       base_url: Optional[str] = None) -> int:
+    """
+    Producer/consumer: main page được thu thập song song (giới hạn MAIN_PAGE_CONCURRENCY),
+    subpage URL được đẩy vào hàng đợi có giới hạn ngay khi tìm thấy, và các worker cào subpage
+    lấy từ hàng đợi trong lúc việc thu thập main page vẫn đang chạy.
+    Kết quả từng subpage được ghi ngay ra CSV qua writer, không giữ lại trong bộ nhớ.
+    Trạng thái được ghi vào frontier: main page/subpage đã xong sẽ không làm lại khi resume.
+    Tin đã cào gần đây (theo seen_index) được bỏ qua, không mở browser.
+    Tin có page fingerprint không đổi chỉ được ghi 1 dòng "seen again" qua seen_writer (nếu có).
+    walk_shards: thay vì main_urls cố định, đi lần lượt trang walk_start_page, walk_start_page + 1, ...
+    của từng danh sách tin và dừng khi phần lớn tin của 1 trang đã được cào gần đây (KNOWN_FRACTION_STOP).
+    supervisor: browser chết giữa chừng thì được khởi động lại, listing/main page đang dở được làm lại ngay
+    (không tính vào lượt retry); không có supervisor thì dùng `browser` cố định.
+    on_phase(name) (nếu có) được gọi khi chuyển pha (thu thập xong main page, bắt đầu cào lại listing lỗi).
+    base_url: host của các trang walk_shards (mặc định CrawlConfig.BASE_URL).
+    Subpage lỗi còn lượt retry (CrawlConfig.RETRY_POLICY) được đưa vào hàng đợi retry và cào lại
+    sau backoff ở cuối lần chạy; chỉ kết quả cuối cùng được ghi ra CSV.
+    """
+    subpage_queue: asyncio.Queue = asyncio.Queue(maxsize=CrawlConfig.SUBPAGE_QUEUE_SIZE)
+    main_page_semaphore = asyncio.Semaphore(CrawlConfig.MAIN_PAGE_CONCURRENCY)
+    # Đủ worker để limiter có thể tăng tới max_limit, limiter quyết định bao nhiêu worker thực sự chạy
+    worker_count = subpage_semaphore.max_limit
+    scraped_count = 0
+    skipped_count = 0
+    unchanged_count = 0
+    # (thời điểm được cào lại, main_page_url, subpage_url, lần thử)
+    deferred: List[Tuple[float, str, str, int]] = []
+
+    async def collect(main_url: str) -> List[str]:
+        if supervisor is None:
+            return await collect_subpage_urls(browser, main_url, rate_limiter)
+        while True:
+            generation = supervisor.generation
+            try:
+                subpage_urls = await supervisor.guard(collect_subpage_urls(supervisor.browser, main_url, rate_limiter))
+            except (BrowserDeadError, asyncio.TimeoutError) as error:
+                logger.warning(f"Thu thập main page {main_url} bị gián đoạn: {error}")
+                subpage_urls = []
+            # Trang rỗng có thể do browser chết: khởi động lại được thì thu thập lại
+            if subpage_urls or not await supervisor.recover(generation, f"main page {main_url}"):
+                return subpage_urls
+
+    async def discover(main_url: str) -> Optional[Tuple[int, int]]:
+        """Thu thập 1 main page, trả về (số subpage, số subpage đã có trong seen_index) hoặc None nếu đã làm"""
+        if frontier.is_main_page_done(main_url):
+            logger.info(f"Bỏ qua main page đã thu thập ở lần chạy trước: {main_url}")
+            return None
+        async with main_page_semaphore:
+            subpage_urls = await collect(main_url)
+        if not subpage_urls:
+            logger.info(f"Không tìm thấy subpage nào cho {main_url}")
+            return 0, 0
+        # Không xét freshness: SEEN_FRESHNESS_HOURS = 0 (mặc định) vẫn phải dừng dò trang được
+        known = sum(1 for subpage_url in subpage_urls if seen_index.is_known(subpage_url))
+        # Subpage đã có trong frontier (đã xong hoặc đang chờ từ lần trước) thì không đẩy lại
+        new_urls = frontier.add_subpages(main_url, subpage_urls)
+        frontier.mark_main_page_done(main_url)
+        for subpage_url in new_urls:
+            await subpage_queue.put((main_url, subpage_url))
+        return len(subpage_urls), known
+
+    async def walk(shard: str):
+        """Đi lần lượt các trang của 1 danh sách tin tới khi gặp trang toàn tin đã biết / hết trang / MAX_PAGES"""
+        for page in range(walk_start_page, walk_start_page + CrawlConfig.MAX_PAGES):
+            main_url = main_page_url(shard, page, base_url)
+            if frontier.main_page_state(main_url) == UrlFrontier.LAST:
+                logger.info(f"Lần chạy trước đã dừng dò trang ở {main_url}")
+                return
+            stats = await discover(main_url)
+            if stats is None:
+                continue
+            found, known = stats
+            if not found:
+                logger.info(f"Dừng dò trang {shard}: {main_url} không có tin")
+                return
+            if known / found >= CrawlConfig.KNOWN_FRACTION_STOP:
+                frontier.mark_main_page_done(main_url, last=True)
+                tracer.count("pagination.early_stop")
+                logger.info(f"Dừng dò trang {shard} ở {main_url}: {known}/{found} tin đã cào trước đó")
+                return
+        logger.warning(f"Dừng dò trang {shard}: đã đủ MAX_PAGES={CrawlConfig.MAX_PAGES} trang")
+
+    async def producer():
+        try:
+            # Subpage còn dở từ lần chạy trước (chỉ có khi --resume) được cào trước.
+            # Frontier dùng chung giữa các worker nên chỉ lấy subpage của main page thuộc phần việc của worker này
+            if walk_shards:
+                owned = [
+                    main_page_url(shard, page, base_url) for shard in walk_shards
+                    for page in range(walk_start_page, walk_start_page + CrawlConfig.MAX_PAGES)
+                ]
+            else:
+                owned = main_urls
+            for ref in frontier.unfinished_subpages(owned):
+                await subpage_queue.put(ref)
+            if walk_shards:
+                walked = await asyncio.gather(*(walk(shard) for shard in walk_shards), return_exceptions=True)
+                for shard, outcome in zip(walk_shards, walked):
+                    if isinstance(outcome, Exception):
+                        logger.warning(f"Dò trang {shard} lỗi: {outcome}")
+            else:
+                discovered = await asyncio.gather(*(discover(url) for url in main_urls), return_exceptions=True)
+                for main_url, outcome in zip(main_urls, discovered):
+                    if isinstance(outcome, Exception):
+                        logger.warning(f"Thu thập main page {main_url} lỗi: {outcome}")
+        finally:
+            if on_phase is not None:
+                on_phase("discover.done")
+            # Mỗi worker nhận 1 tín hiệu dừng sau khi toàn bộ main page đã được thu thập
+            for _ in range(worker_count):
+                await subpage_queue.put(None)
+
+    async def consumer():
+        nonlocal scraped_count, skipped_count
+        while True:
+            ref = await subpage_queue.get()
+            if ref is None:
+                break
+            main_url, subpage_url = ref
+            if seen_index.is_fresh(subpage_url):
+                logger.debug(f"  Bỏ qua subpage vừa cào gần đây: {subpage_url}")
+                frontier.mark_done(subpage_url)
+                skipped_count += 1
+                continue
+            await process(main_url, subpage_url, attempt=1)
+
+    async def process(main_url: str, subpage_url: str, attempt: int):
+        nonlocal scraped_count, unchanged_count
+        known_fingerprint = seen_index.get_page_fingerprint(subpage_url) if seen_writer is not None else None
+        generation = supervisor.generation if supervisor is not None else 0
+        try:
+            item = await scrape_subpage(
+                main_url, subpage_url, subpage_semaphore, tab_pool, http_client, rate_limiter, known_fingerprint,
+                supervisor,
+            )
+        except Exception as error:
+            logger.warning(f"Subpage task exception: {error}")
+            return
+        error_kind = item.get("error")
+        if (error_kind in (BROWSER_DEAD, PROTOCOL, NAVIGATION_TIMEOUT) and supervisor is not None
+                and await supervisor.recover(generation, f"{error_kind} at {subpage_url}")):
+            # Listing đang dở khi browser chết: làm lại ngay với browser mới, không tính vào lượt retry
+            logger.info(f"  Cào lại {subpage_url} sau khi khởi động lại browser")
+            tracer.count("browser.requeued")
+            await process(main_url, subpage_url, attempt)
+            return
+        if item.get("unchanged"):
+            seen_writer.write(main_url, item)
+            frontier.mark_done(subpage_url)
+            seen_index.touch(subpage_url, item["seen_at"])
+            tracer.count("listing.unchanged")
+            unchanged_count += 1
+            return
+        if not error_kind:
+            writer.write(main_url, item)
+            frontier.mark_done(subpage_url)
+            seen_index.record(item, page_fingerprint=item.get("page_fingerprint"))
+            scraped_count += 1
+            return
+        if attempt <= retry_budget(error_kind):
+            delay = retry_delay(error_kind, attempt)
+            logger.info(f"  Cào lại {subpage_url} ({error_kind}) sau {delay:.1f}s, lần thử {attempt + 1}")
+            tracer.count(f"retry.{error_kind}")
+            frontier.mark_failed(subpage_url, error_kind)
+            deferred.append((time.monotonic() + delay, main_url, subpage_url, attempt + 1))
+            return
+        # Hết lượt retry (hoặc lỗi vĩnh viễn): ghi kết quả cuối cùng
+        writer.write(main_url, item)
+        frontier.mark_failed(subpage_url, error_kind, permanent=error_kind == NOT_FOUND)
+        scraped_count += 1
+
+    async def retry_deferred():
+        """Cào lại các subpage lỗi theo thứ tự đến hạn, lần cào lại lỗi tiếp sẽ được đưa vào vòng sau"""
+        async def retry(due: float, main_url: str, subpage_url: str, attempt: int):
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            await process(main_url, subpage_url, attempt)
+
+        while deferred:
+            if on_phase is not None:
+                on_phase("retry")
+            batch = sorted(deferred)
+            deferred.clear()
+            logger.info(f"Cào lại {len(batch)} subpage lỗi")
+            await asyncio.gather(*(retry(*entry) for entry in batch))
+
+    await asyncio.gather(producer(), *(consumer() for _ in range(worker_count)))
+    await retry_deferred()
+    if skipped_count:
+        hours = seen_index.freshness.total_seconds() / 3600
+        logger.info(f"Bỏ qua {skipped_count} subpage đã cào trong {hours:g} giờ gần đây")
+    if unchanged_count:
+        logger.info(f"{unchanged_count} subpage không đổi so với lần cào trước, chỉ ghi vào {seen_writer.output_dir}")
+    return scraped_count
+
+
+async def main(start_page: Optional[int] = None, end_page: Optional[int] = None,
+               output_dir: Optional[str] = None, resume: bool = False,
+               state_dir: Optional[str] = None, report_dir: Optional[str] = None,
+               seen_dir: Optional[str] = None, shards: Optional[List[str]] = None,
+               run_label: Optional[str] = None, frontier_label: Optional[str] = None,
+               base_url: Optional[str] = None, http_first: Optional[bool] = None,
+               auto_pagination: Optional[bool] = None, seen_freshness_hours: Optional[float] = None,
+               block_resources: Optional[bool] = None,
+               subpage_semaphore: Optional[AdaptiveLimiter] = None,
+               rate_limiter: Optional[HostRateLimiter] = None):
     """
     Hàm chính để chạy toàn bộ quá trình cào dữ liệu
+    start_page/end_page mặc định lấy từ CrawlConfig; output_dir mặc định là data/raw
+    shards: danh sách tin cần đi (mặc định CrawlConfig.LISTING_SHARDS). Khi AUTO_PAGINATION = True
+    mỗi danh sách được dò từ start_page tới khi gặp trang toàn tin đã biết, end_page bị bỏ qua
+    run_label: tên lần chạy dùng cho file report/seen (mặc định p<start>-<end> hoặc auto)
+    frontier_label: tên file frontier (mặc định run_label). Worker của run_sharded dùng chung frontier
+    của cả đoạn trang nên resume được với số worker khác
+    resume=True: dùng lại frontier của lần chạy trước, bỏ qua main page/subpage đã xong
+    state_dir (frontier, seen index) mặc định là data/state; report_dir mặc định là data/raw/reports
+    seen_dir (dòng "seen again" của tin không đổi) mặc định là data/seen
+    base_url, http_first, auto_pagination, seen_freshness_hours, block_resources, subpage_semaphore, rate_limiter:
+    thay cho giá trị trong CrawlConfig cho riêng lần chạy này (VD: benchmark), None thì dùng CrawlConfig
     """
     logger.info("Bắt đầu quá trình cào dữ liệu")
-
-    subpage_semaphore = get_subpage_semaphore()
-
-    start_page = CrawlConfig.START_PAGE
-    end_page = CrawlConfig.END_PAGE
-
-    main_urls = [f"{BASE_URL}{START}p{i}" for i in range(start_page, end_page + 1)]
-    if not main_urls:
-        logger.warning("Không có main page nào để xử lý")
-        return []
-
-    logger.info(f"Đang xử lý {len(main_urls)} main page: {main_urls}")
-
-    browser = await start_browser()
-    main_page_results = {url: [] for url in main_urls}
+    tracer.reset()
+
+    base_url = base_url or CrawlConfig.BASE_URL
+    http_first = CrawlConfig.HTTP_FIRST if http_first is None else http_first
+    auto_pagination = CrawlConfig.AUTO_PAGINATION if auto_pagination is None else auto_pagination
+    if seen_freshness_hours is None:
+        seen_freshness_hours = CrawlConfig.SEEN_FRESHNESS_HOURS
+
+    subpage_semaphore = subpage_semaphore or get_subpage_semaphore()
+    # Mọi request tới website (main page, subpage, HTTP fetch) đi qua cùng 1 rate limiter
+    rate_limiter = rate_limiter or get_rate_limiter()
+    # Thời gian chờ token không tính vào latency mà limiter dùng để tăng/giảm concurrency
+    rate_limiter.on_wait = subpage_semaphore.exclude_wait
+
+    start_page = CrawlConfig.START_PAGE if start_page is None else start_page
+    end_page = CrawlConfig.END_PAGE if end_page is None else end_page
+
+    shards = shards or CrawlConfig.LISTING_SHARDS
+    if auto_pagination:
+        main_urls = []
+        run_label = run_label or "auto"
+        logger.info(f"Dò trang từ p{start_page} cho {len(shards)} danh sách tin: {shards}")
+    else:
+        main_urls = [main_page_url(shard, i, base_url) for shard in shards for i in range(start_page, end_page + 1)]
+        run_label = run_label or f"p{start_page}-{end_page}"
+        if not main_urls:
+            logger.warning("Không có main page nào để xử lý")
+            return {"subpage_count": 0}
+        logger.info(f"Đang xử lý {len(main_urls)} main page: {main_urls}")
+
+    state_dir = Path(state_dir) if state_dir else STATE_DIR
+    frontier = UrlFrontier(state_dir / f"frontier_{frontier_label or run_label}.sqlite", reset=not resume)
+    if resume:
+        logger.info(f"Resume từ frontier {frontier.db_path}: {frontier.stats()}")
+    seen_index = SeenIndex(state_dir / "seen_listings.sqlite", freshness_hours=seen_freshness_hours)
+
+    # Chrome chết giữa chừng thì supervisor khởi động lại, luôn lấy browser hiện tại qua supervisor.browser
+    supervisor = BrowserSupervisor(start_browser)
+    browser = await supervisor.start()
+    subpage_semaphore.set_rss_probe(lambda: get_process_tree_rss(getattr(supervisor.browser, "_process_pid", None)))
+    # Tab được tạo lazy nên pool có thể lớn bằng max_limit mà không tốn tài nguyên khi limit thấp
+    resource_blocker = create_resource_blocker(block_resources)
+    tab_pool = TabPool(
+        browser, size=subpage_semaphore.max_limit, resource_blocker=resource_blocker
+    )
+    supervisor.tab_pool = tab_pool
+    watch_task = asyncio.create_task(supervisor.watch())
+    memory_watchdog = None
+    memory_task = None
+    if CrawlConfig.MEMORY_WATCHDOG:
+        memory_watchdog = MemoryWatchdog(supervisor, tab_pool)
+        memory_watchdog.log_phase("start")
+        memory_task = asyncio.create_task(memory_watchdog.run())
+    writer = ChunkedCsvWriter(output_dir=output_dir, chunk_size=CrawlConfig.SUBPAGE_CHUNK_SIZE)
+    seen_writer = None
+    if CrawlConfig.FINGERPRINT_PRECHECK:
+        # Prefix theo tên lần chạy để các worker (--workers) ghi chung data/seen không đụng file của nhau
+        seen_writer = ChunkedCsvWriter(
+            output_dir=seen_dir or SEEN_DATA_DIR,
+            chunk_size=CrawlConfig.SUBPAGE_CHUNK_SIZE,
+            fieldnames=SEEN_AGAIN_FIELDNAMES,
+            file_prefix=f"batdongsan_seen_{run_label}",
+        )
+    if memory_watchdog is not None:
+        # Làm mới browser (nếu RAM cao) giữa 2 chunk CSV
+        writer.on_chunk = memory_watchdog.on_chunk
+    http_client = create_http_client() if http_first else None
     try:
-        all_subpage_refs: List[Tuple[str, str]] = []
-        for url in main_urls:
-            subpage_urls = await collect_subpage_urls(browser, url)
-            if not subpage_urls:
-                logger.info(f"Không tìm thấy subpage nào cho {url}")
-            for subpage_url in subpage_urls:
-                all_subpage_refs.append((url, subpage_url))
+        scraped_count = await run_pipeline(
+            browser, main_urls, subpage_semaphore, tab_pool, writer, frontier, seen_index, http_client, rate_limiter,
+            seen_writer, shards if auto_pagination else None, start_page, supervisor,
+            memory_watchdog.log_phase if memory_watchdog is not None else None, base_url,
+        )
 
-        logger.info(f"Tổng cộng {len(all_subpage_refs)} subpage sẽ được xử lý")
+        # Hết việc thì không cần làm mới browser khi đóng chunk cuối
+        writer.on_chunk = None
+        writer.close()
 
-        if not all_subpage_refs:
+        if not scraped_count:
             logger.warning("Không tìm thấy subpage nào để cào.")
-            final_payload = build_main_page_payload(main_page_results)
-            return final_payload
-
-        subpage_tasks = [
-            scrape_subpage(main_url, sub_url, subpage_semaphore, browser)
-            for main_url, sub_url in all_subpage_refs
-        ]
-
-        subpage_results_raw = await asyncio.gather(*subpage_tasks, return_exceptions=True)
-        chunk_enabled = len(all_subpage_refs) > CrawlConfig.SUBPAGE_CHUNK_SIZE
-        chunk_buffer = defaultdict(list)
-        chunk_counter = 0
-        chunk_index = 1
-
-        def flush_chunk():
-            nonlocal chunk_index
-            if not chunk_buffer:
-                return
-            subpage_in_chunk = sum(len(items) for items in chunk_buffer.values())
-            payload_chunk = build_main_page_payload(chunk_buffer)
-            save_results_to_csv(payload_chunk, suffix=f"_chunk_{chunk_index:02d}")
+        logger.info(f"Đã hoàn thành cào {scraped_count} subpage, ghi ra {len(writer.finalized_files)} file")
+        logger.info(f"Trạng thái frontier: {frontier.stats()}")
+        limiter_metrics = subpage_semaphore.metrics()
+        logger.info(
+            "Concurrency cuối: %s (tăng %s lần, giảm %s lần, %s/%s listing lỗi)",
+            limiter_metrics["limit"],
+            limiter_metrics["increase"],
+            limiter_metrics["decrease"],
+            limiter_metrics["errors"],
+            limiter_metrics["completed"],
+        )
+        for host, bucket_metrics in rate_limiter.metrics().items():
             logger.info(
-                "Đã lưu chunk %s với %s subpage",
-                chunk_index,
-                subpage_in_chunk,
+                "Rate limit %s: %s request, chờ tổng %ss, %s lần cooldown",
+                host,
+                bucket_metrics["acquired"],
+                bucket_metrics["waited_seconds"],
+                bucket_metrics["cooldowns"],
             )
-            chunk_buffer.clear()
-            chunk_index += 1
-
-        for result in subpage_results_raw:
-            if isinstance(result, Exception):
-                logger.warning(f"Subpage task exception: {result}")
-            else:
-                parent_url = result.get("main_page_url")
-                if parent_url in main_page_results:
-                    main_page_results[parent_url].append(result)
-                    if chunk_enabled:
-                        chunk_buffer[parent_url].append(result)
-                        chunk_counter += 1
-                        if chunk_counter % CrawlConfig.SUBPAGE_CHUNK_SIZE == 0:
-                            flush_chunk()
-                else:
-                    logger.debug(f"Không tìm thấy main_page_url cho subpage: {result}")
-
-        if chunk_enabled and chunk_buffer:
-            flush_chunk()
-
-        final_payload = build_main_page_payload(main_page_results)
-        save_results_to_csv(final_payload)
-        logger.info("Đã hoàn thành cào dữ liệu với mô hình batch subpage")
-        return final_payload
+        if resource_blocker is not None:
+            logger.info(f"Tài nguyên bị chặn: {resource_blocker.metrics()}")
+        if supervisor.restarts:
+            logger.warning(f"Browser đã được khởi động lại {supervisor.restarts} lần")
+        if memory_watchdog is not None:
+            memory_watchdog.log_phase("end")
+            logger.info(
+                "RSS Chrome cao nhất %sMB, %s lần ngừng mở tab, %s lần làm mới browser",
+                round(memory_watchdog.peak_mb), memory_watchdog.counters["throttled"], memory_watchdog.counters["recycles"],
+            )
+        for phase, stats in tracer.summary().items():
+            logger.info(
+                "Pha %s: %s lần, p50=%ss p95=%ss p99=%ss",
+                phase, stats["count"], stats["p50"], stats["p95"], stats["p99"],
+            )
+        return {"subpage_count": scraped_count, "files": [str(path) for path in writer.finalized_files]}
     finally:
+        # Đóng writer để chuyển chunk cuối (dở dang) vào output_dir kể cả khi có lỗi
+        writer.on_chunk = None
+        writer.close()
+        if seen_writer is not None:
+            seen_writer.close()
         try:
-            await browser.stop()
-        except Exception as stop_error:
-            logger.debug(f"Browser stop error: {stop_error}")
+            tracer.write_report(
+                report_dir,
+                run_name=run_label,
+                extra={
+                    "start_page": start_page,
+                    "end_page": None if auto_pagination else end_page,
+                    "shards": shards,
+                    "rows_written": writer.total_rows,
+                    "rows_unchanged": seen_writer.total_rows if seen_writer is not None else 0,
+                    "files": [str(path) for path in writer.finalized_files],
+                    "frontier": frontier.stats(),
+                    "concurrency": subpage_semaphore.metrics(),
+                    "rate_limit": rate_limiter.metrics(),
+                    "resource_blocking": resource_blocker.metrics() if resource_blocker is not None else None,
+                    "browser": supervisor.metrics(),
+                    "memory": memory_watchdog.metrics() if memory_watchdog is not None else None,
+                },
+            )
+        except Exception as report_error:
+            logger.warning(f"Không ghi được report thời gian crawl: {report_error}")
+        frontier.close()
+        seen_index.close()
+        if http_client is not None:
+            await http_client.aclose()
+        watch_task.cancel()
+        if memory_watchdog is not None:
+            memory_task.cancel()
+            await memory_watchdog.stop()
+        await tab_pool.close()
+        await supervisor.stop()
 
 
 if __name__ == "__main__":
-    results = uc.loop().run_until_complete(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Cào dữ liệu batdongsan.com.vn")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=CrawlConfig.CRAWL_WORKERS,
+        help="Số process cào song song, mỗi process có browser riêng (mặc định CrawlConfig.CRAWL_WORKERS)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Tiếp tục lần crawl bị dừng giữa chừng, bỏ qua các subpage đã cào xong",
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        run_sharded(args.workers, CrawlConfig.START_PAGE, CrawlConfig.END_PAGE, resume=args.resume)
+    else:
+        results = uc.loop().run_until_complete(main(resume=args.resume))
\ No newline at end of file
@@ -0,0 +1,88 @@
+import asyncio
+import random
+from typing import Optional
+
+from nodriver.core.connection import ProtocolException
+from websockets.exceptions import ConnectionClosed
+
+from config import CrawlConfig
+
+# Phân loại lỗi khi cào 1 listing (giá trị được ghi vào cột error của frontier / item["error"])
+NAVIGATION_TIMEOUT = "navigation_timeout"  # trang không tải xong trong thời gian cho phép
+BLOCKED = "blocked"                        # trang chặn / challenge / HTTP 429
+NOT_FOUND = "not_found"                    # tin hết hạn / bị gỡ (404, 410), lỗi vĩnh viễn
+PARTIAL_RENDER = "partial_render"          # trang render nhưng thiếu trường bắt buộc
+PROTOCOL = "protocol_exception"            # lỗi CDP (ProtocolException)
+BROWSER_DEAD = "browser_dead"              # mất kết nối tới Chrome
+UNEXPECTED = "unexpected_exception"
+
+ERROR_CLASSES = (NAVIGATION_TIMEOUT, BLOCKED, NOT_FOUND, PARTIAL_RENDER, PROTOCOL, BROWSER_DEAD, UNEXPECTED)
+
+
+class ScrapeError(Exception):
+    """Lỗi đã phân loại khi cào 1 listing"""
+
+    kind = UNEXPECTED
+
+    def __init__(self, message: str = "", url: Optional[str] = None, kind: Optional[str] = None):
+        super().__init__(message or f"{kind or self.kind} at {url}")
+        self.url = url
+        if kind:
+            self.kind = kind
+
+
+class BlockedPageError(ScrapeError):
+    """Website trả về trang chặn / challenge (Cloudflare, 429, ...)"""
+
+    kind = BLOCKED
+
+    def __init__(self, url: str, status_code: int):
+        super().__init__(f"Blocked page ({status_code}) at {url}", url)
+        self.status_code = status_code
+
+
+class ListingNotFoundError(ScrapeError):
+    """Tin không còn tồn tại (hết hạn / bị gỡ), không cần cào lại"""
+
+    kind = NOT_FOUND
+
+    def __init__(self, url: str, status_code: Optional[int] = None):
+        super().__init__(f"Listing not found ({status_code or 'page'}) at {url}", url)
+        self.status_code = status_code
+
+
+class BrowserDeadError(ScrapeError):
+    """Browser chết hoặc được khởi động lại khi đang xử lý listing"""
+
+    kind = BROWSER_DEAD
+
+
+class PartialRenderError(ScrapeError):
+    """Trang render không đủ (thiếu trường bắt buộc)"""
+
+    kind = PARTIAL_RENDER
+
+
+def classify_error(error: BaseException) -> str:
+    """Quy 1 exception về 1 trong ERROR_CLASSES"""
+    if isinstance(error, ScrapeError):
+        return error.kind
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return NAVIGATION_TIMEOUT
+    if isinstance(error, (ConnectionClosed, ConnectionError, EOFError)):
+        return BROWSER_DEAD
+    if isinstance(error, ProtocolException):
+        return PROTOCOL
+    return UNEXPECTED
+
+
+def retry_budget(kind: str) -> int:
+    """Số lần được cào lại với loại lỗi `kind` (không tính lần đầu)"""
+    return CrawlConfig.RETRY_POLICY.get(kind, {}).get("retries", 0)
+
+
+def retry_delay(kind: str, attempt: int) -> float:
+    """Backoff cho lần thử thứ `attempt` (tính từ 1): backoff * 2^(attempt-1), thêm jitter 10%"""
+    backoff = CrawlConfig.RETRY_POLICY.get(kind, {}).get("backoff", 0.0)
+    delay = min(CrawlConfig.RETRY_BACKOFF_MAX, backoff * (2 ** max(attempt - 1, 0)))
+    return delay * random.uniform(0.9, 1.1)
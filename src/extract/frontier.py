@@ -0,0 +1,130 @@
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class UrlFrontier:
+    """
+    Lưu trạng thái crawl xuống SQLite để chạy lại (--resume) chỉ tốn phần việc còn lại.
+    - main_pages: main page đã thu thập xong subpage URL hay chưa
+    - subpages: trạng thái từng subpage (pending / done / failed / gone + lỗi)
+    gone: lỗi vĩnh viễn (tin hết hạn / bị gỡ), không cào lại khi resume
+    main page "last": trang đã thu thập xong và là điểm dừng của lần dò trang (AUTO_PAGINATION)
+    Các worker (--workers) dùng chung 1 file theo đoạn trang của cả lần chạy, nên resume với số worker khác vẫn
+    bỏ qua được phần đã xong
+    """
+
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    GONE = "gone"
+    LAST = "last"
+
+    def __init__(self, db_path=None, reset: bool = False):
+        self.db_path = Path(db_path) if db_path else STATE_DIR / "frontier.sqlite"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # timeout lớn vì các worker (--workers) dùng chung 1 file
+        self.conn = sqlite3.connect(self.db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS main_pages (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS subpages (
+                url TEXT PRIMARY KEY,
+                main_page_url TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_subpages_state ON subpages(state);
+            """
+        )
+        if reset:
+            self.reset()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def reset(self) -> None:
+        """Xóa trạng thái cũ để bắt đầu 1 lần crawl mới"""
+        with self.conn:
+            self.conn.execute("DELETE FROM main_pages")
+            self.conn.execute("DELETE FROM subpages")
+
+    def main_page_state(self, url: str) -> Optional[str]:
+        row = self.conn.execute("SELECT state FROM main_pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def is_main_page_done(self, url: str) -> bool:
+        return self.main_page_state(url) in (self.DONE, self.LAST)
+
+    def mark_main_page_done(self, url: str, last: bool = False) -> None:
+        """last=True: lần dò trang dừng ở trang này, resume không đi tiếp các trang sau"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO main_pages (url, state, updated_at) VALUES (?, ?, ?)",
+                (url, self.LAST if last else self.DONE, self._now()),
+            )
+
+    def add_subpages(self, main_page_url: str, urls: List[str]) -> List[str]:
+        """Ghi nhận subpage URL mới tìm thấy, trả về các URL chưa từng có trong frontier"""
+        new_urls = []
+        now = self._now()
+        with self.conn:
+            for url in urls:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO subpages (url, main_page_url, state, updated_at) VALUES (?, ?, ?, ?)",
+                    (url, main_page_url, self.PENDING, now),
+                )
+                if cursor.rowcount:
+                    new_urls.append(url)
+        return new_urls
+
+    def unfinished_subpages(self, main_page_urls: Optional[Iterable[str]] = None) -> List[Tuple[str, str]]:
+        """
+        Các subpage (main_page_url, url) còn pending hoặc failed từ lần chạy trước
+        main_page_urls: chỉ lấy subpage của các main page này (phần việc của 1 worker)
+        """
+        rows = self.conn.execute(
+            "SELECT main_page_url, url FROM subpages WHERE state NOT IN (?, ?) ORDER BY rowid",
+            (self.DONE, self.GONE),
+        ).fetchall()
+        if main_page_urls is not None:
+            owned = set(main_page_urls)
+            rows = [row for row in rows if row[0] in owned]
+        return [(main_page_url, url) for main_page_url, url in rows]
+
+    def mark_done(self, url: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE subpages SET state = ?, error = NULL, attempts = attempts + 1, updated_at = ? WHERE url = ?",
+                (self.DONE, self._now(), url),
+            )
+
+    def mark_failed(self, url: str, error: str, permanent: bool = False) -> None:
+        """permanent=True: lỗi vĩnh viễn (VD: not_found), subpage không được cào lại khi resume"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE subpages SET state = ?, error = ?, attempts = attempts + 1, updated_at = ? WHERE url = ?",
+                (self.GONE if permanent else self.FAILED, error, self._now(), url),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM subpages GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self) -> None:
+        self.conn.close()
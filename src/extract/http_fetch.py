@@ -0,0 +1,336 @@
+import logging
+import re
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+import httpx
+
+from config import CrawlConfig
+from errors import BlockedPageError, ListingNotFoundError
+from seen_index import page_fingerprint, seen_again_item
+
+logger = logging.getLogger(__name__)
+
+# Thẻ không có thẻ đóng trong HTML
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+# Dấu hiệu trang chặn bot / challenge (Cloudflare, ...)
+CHALLENGE_MARKERS = (
+    "cf-browser-verification",
+    "challenge-platform",
+    "cf_chl_",
+    "just a moment...",
+    "attention required! | cloudflare",
+)
+
+# Dấu hiệu tin đã hết hạn / bị gỡ (trang vẫn trả về nhưng không còn nội dung tin)
+NOT_FOUND_MARKERS = (
+    "không tìm thấy trang",
+    "trang bạn tìm kiếm không tồn tại",
+    "tin đăng không tồn tại",
+    "tin đăng đã hết hạn",
+    "tin đăng đã bị gỡ",
+)
+
+SELECTOR_PATTERN = re.compile(
+    r"^(?P<tag>[a-zA-Z0-9]*)"
+    r"(?P<classes>(?:\.[\w-]+)*)"
+    r"(?P<attrs>(?:\[[\w-]+=(?:'[^']*'|\"[^\"]*\")\])*)$"
+)
+ATTR_PATTERN = re.compile(r"\[([\w-]+)=(?:'([^']*)'|\"([^\"]*)\")\]")
+
+
+class Node:
+    """Nút DOM tối giản đủ cho các selector trong CrawlConfig.LISTING_FIELDS"""
+
+    __slots__ = ("tag", "attrs", "children", "parent", "classes")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Node"] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List = []
+        self.parent = parent
+        self.classes = set((attrs.get("class") or "").split())
+
+    def text(self) -> str:
+        """Tương đương textContent của DOM"""
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            else:
+                stack.extend(reversed(node.children))
+        return "".join(parts)
+
+    def iter(self):
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Node):
+                yield node
+                stack.extend(reversed(node.children))
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", {})
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, {name: value or "" for name, value in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        node = Node(tag, {name: value or "" for name, value in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+
+    def handle_endtag(self, tag):
+        # HTML thực tế hay thiếu thẻ đóng: đóng tới thẻ mở gần nhất cùng tên, không có thì bỏ qua
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def parse_html(html: str) -> Node:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _compile_selector(selector: str):
+    match = SELECTOR_PATTERN.match(selector.strip())
+    if not match:
+        raise ValueError(f"Selector '{selector}' không được hỗ trợ ở HTTP path")
+    tag = match.group("tag").lower()
+    classes = set(filter(None, match.group("classes").split(".")))
+    attrs = {name: single if single is not None else double
+             for name, single, double in ATTR_PATTERN.findall(match.group("attrs"))}
+
+    def matches(node: Node) -> bool:
+        if tag and node.tag != tag:
+            return False
+        if classes and not classes <= node.classes:
+            return False
+        return all(node.attrs.get(name) == value for name, value in attrs.items())
+
+    return matches
+
+
+def select_all(root: Node, selector: str) -> List[Node]:
+    """Hỗ trợ selector đơn dạng tag, .class, tag.a.b, tag[attr='value'] (không hỗ trợ combinator)"""
+    matches = _compile_selector(selector)
+    return [node for node in root.iter() if matches(node)]
+
+
+def select_one(root: Node, selector: str) -> Optional[Node]:
+    matches = _compile_selector(selector)
+    return next((node for node in root.iter() if matches(node)), None)
+
+
+def _clean(node: Optional[Node]) -> Optional[str]:
+    if node is None:
+        return None
+    return node.text().strip() or None
+
+
+def _normalized_text(node: Optional[Node]) -> str:
+    return " ".join(node.text().split()) if node is not None else ""
+
+
+def page_fingerprint_parts(root: Node, field_names: List[str] = CrawlConfig.PAGE_FINGERPRINT_FIELDS) -> Optional[Dict[str, str]]:
+    """Bản Python của utils.PAGE_FINGERPRINT_JS (cùng label, cùng cách chuẩn hóa whitespace)"""
+    specs_block = select_one(root, "div.re__pr-specs-content")
+    if specs_block is None:
+        return None
+    blocks = {
+        "specs": [
+            (_normalized_text(select_one(item, "span.re__pr-specs-content-item-title")).lower(),
+             _normalized_text(select_one(item, "span.re__pr-specs-content-item-value")))
+            for item in select_all(root, "div.re__pr-specs-content-item")
+        ],
+        "post_card": [
+            (_normalized_text(select_one(item, "span.title")).lower(), _normalized_text(select_one(item, "span.value")))
+            for item in select_all(root, "div.re__pr-short-info-item.js__pr-config-item")
+        ],
+    }
+    parts = {}
+    for name in field_names:
+        spec = CrawlConfig.LISTING_FIELDS[name]
+        needle = spec["label"].lower()
+        parts[name] = next(
+            (value for title, value in blocks.get(spec["type"], []) if needle in title and value), ""
+        )
+    parts["specs_text"] = _normalized_text(specs_block)
+    return parts
+
+
+def parse_listing_html(html, field_specs: Dict[str, dict] = CrawlConfig.LISTING_FIELDS) -> Dict[str, Optional[str]]:
+    """
+    Lấy các trường của tin từ HTML server-render (chuỗi hoặc Node đã parse) với cùng selector/label
+    như extract_listing_fields (JS). Không cần mạng nên kiểm thử được với file HTML đã lưu.
+    """
+    root = html if isinstance(html, Node) else parse_html(html)
+
+    specs = [
+        ((_clean(select_one(item, "span.re__pr-specs-content-item-title")) or "").lower(),
+         _clean(select_one(item, "span.re__pr-specs-content-item-value")))
+        for item in select_all(root, "div.re__pr-specs-content-item")
+    ]
+    post_card = [
+        ((_clean(select_one(item, "span.title")) or "").lower(),
+         _clean(select_one(item, "span.value")))
+        for item in select_all(root, "div.re__pr-short-info-item.js__pr-config-item")
+    ]
+    project_card = select_all(root, "span.re__prj-card-config-value")
+
+    def by_label(items, label: str, skip_empty: bool) -> Optional[str]:
+        needle = label.lower()
+        for title, value in items:
+            if title and needle in title:
+                if value or not skip_empty:
+                    return value
+        return None
+
+    fields = {}
+    for name, spec in field_specs.items():
+        value = None
+        if spec["type"] == "selector":
+            value = _clean(select_one(root, spec["selector"]))
+        elif spec["type"] == "specs":
+            value = by_label(specs, spec["label"], False)
+        elif spec["type"] == "post_card":
+            value = by_label(post_card, spec["label"], True)
+        elif spec["type"] == "project_card":
+            for item in project_card:
+                if select_one(item, f"i.{spec['icon_class']}") is not None:
+                    value = _clean(select_one(item, "span.re__long-text"))
+                    break
+        if value is None and spec["type"] != "selector":
+            value = ""
+        fields[name] = value
+    return fields
+
+
+def is_challenge_page(status_code: int, html: str) -> bool:
+    """Trang bị chặn / challenge thì phải dùng browser"""
+    if status_code in (403, 429, 503):
+        return True
+    head = html[:5000].lower()
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+def is_not_found_page(status_code: int, text: str) -> bool:
+    """Tin không còn tồn tại: HTTP 404/410 hoặc trang báo tin hết hạn / bị gỡ"""
+    if status_code in (404, 410):
+        return True
+    text = (text or "").lower()
+    return any(marker in text for marker in NOT_FOUND_MARKERS)
+
+
+def missing_required_fields(fields: Dict[str, Optional[str]],
+                            field_specs: Dict[str, dict] = CrawlConfig.LISTING_FIELDS) -> List[str]:
+    return [name for name, spec in field_specs.items() if spec.get("required") and not fields.get(name)]
+
+
+def has_lazy_block(root: Node, class_prefixes: List[str] = CrawlConfig.HTTP_LAZY_BLOCK_CLASSES) -> bool:
+    """HTML có khung của block render phía client (VD: block dự án) hay không"""
+    return any(
+        cls.startswith(prefix) for node in root.iter() for cls in node.classes for prefix in class_prefixes
+    )
+
+
+def missing_lazy_fields(fields: Dict[str, Optional[str]], root: Node,
+                        field_specs: Dict[str, dict] = CrawlConfig.LISTING_FIELDS) -> List[str]:
+    """
+    Trường needs_scroll bị rỗng trong khi trang có block chứa chúng: HTML server-render chưa có nội dung block,
+    phải dùng browser. Trang không có block (tin không thuộc dự án) thì trường rỗng là đúng
+    """
+    missing = [name for name, spec in field_specs.items() if spec.get("needs_scroll") and not fields.get(name)]
+    if missing and has_lazy_block(root):
+        return missing
+    return []
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Client dùng chung cho cả lần crawl (connection pool + HTTP/2)"""
+    return httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        timeout=CrawlConfig.HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=CrawlConfig.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=CrawlConfig.HTTP_MAX_CONNECTIONS,
+        ),
+        headers={
+            "User-Agent": CrawlConfig.USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "vi-VN,vi;q=0.9,en-US;q=0.8,en;q=0.7",
+        },
+    )
+
+
+async def fetch_listing_http(client: httpx.AsyncClient, url: str, rate_limiter=None,
+                             known_fingerprint: Optional[str] = None) -> Optional[dict]:
+    """
+    Lấy tin bằng HTTP thuần (không render). Trả về None nếu cần fallback sang browser
+    (lỗi mạng, thiếu trường bắt buộc, hoặc block dự án chưa được render: missing_lazy_fields),
+    raise BlockedPageError nếu gặp trang chặn/challenge
+    và ListingNotFoundError nếu tin không còn tồn tại.
+    Page fingerprint trùng known_fingerprint thì trả về bản ghi "seen again" (seen_index.seen_again_item).
+    """
+    if rate_limiter is not None:
+        await rate_limiter.acquire(url)
+    try:
+        response = await client.get(url)
+    except httpx.HTTPError as error:
+        logger.debug(f"HTTP fetch lỗi tại {url}: {error}")
+        return None
+
+    html = response.text
+    if is_challenge_page(response.status_code, html):
+        raise BlockedPageError(url, response.status_code)
+    if response.status_code in (404, 410):
+        raise ListingNotFoundError(url, response.status_code)
+    if response.status_code != 200:
+        logger.debug(f"HTTP fetch trả về {response.status_code} tại {url}")
+        return None
+
+    root = parse_html(html)
+    fingerprint = None
+    if CrawlConfig.FINGERPRINT_PRECHECK:
+        parts = page_fingerprint_parts(root)
+        fingerprint = page_fingerprint(parts)
+        if fingerprint and fingerprint == known_fingerprint:
+            return seen_again_item(url, parts, fingerprint)
+
+    item = parse_listing_html(root)
+    missing = missing_required_fields(item)
+    if missing and is_not_found_page(response.status_code, html):
+        raise ListingNotFoundError(url)
+    if missing:
+        logger.info(f"HTTP fetch thiếu trường {missing} tại {url}, chuyển sang browser")
+        return None
+    lazy_missing = missing_lazy_fields(item, root)
+    if lazy_missing:
+        logger.info(f"HTTP fetch thiếu trường render phía client {lazy_missing} tại {url}, chuyển sang browser")
+        return None
+
+    item["source"] = "batdongsan.com.vn"
+    item["url"] = url
+    item["crawled_at"] = datetime.now(timezone.utc).isoformat()
+    item["page_fingerprint"] = fingerprint
+    return item
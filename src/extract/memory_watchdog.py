@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+import psutil
+
+from config import CrawlConfig
+from metrics import tracer
+from utils import get_process_tree_rss
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class MemoryWatchdog:
+    """
+    Lấy mẫu RSS của cây process Chrome (psutil) mỗi `interval` giây để crawl dài chạy hết trên máy ít RAM:
+    - vượt soft budget: tab pool ngừng mở tab mới và đóng các tab đang rảnh, browser được đánh dấu cần làm mới
+    - browser đã đánh dấu mà vẫn trên soft budget khi 1 chunk CSV vừa xong: khởi động lại browser giữa 2 chunk
+    - vượt hard budget: khởi động lại browser ngay (chờ các listing đang chạy trả tab trước)
+    - xuống dưới soft budget * resume_ratio: mở tab mới trở lại
+    `log_phase()` ghi RSS của Chrome và của Python theo từng pha vào log và report.
+    """
+
+    def __init__(
+        self,
+        supervisor,
+        tab_pool,
+        soft_budget_mb: float = CrawlConfig.MEMORY_SOFT_BUDGET_MB,
+        hard_budget_mb: float = CrawlConfig.MEMORY_HARD_BUDGET_MB,
+        interval: float = CrawlConfig.MEMORY_CHECK_INTERVAL,
+        resume_ratio: float = CrawlConfig.MEMORY_RESUME_RATIO,
+    ):
+        self.supervisor = supervisor
+        self.tab_pool = tab_pool
+        self.soft_budget_mb = soft_budget_mb
+        self.hard_budget_mb = hard_budget_mb
+        self.interval = interval
+        self.resume_ratio = resume_ratio
+        self.recycle_pending = False
+        self.peak_mb = 0.0
+        self.phases: List[dict] = []
+        self.counters = {"throttled": 0, "idle_tabs_closed": 0, "recycles": 0}
+        self._recycling: Optional[asyncio.Task] = None
+        self._process = psutil.Process()
+
+    def sample(self) -> Optional[float]:
+        """RSS hiện tại (MB) của Chrome và toàn bộ process con"""
+        rss = get_process_tree_rss(getattr(self.supervisor.browser, "_process_pid", None))
+        if rss is None:
+            return None
+        rss_mb = rss / MB
+        self.peak_mb = max(self.peak_mb, rss_mb)
+        return rss_mb
+
+    def log_phase(self, phase: str) -> None:
+        chrome_mb = self.sample()
+        python_mb = self._process.memory_info().rss / MB
+        self.phases.append({
+            "phase": phase,
+            "at": time.time(),
+            "chrome_rss_mb": round(chrome_mb, 1) if chrome_mb is not None else None,
+            "python_rss_mb": round(python_mb, 1),
+            "tabs": self.tab_pool.metrics()["tabs"],
+        })
+        logger.info(
+            "Bộ nhớ [%s]: Chrome %s MB, Python %.0f MB, %s tab",
+            phase,
+            f"{chrome_mb:.0f}" if chrome_mb is not None else "?",
+            python_mb,
+            self.tab_pool.metrics()["tabs"],
+        )
+
+    async def check(self) -> None:
+        rss_mb = self.sample()
+        if rss_mb is None:
+            return
+        if rss_mb > self.soft_budget_mb:
+            if not self.tab_pool.throttled:
+                logger.warning(f"Chrome dùng {rss_mb:.0f}MB > {self.soft_budget_mb}MB: ngừng mở tab mới, đóng tab rảnh")
+                self.tab_pool.set_throttled(True)
+                self.counters["throttled"] += 1
+                tracer.count("memory.throttled")
+            closed = await self.tab_pool.close_idle()
+            self.counters["idle_tabs_closed"] += closed
+            self.recycle_pending = True
+        elif self.tab_pool.throttled and rss_mb < self.soft_budget_mb * self.resume_ratio:
+            logger.info(f"Chrome dùng {rss_mb:.0f}MB, mở tab mới trở lại")
+            self.tab_pool.set_throttled(False)
+        if rss_mb > self.hard_budget_mb:
+            self.request_recycle(f"RSS {rss_mb:.0f}MB > {self.hard_budget_mb}MB")
+
+    def on_chunk(self, path) -> None:
+        """Gọi sau mỗi chunk CSV (ChunkedCsvWriter.on_chunk)"""
+        self.log_phase(f"chunk {path.name}")
+        if self.recycle_pending:
+            rss_mb = self.sample()
+            if rss_mb is not None and rss_mb > self.soft_budget_mb:
+                self.request_recycle(f"RSS {rss_mb:.0f}MB sau chunk {path.name}")
+
+    def request_recycle(self, reason: str) -> None:
+        """Khởi động lại browser ở nền (chỉ 1 lần tại 1 thời điểm)"""
+        if self._recycling is None or self._recycling.done():
+            self._recycling = asyncio.ensure_future(self.recycle(reason))
+
+    async def recycle(self, reason: str) -> None:
+        self.log_phase("recycle.before")
+        # Chờ các listing đang chạy trả tab để không phải cào lại
+        async with self.tab_pool.drained():
+            try:
+                await self.supervisor.recycle(f"giải phóng RAM: {reason}")
+            except Exception as error:
+                logger.error(f"Làm mới browser thất bại: {error}")
+                return
+        self.counters["recycles"] += 1
+        self.recycle_pending = False
+        self.tab_pool.set_throttled(False)
+        self.log_phase("recycle.after")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as error:
+                logger.debug(f"Memory watchdog lỗi: {error}")
+
+    async def stop(self) -> None:
+        if self._recycling is not None and not self._recycling.done():
+            self._recycling.cancel()
+
+    def metrics(self) -> dict:
+        return {
+            "soft_budget_mb": self.soft_budget_mb,
+            "hard_budget_mb": self.hard_budget_mb,
+            "peak_chrome_rss_mb": round(self.peak_mb, 1),
+            **self.counters,
+            "phases": self.phases,
+        }
@@ -0,0 +1,202 @@
+import csv
+import json
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import CrawlConfig
+
+logger = logging.getLogger(__name__)
+
+SPAN_FIELDNAMES = ["url", "phase", "offset", "duration", "status"]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Percentile kiểu nearest-rank trên danh sách đã sắp xếp"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class PhaseStats:
+    """
+    Thống kê thời lượng của 1 pha với bộ nhớ cố định: count/total/max chính xác,
+    percentile tính trên reservoir sample (Algorithm R) tối đa `size` mẫu
+    """
+
+    __slots__ = ("size", "count", "total", "max", "samples", "_random")
+
+    def __init__(self, size: int = CrawlConfig.METRICS_RESERVOIR_SIZE, seed: int = 0):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+        self._random = random.Random(seed)
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if len(self.samples) < self.size:
+            self.samples.append(duration)
+        else:
+            index = self._random.randrange(self.count)
+            if index < self.size:
+                self.samples[index] = duration
+
+
+class CrawlTracer:
+    """
+    Đo thời gian từng pha của 1 lần crawl (navigate, wait_for_content_load, evaluate, reload, ...).
+    - span(): đo 1 pha, lưu lại theo từng listing (url) để xuất CSV
+    - observe(): ghi 1 thời lượng đã đo sẵn (VD: thời gian chờ rate limiter)
+    - count(): đếm sự kiện (retry, reload, fallback, ...)
+    Dùng qua instance `tracer` của module.
+    """
+
+    def __init__(self, enabled: bool = CrawlConfig.METRICS_ENABLED, max_spans: int = CrawlConfig.METRICS_MAX_SPANS,
+                 reservoir_size: int = CrawlConfig.METRICS_RESERVOIR_SIZE):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.reservoir_size = reservoir_size
+        self.reset()
+
+    def reset(self) -> None:
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self._durations: Dict[str, PhaseStats] = defaultdict(lambda: PhaseStats(self.reservoir_size))
+        self._errors: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.spans: List[dict] = []
+        self.dropped_spans = 0
+
+    def _record(self, phase: str, url: Optional[str], started: float, duration: float, status: str) -> None:
+        self._durations[phase].add(duration)
+        if status != "ok":
+            self._errors[phase] += 1
+        if len(self.spans) < self.max_spans:
+            self.spans.append({
+                "url": url or "",
+                "phase": phase,
+                "offset": round(started - self._started, 3),
+                "duration": round(duration, 4),
+                "status": status,
+            })
+        else:
+            # Thống kê theo pha vẫn đủ (PhaseStats), chỉ bỏ chi tiết từng span để RAM không tăng mãi
+            self.dropped_spans += 1
+
+    @contextmanager
+    def span(self, phase: str, url: Optional[str] = None):
+        if not self.enabled:
+            yield
+            return
+        started = time.monotonic()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._record(phase, url, started, time.monotonic() - started, status)
+
+    def observe(self, phase: str, duration: float, url: Optional[str] = None, status: str = "ok") -> None:
+        if self.enabled:
+            self._record(phase, url, time.monotonic() - duration, duration, status)
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += value
+
+    def summary(self) -> Dict[str, dict]:
+        """Thống kê theo pha: số lần, số lỗi, tổng/trung bình và p50/p95/p99 (giây)"""
+        phases = {}
+        for phase, stats in sorted(self._durations.items()):
+            values = sorted(stats.samples)
+            phases[phase] = {
+                "count": stats.count,
+                "errors": self._errors.get(phase, 0),
+                "total": round(stats.total, 3),
+                "mean": round(stats.total / stats.count, 4),
+                **{f"p{int(q * 100)}": round(percentile(values, q), 4) for q in QUANTILES},
+                "max": round(stats.max, 4),
+            }
+        return phases
+
+    def write_report(self, output_dir=None, run_name: Optional[str] = None, extra: Optional[dict] = None,
+                     openmetrics: bool = CrawlConfig.METRICS_OPENMETRICS) -> List[Path]:
+        """
+        Ghi report JSON (thống kê theo pha + counters + extra) và CSV từng span.
+        openmetrics=True: ghi thêm file .prom (OpenMetrics text) để node_exporter/Prometheus đọc.
+        """
+        if not self.enabled:
+            return []
+        from utils import RAW_DATA_DIR
+
+        # Thư mục con của data/raw để StagingLoader (chỉ đọc file trong data/raw) không coi report là dữ liệu
+        output_dir = Path(output_dir) if output_dir else RAW_DATA_DIR / "reports"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = self.started_at.strftime("%Y%m%d_%H%M%S")
+        base_name = f"crawl_{timestamp}" + (f"_{run_name}" if run_name else "")
+
+        report = {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "duration": round(time.monotonic() - self._started, 3),
+            "phases": self.summary(),
+            "counters": dict(self.counters),
+            "dropped_spans": self.dropped_spans,
+            **(extra or {}),
+        }
+        json_path = output_dir / f"{base_name}_report.json"
+        with json_path.open("w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2, default=str)
+
+        csv_path = output_dir / f"{base_name}_spans.csv"
+        with csv_path.open("w", newline="", encoding="utf-8") as spans_file:
+            writer = csv.DictWriter(spans_file, fieldnames=SPAN_FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(self.spans)
+
+        written = [json_path, csv_path]
+        if openmetrics:
+            prom_path = output_dir / f"{base_name}.prom"
+            prom_path.write_text(self.to_openmetrics(), encoding="utf-8")
+            written.append(prom_path)
+
+        logger.info(f"Đã ghi report thời gian crawl: {', '.join(str(path) for path in written)}")
+        return written
+
+    def to_openmetrics(self) -> str:
+        lines = [
+            "# TYPE crawl_phase_seconds summary",
+            "# UNIT crawl_phase_seconds seconds",
+            "# HELP crawl_phase_seconds Thời gian từng pha của crawl.",
+        ]
+        for phase, stats in sorted(self._durations.items()):
+            values = sorted(stats.samples)
+            for q in QUANTILES:
+                lines.append(f'crawl_phase_seconds{{phase="{phase}",quantile="{q}"}} {percentile(values, q):.6f}')
+            lines.append(f'crawl_phase_seconds_sum{{phase="{phase}"}} {stats.total:.6f}')
+            lines.append(f'crawl_phase_seconds_count{{phase="{phase}"}} {stats.count}')
+        lines += [
+            "# TYPE crawl_events counter",
+            "# HELP crawl_events Số lần xảy ra các sự kiện (retry, reload, fallback, ...).",
+        ]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'crawl_events_total{{event="{name}"}} {value}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+tracer = CrawlTracer()
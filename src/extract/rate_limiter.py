@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+from metrics import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket: tối đa `rate` request/giây trung bình, cho phép dồn tối đa `burst` request.
+    Các request chờ theo thứ tự (FIFO) nên nhịp gửi đều thay vì dồn cục khi semaphore nhả.
+    `cooldown()` tạm dừng toàn bộ request (VD: khi gặp trang chặn / HTTP 429).
+    """
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.jitter = jitter
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._cooldown_until = 0.0
+        self._lock = asyncio.Lock()
+        self.counters = {"acquired": 0, "cooldowns": 0, "waited_seconds": 0.0}
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    async def acquire(self) -> float:
+        """Chờ tới lượt gửi request, trả về số giây đã chờ"""
+        if self.rate <= 0:
+            return 0.0
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._cooldown_until:
+                    await asyncio.sleep(self._cooldown_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        if self.jitter > 0:
+            # Jitter ngoài lock để không làm chậm các request phía sau
+            await asyncio.sleep(random.uniform(0, self.jitter))
+        waited = time.monotonic() - started
+        self.counters["acquired"] += 1
+        self.counters["waited_seconds"] += waited
+        return waited
+
+    def cooldown(self, seconds: float, reason: str = "") -> None:
+        """Dừng gửi request trong `seconds` giây; sau cooldown bucket bắt đầu lại từ 0 token (không burst)"""
+        until = time.monotonic() + seconds
+        if until <= self._cooldown_until:
+            return
+        self._cooldown_until = until
+        self._tokens = 0.0
+        self._updated = until
+        self.counters["cooldowns"] += 1
+        logger.warning(f"Tạm dừng gửi request {seconds:.0f}s ({reason})")
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self._cooldown_until
+
+    def metrics(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            **self.counters,
+            "waited_seconds": round(self.counters["waited_seconds"], 2),
+        }
+
+
+class HostRateLimiter:
+    """
+    Mỗi host 1 TokenBucket riêng. Mọi lần điều hướng browser và request HTTP tới cùng host
+    (VD: batdongsan.com.vn) dùng chung 1 bucket, nên HTTP path và browser path không cộng dồn tốc độ.
+    `on_wait(seconds)` (nếu có) được gọi sau mỗi lần chờ token, VD: AdaptiveLimiter.exclude_wait
+    """
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0, cooldown_seconds: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.cooldown_seconds = cooldown_seconds
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.on_wait: Optional[Callable[[float], None]] = None
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc.lower()
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst, self.jitter)
+        return self._buckets[host]
+
+    async def acquire(self, url: str) -> float:
+        waited = await self.bucket(url).acquire()
+        tracer.observe("rate_limit.wait", waited, url)
+        if self.on_wait is not None:
+            self.on_wait(waited)
+        return waited
+
+    def cooldown(self, url: str, reason: str = "", seconds: Optional[float] = None) -> None:
+        self.bucket(url).cooldown(self.cooldown_seconds if seconds is None else seconds, reason)
+
+    def metrics(self) -> dict:
+        return {host: bucket.metrics() for host, bucket in self._buckets.items()}
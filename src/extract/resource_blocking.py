@@ -0,0 +1,69 @@
+import logging
+from fnmatch import fnmatch
+from typing import Dict, List, Optional
+
+from nodriver import cdp
+from config import CrawlConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceBlocker:
+    """
+    Chặn tài nguyên mà extract không dùng tới (ảnh, font, video, tracker, bản đồ...) khi tải subpage.
+    - blocked_url_patterns: chặn mọi loại request khớp pattern, bằng Network.setBlockedURLs (chặn ngay trong Chrome)
+    - blocked_types: chặn theo loại tài nguyên bằng Fetch interception, trừ URL khớp allow_patterns của loại đó
+    """
+
+    def __init__(
+        self,
+        blocked_types: List[str] = CrawlConfig.BLOCKED_RESOURCE_TYPES,
+        blocked_url_patterns: List[str] = CrawlConfig.BLOCKED_URL_PATTERNS,
+        allow_patterns: Dict[str, List[str]] = CrawlConfig.BLOCK_ALLOW_PATTERNS,
+    ):
+        self.blocked_types = [cdp.network.ResourceType(name) for name in blocked_types]
+        self.blocked_url_patterns = list(blocked_url_patterns)
+        self.allow_patterns = {name: [p.lower() for p in patterns] for name, patterns in allow_patterns.items()}
+        self.counters = {"blocked": 0, "allowed": 0}
+
+    def should_block(self, url: str, resource_type: Optional[cdp.network.ResourceType]) -> bool:
+        if resource_type not in self.blocked_types:
+            return False
+        url = url.lower()
+        return not any(fnmatch(url, pattern) for pattern in self.allow_patterns.get(resource_type.value, []))
+
+    async def attach(self, tab) -> None:
+        """Bật chặn cho tab, gọi trước khi điều hướng tab tới subpage"""
+        if self.blocked_url_patterns:
+            await tab.send(cdp.network.enable())
+            await tab.send(cdp.network.set_blocked_ur_ls(urls=self.blocked_url_patterns))
+        if self.blocked_types:
+            tab.add_handler(cdp.fetch.RequestPaused, self._on_request_paused)
+            # Chỉ pause request thuộc các loại cần chặn, request khác (document, script, XHR) đi thẳng
+            await tab.send(cdp.fetch.enable(patterns=[
+                cdp.fetch.RequestPattern(url_pattern="*", resource_type=resource_type)
+                for resource_type in self.blocked_types
+            ]))
+        tab._resource_blocker = self
+
+    async def _on_request_paused(self, event: cdp.fetch.RequestPaused, tab) -> None:
+        try:
+            if self.should_block(event.request.url, event.resource_type):
+                self.counters["blocked"] += 1
+                await tab.send(cdp.fetch.fail_request(event.request_id, cdp.network.ErrorReason.BLOCKED_BY_CLIENT))
+            else:
+                self.counters["allowed"] += 1
+                await tab.send(cdp.fetch.continue_request(event.request_id))
+        except Exception as error:
+            # Tab đã đóng / điều hướng đi nơi khác thì request cũng không còn
+            logger.debug(f"Không xử lý được request bị pause {event.request.url}: {error}")
+
+    def metrics(self) -> dict:
+        return dict(self.counters)
+
+
+def create_resource_blocker(enabled: Optional[bool] = None) -> Optional[ResourceBlocker]:
+    """Trả về ResourceBlocker nếu BLOCK_RESOURCES bật (enabled, nếu có, thay cho BLOCK_RESOURCES)"""
+    if not (CrawlConfig.BLOCK_RESOURCES if enabled is None else enabled):
+        return None
+    return ResourceBlocker()
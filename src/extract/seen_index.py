@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from config import CrawlConfig
+from utils import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Các trường nội dung của tin dùng để tính fingerprint (bỏ metadata như url, crawled_at)
+FINGERPRINT_FIELDS = list(CrawlConfig.LISTING_FIELDS.keys())
+
+
+def post_id_from_url(url: str) -> Optional[str]:
+    """
+    Lấy mã tin từ subpage URL
+    VD: https://batdongsan.com.vn/ban-nha-rieng-.../abc-pr41234567 → 41234567
+    """
+    match = re.search(r'-pr(\d+)(?:[/?#]|$)', url or "")
+    return match.group(1) if match else None
+
+
+def listing_fingerprint(item: dict) -> str:
+    """Hash nội dung tin để biết tin có thay đổi giữa các lần cào hay không"""
+    payload = json.dumps([item.get(name) or "" for name in FINGERPRINT_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def page_fingerprint(parts: Optional[dict]) -> Optional[str]:
+    """
+    Hash các node ổn định của trang tin (utils.extract_page_fingerprint_parts / http_fetch.page_fingerprint_parts),
+    tính được trước khi extract đầy đủ để biết trang có đổi so với lần cào trước hay không
+    """
+    if not parts or not parts.get("specs_text"):
+        return None
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def seen_again_item(url: str, parts: dict, fingerprint: str) -> dict:
+    """Bản ghi nhẹ cho tin không đổi (ghi vào data/seen thay vì 1 dòng đầy đủ trong data/raw)"""
+    return {
+        "url": url,
+        "post_id": parts.get("post_id") or post_id_from_url(url) or "",
+        "page_fingerprint": fingerprint,
+        "source": "batdongsan.com.vn",
+        "seen_at": datetime.now(timezone.utc).isoformat(),
+        "unchanged": True,
+    }
+
+
+class SeenIndex:
+    """
+    Chỉ mục cục bộ các tin đã cào (giữ qua các lần chạy), khóa theo subpage URL và post_id,
+    lưu thời điểm cào gần nhất và fingerprint nội dung.
+    """
+
+    def __init__(self, db_path=None, freshness_hours: float = CrawlConfig.SEEN_FRESHNESS_HOURS):
+        self.db_path = Path(db_path) if db_path else STATE_DIR / "seen_listings.sqlite"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.freshness = timedelta(hours=freshness_hours)
+        # timeout lớn vì các worker (--workers) dùng chung 1 file
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS listings (
+                url TEXT PRIMARY KEY,
+                post_id TEXT,
+                fingerprint TEXT,
+                first_seen_at TEXT NOT NULL,
+                last_crawled_at TEXT NOT NULL,
+                crawl_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_listings_post_id ON listings(post_id);
+            """
+        )
+        # Chỉ mục tạo từ phiên bản cũ chưa có cột page_fingerprint
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(listings)")}
+        if "page_fingerprint" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE listings ADD COLUMN page_fingerprint TEXT")
+
+    def get(self, url: str) -> Optional[dict]:
+        """Tìm tin theo URL, nếu không có thì theo post_id (URL có thể đổi slug nhưng mã tin giữ nguyên)"""
+        columns = "url, post_id, fingerprint, page_fingerprint, first_seen_at, last_crawled_at, crawl_count"
+        row = self.conn.execute(f"SELECT {columns} FROM listings WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            post_id = post_id_from_url(url)
+            if post_id:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM listings WHERE post_id = ? ORDER BY last_crawled_at DESC LIMIT 1",
+                    (post_id,),
+                ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(
+            ["url", "post_id", "fingerprint", "page_fingerprint", "first_seen_at", "last_crawled_at", "crawl_count"], row
+        ))
+
+    def get_page_fingerprint(self, url: str) -> Optional[str]:
+        entry = self.get(url)
+        return entry["page_fingerprint"] if entry else None
+
+    def is_known(self, url: str) -> bool:
+        """Tin đã từng được cào (không xét freshness), dùng để dừng dò trang khi AUTO_PAGINATION"""
+        return self.get(url) is not None
+
+    def is_fresh(self, url: str, now: Optional[datetime] = None) -> bool:
+        """Tin đã được cào trong cửa sổ freshness thì không cần cào lại"""
+        if self.freshness <= timedelta(0):
+            return False
+        entry = self.get(url)
+        if not entry:
+            return False
+        now = now or datetime.now(timezone.utc)
+        last_crawled_at = datetime.fromisoformat(entry["last_crawled_at"])
+        return now - last_crawled_at < self.freshness
+
+    def record(self, item: dict, page_fingerprint: Optional[str] = None) -> bool:
+        """
+        Ghi nhận tin vừa cào, trả về True nếu tin mới hoặc nội dung đã thay đổi.
+        page_fingerprint=None thì giữ page_fingerprint cũ.
+        """
+        url = item.get("url")
+        if not url:
+            return True
+        fingerprint = listing_fingerprint(item)
+        post_id = item.get("post_id") or post_id_from_url(url)
+        crawled_at = item.get("crawled_at") or datetime.now(timezone.utc).isoformat()
+
+        previous = self.get(url)
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO listings
+                    (url, post_id, fingerprint, page_fingerprint, first_seen_at, last_crawled_at, crawl_count)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT(url) DO UPDATE SET
+                    post_id = excluded.post_id,
+                    fingerprint = excluded.fingerprint,
+                    page_fingerprint = COALESCE(excluded.page_fingerprint, page_fingerprint),
+                    last_crawled_at = excluded.last_crawled_at,
+                    crawl_count = crawl_count + 1
+                """,
+                (url, post_id, fingerprint, page_fingerprint, crawled_at, crawled_at),
+            )
+        return previous is None or previous["fingerprint"] != fingerprint
+
+    def touch(self, url: str, seen_at: Optional[str] = None) -> None:
+        """Tin không đổi (page fingerprint trùng): chỉ cập nhật thời điểm cào, giữ nguyên fingerprint"""
+        entry = self.get(url)
+        if entry is None:
+            return
+        seen_at = seen_at or datetime.now(timezone.utc).isoformat()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE listings SET last_crawled_at = ?, crawl_count = crawl_count + 1 WHERE url = ?",
+                (seen_at, entry["url"]),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,192 @@
+import csv
+import logging
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config import CrawlConfig
+from frontier import UrlFrontier
+from utils import CSV_FIELDNAMES, RAW_DATA_DIR, STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def split_page_range(start_page: int, end_page: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    Chia đoạn trang [start_page, end_page] thành tối đa `workers` đoạn liên tiếp gần bằng nhau.
+    VD: (0, 9, 3) → [(0, 3), (4, 6), (7, 9)]
+    """
+    total = end_page - start_page + 1
+    if total <= 0 or workers <= 0:
+        return []
+    workers = min(workers, total)
+    base, extra = divmod(total, workers)
+
+    ranges = []
+    current = start_page
+    for index in range(workers):
+        size = base + (1 if index < extra else 0)
+        ranges.append((current, current + size - 1))
+        current += size
+    return ranges
+
+
+def split_shards(shards: List[str], workers: int) -> List[List[str]]:
+    """
+    Chia danh sách tin (CrawlConfig.LISTING_SHARDS) cho tối đa `workers` worker theo kiểu xoay vòng.
+    VD: (["/a", "/b", "/c"], 2) → [["/a", "/c"], ["/b"]]
+    """
+    if workers <= 0:
+        return []
+    return [group for group in (shards[index::workers] for index in range(workers)) if group]
+
+
+def _crawl_worker(worker_index: int, start_page: int, end_page: int, output_dir: str, resume: bool = False,
+                  shards: Optional[List[str]] = None, run_label: Optional[str] = None,
+                  frontier_label: Optional[str] = None) -> str:
+    """Chạy trong process con: mỗi worker có browser và event loop riêng, frontier dùng chung (frontier_label)"""
+    import nodriver as uc
+    from crawl import main
+
+    if shards:
+        logger.info(f"Worker {worker_index} dò trang các danh sách {shards}")
+    else:
+        logger.info(f"Worker {worker_index} cào trang {start_page}..{end_page}")
+    uc.loop().run_until_complete(
+        main(start_page=start_page, end_page=end_page, output_dir=output_dir, resume=resume,
+             shards=shards, run_label=run_label, frontier_label=frontier_label)
+    )
+    return output_dir
+
+
+def merge_shard_outputs(shard_dirs: List[Path], output_dir: Path = RAW_DATA_DIR,
+                        chunk_size: int = CrawlConfig.SUBPAGE_CHUNK_SIZE) -> List[Path]:
+    """
+    Gộp CSV của các worker thành các file chunk trong data/raw (cùng định dạng StagingLoader đang đọc).
+    Tin trùng subpage_url giữa các worker (do trang bị xô lệch khi đang cào) chỉ giữ bản đầu tiên.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Ghi vào .inprogress rồi os.replace (atomic) như ChunkedCsvWriter để StagingLoader không đọc file ghi dở.
+    # Tên tạm không theo prefix batdongsan_raw_ để ChunkedCsvWriter không khôi phục nhầm file gộp dở
+    tmp_dir = output_dir / ".inprogress"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+
+    seen_urls = set()
+    written_files = []
+    writer = None
+    output_file = None
+    tmp_path = None
+    chunk_index = 0
+    rows_in_chunk = 0
+
+    def open_chunk():
+        nonlocal writer, output_file, tmp_path, chunk_index, rows_in_chunk
+        chunk_index += 1
+        tmp_path = tmp_dir / f"merge_batdongsan_raw_{timestamp}_chunk_{chunk_index:02d}.csv.tmp"
+        output_file = tmp_path.open("w", newline="", encoding="utf-8-sig")
+        writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        rows_in_chunk = 0
+
+    def finalize_chunk():
+        nonlocal output_file
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        output_file.close()
+        output_file = None
+        destination = output_dir / tmp_path.name[len("merge_"):-len(".tmp")]
+        os.replace(tmp_path, destination)
+        written_files.append(destination)
+
+    try:
+        for shard_dir in shard_dirs:
+            for csv_path in sorted(Path(shard_dir).glob("*.csv")):
+                with csv_path.open("r", newline="", encoding="utf-8-sig") as csvfile:
+                    for row in csv.DictReader(csvfile):
+                        subpage_url = row.get("subpage_url")
+                        if subpage_url:
+                            if subpage_url in seen_urls:
+                                continue
+                            seen_urls.add(subpage_url)
+                        if writer is None or rows_in_chunk >= chunk_size:
+                            if output_file:
+                                finalize_chunk()
+                            open_chunk()
+                        writer.writerow({name: row.get(name, "") for name in CSV_FIELDNAMES})
+                        rows_in_chunk += 1
+        if output_file:
+            finalize_chunk()
+    finally:
+        if output_file:
+            # Lỗi giữa chừng: bỏ file dở, shard chưa bị xoá nên lần chạy sau gộp lại
+            output_file.close()
+            tmp_path.unlink(missing_ok=True)
+
+    logger.info(f"Đã gộp {len(seen_urls)} subpage từ {len(shard_dirs)} worker vào {len(written_files)} file")
+    return written_files
+
+
+def run_sharded(workers: int, start_page: int = CrawlConfig.START_PAGE,
+                end_page: int = CrawlConfig.END_PAGE, resume: bool = False) -> List[Path]:
+    """
+    Coordinator: chia đoạn trang (hoặc LISTING_SHARDS khi AUTO_PAGINATION = True) cho `workers` process,
+    mỗi process chạy crawl.main() với browser riêng, sau đó gộp kết quả vào data/raw.
+    resume=True: worker dùng lại frontier cũ, và output của lần chạy bị dừng (chưa gộp) cũng được gộp.
+    Frontier đặt tên theo cả đoạn trang (frontier_p<start>-<end>, frontier_auto) và dùng chung giữa các worker,
+    không theo cách chia worker, nên resume với --workers khác (hoặc không có --workers) vẫn tiếp tục được.
+    """
+    if CrawlConfig.AUTO_PAGINATION:
+        # Không biết trước số trang nên chia theo danh sách tin, mỗi worker tự dò trang của phần mình
+        shard_groups = split_shards(CrawlConfig.LISTING_SHARDS, workers)
+        jobs = [(start_page, end_page, group, f"auto_w{index:02d}") for index, group in enumerate(shard_groups)]
+        if len(jobs) < workers:
+            logger.warning(f"Chỉ có {len(jobs)} danh sách tin trong LISTING_SHARDS, chạy {len(jobs)} worker")
+    else:
+        jobs = [(first, last, None, None) for first, last in split_page_range(start_page, end_page, workers)]
+    if not jobs:
+        logger.warning("Không có main page nào để xử lý")
+        return []
+
+    # Cùng tên file với crawl.main() khi chạy 1 process. Reset 1 lần ở đây (không phải ở từng worker,
+    # worker reset sẽ xoá tiến độ của worker khác) nên worker luôn mở frontier ở chế độ resume
+    frontier_label = "auto" if CrawlConfig.AUTO_PAGINATION else f"p{start_page}-{end_page}"
+    UrlFrontier(STATE_DIR / f"frontier_{frontier_label}.sqlite", reset=not resume).close()
+
+    shards_root = RAW_DATA_DIR / ".shards"
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    shard_root = shards_root / run_id
+    shard_dirs = [shard_root / f"worker_{index:02d}" for index in range(len(jobs))]
+
+    logger.info(f"Chạy {len(jobs)} worker: {[job[2] or job[:2] for job in jobs]}")
+    # spawn để mỗi worker có event loop sạch (và chạy được trên Windows)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(jobs), mp_context=context) as executor:
+        futures = [
+            executor.submit(_crawl_worker, index, first, last, str(shard_dir), True, shards, run_label, frontier_label)
+            for index, ((first, last, shards, run_label), shard_dir) in enumerate(zip(jobs, shard_dirs))
+        ]
+        for index, future in enumerate(futures):
+            try:
+                future.result()
+            except Exception as error:
+                logger.error(f"Worker {index} lỗi: {error}")
+
+    # Gộp cả output của các lần chạy trước chưa kịp gộp (VD: coordinator bị kill)
+    all_runs = sorted(d for d in shards_root.iterdir() if d.is_dir()) if shards_root.exists() else []
+    merge_dirs = []
+    for run_dir in all_runs:
+        for worker_dir in sorted(d for d in run_dir.iterdir() if d.is_dir()):
+            # File dở dang của worker bị crash cũng đưa ra ngoài để gộp
+            for orphan in (worker_dir / ".inprogress").glob("*.csv"):
+                orphan.replace(worker_dir / orphan.name)
+            merge_dirs.append(worker_dir)
+
+    written_files = merge_shard_outputs(merge_dirs)
+    for run_dir in all_runs:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return written_files
@@ -0,0 +1,152 @@
+import asyncio
+import inspect
+import logging
+from typing import Awaitable, Callable, List
+
+from nodriver import cdp
+from config import CrawlConfig
+from errors import BrowserDeadError
+from metrics import tracer
+
+logger = logging.getLogger(__name__)
+
+
+async def stop_browser(browser) -> None:
+    """Dừng browser, bỏ qua lỗi (browser có thể đã chết)"""
+    if browser is None:
+        return
+    try:
+        result = browser.stop()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as stop_error:
+        logger.debug(f"Browser stop error: {stop_error}")
+
+
+class BrowserSupervisor:
+    """
+    Giữ browser dùng chung cho cả lần crawl và khởi động lại khi Chrome chết hoặc không trả lời.
+    - Mỗi lần khởi động là 1 thế hệ (generation). Thao tác trên browser chạy qua `guard()` nên bị hủy ngay
+      khi thế hệ đó bị thay, hoặc khi chạy quá `TAB_HUNG_TIMEOUT` (tab treo), thay vì chờ mãi trên websocket đã chết
+    - `recover()` single-flight: nhiều listing cùng phát hiện browser chết chỉ khởi động lại 1 lần
+    - `watch()` kiểm tra sức khỏe định kỳ (process còn sống + Browser.getVersion trả lời kịp)
+    """
+
+    def __init__(
+        self,
+        start: Callable[[], Awaitable],
+        tab_pool=None,
+        max_restarts: int = CrawlConfig.BROWSER_MAX_RESTARTS,
+        health_interval: float = CrawlConfig.BROWSER_HEALTH_INTERVAL,
+        health_timeout: float = CrawlConfig.BROWSER_HEALTH_TIMEOUT,
+        hung_timeout: float = CrawlConfig.TAB_HUNG_TIMEOUT,
+    ):
+        self._start = start
+        self.tab_pool = tab_pool
+        self.max_restarts = max_restarts
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.hung_timeout = hung_timeout
+        self.browser = None
+        self.generation = 0
+        self.restarts = 0
+        self.recycles = 0
+        self._lost = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._on_restart: List[Callable] = []
+
+    async def start(self):
+        self.browser = await self._start()
+        return self.browser
+
+    def on_restart(self, callback: Callable) -> None:
+        """callback(browser) được gọi sau mỗi lần khởi động lại"""
+        self._on_restart.append(callback)
+
+    async def is_alive(self) -> bool:
+        browser = self.browser
+        if browser is None or getattr(browser, "stopped", False):
+            return False
+        try:
+            await asyncio.wait_for(browser.connection.send(cdp.browser.get_version()), timeout=self.health_timeout)
+            return True
+        except Exception as error:
+            logger.warning(f"Browser không trả lời: {error!r}")
+            return False
+
+    async def guard(self, coro: Awaitable):
+        """
+        Chạy coro trên browser hiện tại. Raise BrowserDeadError nếu browser được khởi động lại giữa chừng,
+        asyncio.TimeoutError nếu chạy quá hung_timeout (coro bị hủy trong cả 2 trường hợp)
+        """
+        lost = self._lost
+        task = asyncio.ensure_future(coro)
+        waiter = asyncio.ensure_future(lost.wait())
+        try:
+            done, _ = await asyncio.wait({task, waiter}, timeout=self.hung_timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+        if task in done:
+            return task.result()
+        if lost.is_set():
+            raise BrowserDeadError("Browser được khởi động lại khi đang xử lý")
+        tracer.count("tab.hung")
+        raise asyncio.TimeoutError(f"Thao tác trên browser quá {self.hung_timeout}s")
+
+    async def recover(self, generation: int, reason: str = "") -> bool:
+        """
+        Gọi khi 1 thao tác trên browser thế hệ `generation` lỗi.
+        Trả về True nếu browser đã được khởi động lại (bởi lần gọi này hoặc lần gọi khác), tức là nên thử lại
+        """
+        async with self._lock:
+            if self.generation != generation:
+                return True
+            if await self.is_alive():
+                return False
+            if self.restarts >= self.max_restarts:
+                logger.error(f"Browser chết nhưng đã khởi động lại {self.restarts} lần, không khởi động lại nữa")
+                return False
+            self.restarts += 1
+            try:
+                await self._restart(reason)
+            except Exception as error:
+                logger.error(f"Khởi động lại browser thất bại: {error}")
+                return False
+            return True
+
+    async def recycle(self, reason: str = "") -> None:
+        """Chủ động khởi động lại browser còn sống (VD: giải phóng RAM), không tính vào max_restarts"""
+        async with self._lock:
+            self.recycles += 1
+            await self._restart(reason)
+
+    async def _restart(self, reason: str) -> None:
+        logger.warning(f"Khởi động lại browser ({reason})")
+        # Hủy ngay các thao tác đang chờ trên browser cũ
+        self._lost.set()
+        self._lost = asyncio.Event()
+        self.generation += 1
+        tracer.count("browser.restart")
+        with tracer.span("browser.restart"):
+            await stop_browser(self.browser)
+            self.browser = await self._start()
+        if self.tab_pool is not None:
+            await self.tab_pool.reset(self.browser)
+        for callback in self._on_restart:
+            callback(self.browser)
+
+    async def watch(self) -> None:
+        """Chạy nền trong suốt lần crawl, phát hiện browser chết kể cả khi không có listing nào đang lỗi"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            generation = self.generation
+            if not await self.is_alive():
+                await self.recover(generation, "health check")
+
+    def metrics(self) -> dict:
+        return {"generation": self.generation, "restarts": self.restarts, "recycles": self.recycles}
+
+    async def stop(self) -> None:
+        await stop_browser(self.browser)
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from nodriver import cdp
+from config import CrawlConfig
+from utils import get_network_tracker
+from metrics import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class TabPool:
+    """
+    Pool tab cố định cho subpage: tab được điều hướng tại chỗ thay vì mở/đóng tab mới mỗi listing.
+    Stealth script được đăng ký 1 lần mỗi tab qua Page.addScriptToEvaluateOnNewDocument.
+    Tab bị thay mới sau `max_navigations` lần điều hướng hoặc khi JS heap vượt `max_heap_mb`.
+    `resource_blocker` (nếu có) được bật cho mỗi tab mới để không tải ảnh/font/tracker.
+    Browser được khởi động lại (BrowserSupervisor) thì `reset()` bỏ toàn bộ tab cũ, tab cũ đang được dùng
+    chỉ trả lại slot khi release.
+    `throttled = True` (MemoryWatchdog): không mở thêm tab, listing chờ tab đang có được trả lại.
+    """
+
+    def __init__(
+        self,
+        browser,
+        size: int = CrawlConfig.SUBPAGE_SEMAPHORE_LIMIT,
+        max_navigations: int = CrawlConfig.TAB_MAX_NAVIGATIONS,
+        max_heap_mb: float = CrawlConfig.TAB_MAX_HEAP_MB,
+        resource_blocker=None,
+    ):
+        self.browser = browser
+        self.size = size
+        self.max_navigations = max_navigations
+        self.max_heap_mb = max_heap_mb
+        self.resource_blocker = resource_blocker
+        self._tabs: List = []
+        self.generation = 0
+        self.throttled = False
+        self._draining = False
+        # Tab rảnh (dùng lại tab mới trả trước) và số slot chưa có tab (tab được tạo khi có người cần)
+        self._idle_tabs: List = []
+        self._free_slots = size
+        self._cond = asyncio.Condition()
+
+    async def _new_tab(self):
+        generation = self.generation
+        tab = await self.browser.get("about:blank", new_tab=True)
+        try:
+            await tab.send(cdp.page.add_script_to_evaluate_on_new_document(source=CrawlConfig.STEALTH_EVASION_SCRIPT))
+        except Exception as error:
+            logger.warning(f"Không đăng ký được stealth script cho tab mới: {error}")
+        await get_network_tracker(tab)
+        if self.resource_blocker is not None:
+            try:
+                await self.resource_blocker.attach(tab)
+            except Exception as error:
+                logger.warning(f"Không bật được chặn tài nguyên cho tab mới: {error}")
+        tab._pool_navigations = 0
+        # Browser được khởi động lại trong lúc tạo tab thì tab thuộc browser cũ, release chỉ trả slot
+        tab._pool_generation = generation
+        if generation == self.generation:
+            self._tabs.append(tab)
+        return tab
+
+    async def _close_tab(self, tab) -> None:
+        self._tabs = [t for t in self._tabs if t is not tab]
+        try:
+            # Tab treo có thể không bao giờ trả lời lệnh đóng
+            await asyncio.wait_for(tab.close(), timeout=CrawlConfig.BROWSER_HEALTH_TIMEOUT)
+        except Exception as close_error:
+            logger.debug(f"Không thể đóng tab: {close_error}")
+
+    async def _heap_mb(self, tab) -> Optional[float]:
+        try:
+            used_size, *_ = await asyncio.wait_for(
+                tab.send(cdp.runtime.get_heap_usage()), timeout=CrawlConfig.BROWSER_HEALTH_TIMEOUT
+            )
+            return used_size / (1024 * 1024)
+        except Exception as error:
+            logger.debug(f"Không lấy được heap usage của tab: {error}")
+            return None
+
+    async def _should_recycle(self, tab) -> bool:
+        if tab._pool_navigations >= self.max_navigations:
+            logger.info(f"Thay tab sau {tab._pool_navigations} lần điều hướng")
+            return True
+        heap_mb = await self._heap_mb(tab)
+        if heap_mb is not None and heap_mb > self.max_heap_mb:
+            logger.info(f"Thay tab do JS heap {heap_mb:.0f}MB > {self.max_heap_mb}MB")
+            return True
+        return False
+
+    def _can_acquire(self) -> bool:
+        if self._draining:
+            return False
+        if self._idle_tabs:
+            return True
+        # Đang bị throttle thì chỉ được mở tab khi chưa có tab nào
+        return self._free_slots > 0 and not (self.throttled and self._tabs)
+
+    async def _return_slot(self) -> None:
+        async with self._cond:
+            self._free_slots += 1
+            self._cond.notify_all()
+
+    async def acquire(self):
+        """Lấy 1 tab rảnh (hoặc tạo mới nếu còn slot), chờ nếu pool đang dùng hết."""
+        async with self._cond:
+            await self._cond.wait_for(self._can_acquire)
+            if self._idle_tabs:
+                return self._idle_tabs.pop()
+            self._free_slots -= 1
+        try:
+            # Browser chết có thể không bao giờ trả lời lệnh mở tab
+            with tracer.span("tab.new"):
+                return await asyncio.wait_for(self._new_tab(), timeout=CrawlConfig.NAVIGATION_TIMEOUT)
+        except (Exception, asyncio.CancelledError):
+            await asyncio.shield(self._return_slot())
+            raise
+
+    async def navigate(self, tab, url: str):
+        """Điều hướng tab tại chỗ tới url. Token của rate limiter do người gọi lấy trước khi lấy tab"""
+        tab._pool_navigations += 1
+        tracker = getattr(tab, "_network_idle_tracker", None)
+        if tracker is not None:
+            tracker.reset_document()
+        with tracer.span("navigate", url):
+            return await asyncio.wait_for(tab.get(url), timeout=CrawlConfig.NAVIGATION_TIMEOUT)
+
+    async def release(self, tab, discard: bool = False) -> None:
+        """Trả tab về pool; tab lỗi hoặc đã đến hạn thay thì đóng và nhả slot"""
+        if tab is None:
+            # acquire lỗi: acquire đã tự trả slot
+            return
+        if getattr(tab, "_pool_generation", self.generation) != self.generation:
+            # Tab của browser trước khi khởi động lại: đã chết theo browser, chỉ trả slot
+            await self._return_slot()
+            return
+        if not discard:
+            discard = await self._should_recycle(tab)
+        if discard:
+            tracer.count("tab.recycled")
+            await self._close_tab(tab)
+            await self._return_slot()
+        else:
+            async with self._cond:
+                self._idle_tabs.append(tab)
+                self._cond.notify_all()
+
+    async def reset(self, browser) -> None:
+        """Chuyển sang browser mới: bỏ tab cũ (không đóng, đã chết theo browser cũ), giữ nguyên số slot"""
+        async with self._cond:
+            self.browser = browser
+            self.generation += 1
+            self._tabs = []
+            self._free_slots += len(self._idle_tabs)
+            self._idle_tabs = []
+            self._cond.notify_all()
+
+    def set_throttled(self, throttled: bool) -> None:
+        self.throttled = throttled
+        if not throttled:
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self) -> None:
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def close_idle(self) -> int:
+        """Đóng toàn bộ tab đang rảnh để giải phóng RAM (slot được giữ, tab mở lại khi cần), trả về số tab đã đóng"""
+        async with self._cond:
+            idle_tabs, self._idle_tabs = self._idle_tabs, []
+            self._free_slots += len(idle_tabs)
+        for tab in idle_tabs:
+            await self._close_tab(tab)
+        return len(idle_tabs)
+
+    def _all_returned(self) -> bool:
+        return self._free_slots + len(self._idle_tabs) == self.size
+
+    @asynccontextmanager
+    async def drained(self, timeout: float = CrawlConfig.TAB_HUNG_TIMEOUT):
+        """Ngừng cho mượn tab và chờ mọi tab được trả lại (VD: để khởi động lại browser giữa chừng)"""
+        async with self._cond:
+            self._draining = True
+            try:
+                await asyncio.wait_for(self._cond.wait_for(self._all_returned), timeout)
+            except asyncio.TimeoutError:
+                in_use = self.size - self._free_slots - len(self._idle_tabs)
+                logger.warning(f"Còn {in_use} tab đang dùng sau {timeout}s chờ")
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._draining = False
+                self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        return {
+            "tabs": len(self._tabs),
+            "idle": len(self._idle_tabs),
+            "free_slots": self._free_slots,
+            "throttled": self.throttled,
+        }
+
+    async def close(self) -> None:
+        for tab in list(self._tabs):
+            await self._close_tab(tab)
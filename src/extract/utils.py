@@ -1,9 +1,16 @@
-from typing import Optional
+from typing import Callable, Dict, Optional
 import asyncio
 import logging
 import csv
+import json
+import os
+import time
 from datetime import datetime, timezone
 from pathlib import Path
+import psutil
+from nodriver import cdp
+from config import CrawlConfig
+from metrics import tracer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,11 +19,136 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def get_process_tree_rss(pid: Optional[int]) -> Optional[int]:
+    """Tổng RSS (bytes) của process và toàn bộ process con (Chrome tách renderer/GPU thành nhiều process)"""
+    if not pid:
+        return None
+    try:
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+    except psutil.Error:
+        return None
+    total = 0
+    for proc in processes:
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return total
+
+
+class NetworkIdleTracker:
+    """Theo dõi request đang bay của 1 tab qua event CDP Network để biết khi nào mạng rảnh."""
+
+    def __init__(self):
+        self.inflight = set()
+        self.last_activity = time.monotonic()
+        self.enabled = False
+        # HTTP status của document chính lần điều hướng gần nhất (để nhận biết 404 / 429)
+        self.document_status: Optional[int] = None
+        self._main_frame_id = None
+
+    async def attach(self, page) -> None:
+        if self.enabled:
+            return
+        self._main_frame_id = getattr(getattr(page, "target", None), "target_id", None)
+        page.add_handler(cdp.network.RequestWillBeSent, self._on_request)
+        page.add_handler([cdp.network.LoadingFinished, cdp.network.LoadingFailed], self._on_done)
+        page.add_handler(cdp.network.ResponseReceived, self._on_response)
+        await page.send(cdp.network.enable())
+        self.enabled = True
+
+    def _on_request(self, event) -> None:
+        self.inflight.add(event.request_id)
+        self.last_activity = time.monotonic()
+
+    def _on_done(self, event) -> None:
+        self.inflight.discard(event.request_id)
+        self.last_activity = time.monotonic()
+
+    def _on_response(self, event) -> None:
+        if event.type_ != cdp.network.ResourceType.DOCUMENT:
+            return
+        # Chỉ lấy document của frame chính (bỏ iframe quảng cáo, bản đồ, ...)
+        if self._main_frame_id is None or event.frame_id is None or str(event.frame_id) == str(self._main_frame_id):
+            self.document_status = event.response.status
+
+    def reset_document(self) -> None:
+        """Gọi trước mỗi lần điều hướng để không đọc nhầm status của trang trước"""
+        self.document_status = None
+
+    async def wait_idle(self, quiet: float, timeout: float) -> bool:
+        """Chờ đến khi không còn request nào trong `quiet` giây, tối đa `timeout` giây."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if not self.inflight and now - self.last_activity >= quiet:
+                return True
+            await asyncio.sleep(min(0.05, max(deadline - now, 0)))
+        return False
+
+
+async def get_network_tracker(page) -> Optional[NetworkIdleTracker]:
+    """Mỗi tab chỉ gắn handler Network 1 lần, các lần sau dùng lại tracker đã lưu trên tab."""
+    tracker = getattr(page, "_network_idle_tracker", None)
+    if tracker is None:
+        tracker = NetworkIdleTracker()
+        try:
+            await tracker.attach(page)
+        except Exception as error:
+            logger.debug(f"Không bật được Network domain: {error}")
+            return None
+        page._network_idle_tracker = tracker
+    return tracker
+
+
+async def wait_for_selector(page, selector: str, timeout: float) -> bool:
+    """Chờ selector xuất hiện bằng MutationObserver, trả về False nếu quá timeout."""
+    js_code = f"""
+    new Promise((resolve) => {{
+        const selector = {json.dumps(selector)};
+        if (document.querySelector(selector)) {{
+            resolve(true);
+            return;
+        }}
+        const observer = new MutationObserver(() => {{
+            if (document.querySelector(selector)) {{
+                observer.disconnect();
+                clearTimeout(timer);
+                resolve(true);
+            }}
+        }});
+        const timer = setTimeout(() => {{
+            observer.disconnect();
+            resolve(false);
+        }}, {int(timeout * 1000)});
+        observer.observe(document.documentElement || document, {{
+            childList: true,
+            subtree: true
+        }});
+    }})
+    """
+    try:
+        result = await asyncio.wait_for(
+            page.evaluate(js_code, await_promise=True, return_by_value=True),
+            timeout=timeout + 1,
+        )
+    except Exception as error:
+        logger.debug(f"Waiting for '{selector}' failed: {error}")
+        return False
+
+    # Handle RemoteObject fallback (evaluate trả RemoteObject khi giá trị là false)
+    if hasattr(result, 'value'):
+        result = result.value
+    return result is True
+
+
 async def scroll_page_slowly(
     page,
     steps: int = 6,
     step_distance: int = 600,
     delay: float = 0.6,
+    tracker: Optional[NetworkIdleTracker] = None,
 ) -> None:
     """Scroll xuống từ từ để kích hoạt lazy-loading cho đến hết trang."""
 
@@ -47,7 +179,11 @@ async def scroll_page_slowly(
                     logger.debug(f"window.scrollBy failed: {eval_error}")
                     break
             
-            await asyncio.sleep(delay)
+            # Có tracker thì chỉ chờ đến khi lazy-load xong, delay là mức chờ tối đa
+            if tracker:
+                await tracker.wait_idle(quiet=CrawlConfig.SCROLL_IDLE_QUIET, timeout=delay)
+            else:
+                await asyncio.sleep(delay)
             attempt += 1
             
         except Exception as error:
@@ -63,288 +199,368 @@ async def scroll_page_slowly(
 
 async def wait_for_content_load(
     page,
-    scroll_steps: int = 6,
+    scroll_steps: int = CrawlConfig.SCROLL_STEPS,
     scroll_delay: float = 0.6,
-) -> None:
-    """Đợi trang load hoàn toàn và kích hoạt lazy loading."""
+) -> Dict[str, dict]:
+    """
+    Đợi trang sẵn sàng dựa trên tín hiệu của trang (không sleep cố định).
+    Trả về report thời gian đã chờ cho từng tín hiệu.
+    """
+    report = {}
+    started = time.monotonic()
+    tracker = await get_network_tracker(page)
+
+    # Chờ cho phần tử có class 're__main-content' xuất hiện
+    phase_start = time.monotonic()
+    found = await wait_for_selector(page, ".re__main-content", CrawlConfig.MAIN_CONTENT_TIMEOUT)
+    report["main_content"] = {"ready": found, "waited": round(time.monotonic() - phase_start, 3)}
+
+    # Chờ block thông số (specs) xuất hiện
+    phase_start = time.monotonic()
+    found = await wait_for_selector(page, "div.re__pr-specs-content-item", CrawlConfig.SPECS_TIMEOUT)
+    report["specs"] = {"ready": found, "waited": round(time.monotonic() - phase_start, 3)}
 
+    # Cuộn trang để kích hoạt lazy loading
+    phase_start = time.monotonic()
     try:
-        # Cuộn trang từ từ để kích hoạt lazy loading
-        await scroll_page_slowly(page, steps=scroll_steps, delay=scroll_delay)
+        await scroll_page_slowly(page, steps=scroll_steps, delay=scroll_delay, tracker=tracker)
     except Exception as error:
         logger.debug(f"scroll_page_slowly failed: {error}")
+    report["scroll"] = {"ready": True, "waited": round(time.monotonic() - phase_start, 3)}
 
-    # Chờ cho phần tử có class 're__main-content' xuất hiện bằng JavaScript
-    try:
-        await page.evaluate("""
-            () => new Promise((resolve) => {
-                const element = document.querySelector('.re__main-content');
-                if (element) {
-                    resolve();
-                } else {
-                    const observer = new MutationObserver((mutations) => {
-                        mutations.forEach((mutation) => {
-                            mutation.addedNodes.forEach((node) => {
-                                if (node.nodeType === 1 && 
-                                    (node.classList && node.classList.contains('re__main-content')) ||
-                                    (node.querySelector && node.querySelector('.re__main-content'))) {
-                                    observer.disconnect();
-                                    resolve();
-                                }
-                            });
-                        });
-                    });
-                    observer.observe(document.body, {
-                        childList: true,
-                        subtree: true
-                    });
-                }
-            })
-        """, await_promise=True)
-    except Exception as error:
-        logger.debug(f"Waiting for re__main-content failed: {error}")
+    # Chờ mạng rảnh (không còn request nào đang bay)
+    phase_start = time.monotonic()
+    idle = False
+    if tracker:
+        idle = await tracker.wait_idle(
+            quiet=CrawlConfig.NETWORK_IDLE_QUIET,
+            timeout=CrawlConfig.NETWORK_IDLE_TIMEOUT,
+        )
+    report["network_idle"] = {"ready": idle, "waited": round(time.monotonic() - phase_start, 3)}
 
-    await asyncio.sleep(3.0)
+    report["total"] = {"ready": all(v["ready"] for v in report.values()), "waited": round(time.monotonic() - started, 3)}
+    for name, phase in report.items():
+        tracer.observe(f"readiness.{name}", phase["waited"], page.url, "ok" if phase["ready"] else "timeout")
+    logger.info(
+        "Readiness %s: %s",
+        page.url,
+        ", ".join(f"{name}={v['waited']}s{'' if v['ready'] else ' (timeout)'}" for name, v in report.items()),
+    )
+    return report
 
-async def text_from_selector(page, selector: str, attempts: int = 3, delay: float = 3) -> Optional[str]:
+async def text_from_selector(
+    page,
+    selector: str,
+    attempts: int = 3,
+    delay: float = 3,
+    optional: bool = False,
+    guard_selector: str = ".re__main-content",
+) -> Optional[str]:
     """
     Extract text from selector using JavaScript to avoid RemoteObject issues.
-    Includes retry logic with delay for asynchronously loaded content.
+    Khi chưa thấy phần tử thì chờ bằng MutationObserver (tối đa `delay` giây mỗi lần), không reload trang.
+    optional=True: nếu trang đã render xong (có guard_selector) mà không có phần tử
+    thì coi như trường không tồn tại ở trang này và trả về None ngay.
+    """
+    js_code = f"""
+    (function() {{
+        const element = document.querySelector({json.dumps(selector)});
+        const text = element ? (element.textContent || element.innerText || '').trim() : '';
+        return JSON.stringify({{
+            text: text || null,
+            rendered: !!document.querySelector({json.dumps(guard_selector)}),
+        }});
+    }})();
     """
+
     for attempt in range(attempts):
         try:
-            # Use JavaScript to extract text directly in browser
-            js_code = f"""
-            (function() {{
-                const selector = {repr(selector)};
-                const element = document.querySelector(selector);
-                
-                if (element) {{
-                    const text = element.textContent || element.innerText || '';
-                    const trimmed = text.trim();
-                    return trimmed || null;
-                }}
-                
-                return null;
-            }})();
-            """
-            
             result = await page.evaluate(js_code, return_by_value=True)
-            
+
             # Handle RemoteObject fallback
             if hasattr(result, 'value'):
                 result = result.value
-            
-            if result:
-                return str(result)
-                
+
+            state = json.loads(result) if isinstance(result, str) else {}
+            if state.get("text"):
+                return str(state["text"])
+
+            if optional and state.get("rendered"):
+                logger.debug(f"Optional selector '{selector}' không có ở page {page.url}")
+                return None
+
         except Exception as e:
             logger.debug(f"Attempt {attempt+1} failed for selector '{selector}': {e}")
-            await page.reload()
-            
+
         if attempt < attempts - 1:
-            await page.reload()
-            await asyncio.sleep(delay)
+            tracer.count("text_from_selector.retry")
+            await wait_for_selector(page, selector, delay)
 
-    logger.warning(f"Not found selector '{selector}' after {attempts} attempts for page {page.url}")
+    if not optional:
+        logger.warning(f"Not found selector '{selector}' after {attempts} attempts for page {page.url}")
     return None
 
 
-async def extract_value_from_specs(page, label: str, default: str = "") -> str:
+LISTING_FIELDS_JS = """
+(function(fields) {
+    const clean = (element) => {
+        if (!element) return null;
+        const text = (element.textContent || element.innerText || '').trim();
+        return text || null;
+    };
+
+    // Mỗi block chỉ querySelectorAll đúng 1 lần, sau đó tra theo label/icon
+    const specs = Array.from(document.querySelectorAll('div.re__pr-specs-content-item')).map((item) => ({
+        title: (clean(item.querySelector('span.re__pr-specs-content-item-title')) || '').toLowerCase(),
+        value: clean(item.querySelector('span.re__pr-specs-content-item-value')),
+    }));
+    const postCard = Array.from(document.querySelectorAll('div.re__pr-short-info-item.js__pr-config-item')).map((item) => ({
+        title: (clean(item.querySelector('span.title')) || '').toLowerCase(),
+        value: clean(item.querySelector('span.value')),
+    }));
+    const projectCard = Array.from(document.querySelectorAll('span.re__prj-card-config-value'));
+
+    // specs: lấy item đầu tiên khớp label; post card: bỏ qua item khớp nhưng rỗng value
+    const byLabel = (items, label, skipEmpty) => {
+        const needle = label.toLowerCase();
+        for (const item of items) {
+            if (item.title && item.title.includes(needle)) {
+                if (item.value || !skipEmpty) return item.value;
+            }
+        }
+        return null;
+    };
+
+    const result = {};
+    for (const [name, spec] of Object.entries(fields)) {
+        let value = null;
+        if (spec.type === 'selector') {
+            value = clean(document.querySelector(spec.selector));
+        } else if (spec.type === 'specs') {
+            value = byLabel(specs, spec.label, false);
+        } else if (spec.type === 'post_card') {
+            value = byLabel(postCard, spec.label, true);
+        } else if (spec.type === 'project_card') {
+            for (const item of projectCard) {
+                if (item.querySelector('i.' + spec.icon_class)) {
+                    value = clean(item.querySelector('span.re__long-text'));
+                    break;
+                }
+            }
+        }
+        result[name] = value;
+    }
+    // Trả về chuỗi JSON để tránh RemoteObject/CBOR khi serialize object
+    return JSON.stringify(result);
+})(%s)
+"""
+
+
+async def extract_listing_fields(page, field_specs: Dict[str, dict]) -> Dict[str, Optional[str]]:
     """
-    Extract value from specs section using JavaScript to avoid CBOR stack limit errors.
-    This approach processes data in browser and returns only the needed value.
+    Lấy toàn bộ các trường khai báo trong field_specs chỉ với 1 lần page.evaluate.
+    Trường không tìm thấy sẽ có giá trị None (selector) hoặc "" (specs/card).
     """
-    try:
-        js_code = f"""
-        (function() {{
-            const label = {repr(label)};
-            const defaultValue = {repr(default)};
-            const specItems = document.querySelectorAll('div.re__pr-specs-content-item');
-            
-            for (const item of specItems) {{
-                const titleElement = item.querySelector('span.re__pr-specs-content-item-title');
-                if (titleElement) {{
-                    const titleText = titleElement.textContent.trim();
-                    if (titleText && titleText.toLowerCase().includes(label.toLowerCase())) {{
-                        const valueElement = item.querySelector('span.re__pr-specs-content-item-value');
-                        if (valueElement) {{
-                            const value = valueElement.textContent.trim();
-                            return value ? value : defaultValue;
-                        }}
-                    }}
-                }}
-            }}
-            
-            return defaultValue;
-        }})()
-        """
-        
-        result = await page.evaluate(js_code, return_by_value=True)
-        # Ensure we return string, not RemoteObject or None
-        if result is None or (hasattr(result, 'type_') and result.type_ == 'string'):
-            return default
-        return str(result) if result else default
-        
-    except Exception as e:
-        logger.warning(f"Not found specs section for '{label}': {e} for page {page.url}")
-        return default
-
-
-async def extract_value_from_project_card(page, icon_class: str, default: str = "") -> str:
+    js_code = LISTING_FIELDS_JS % json.dumps(field_specs, ensure_ascii=False)
+    result = await page.evaluate(js_code, return_by_value=True)
+
+    # Handle RemoteObject fallback
+    if hasattr(result, 'value'):
+        result = result.value
+    if not isinstance(result, str):
+        raise ValueError(f"Batched extraction returned unexpected result {result!r} for page {page.url}")
+
+    values = json.loads(result)
+    fields = {}
+    for name, spec in field_specs.items():
+        value = values.get(name)
+        if value is None and spec.get("type") != "selector":
+            value = ""
+        fields[name] = value
+    return fields
+
+
+PAGE_FINGERPRINT_JS = """
+(function(fields) {
+    const norm = (element) => (element ? (element.textContent || '') : '').replace(/\\s+/g, ' ').trim();
+    const specsBlock = document.querySelector('div.re__pr-specs-content');
+    if (!specsBlock) return null;
+
+    const rows = (selector, titleSelector, valueSelector) => Array.from(document.querySelectorAll(selector)).map((item) => ({
+        title: norm(item.querySelector(titleSelector)).toLowerCase(),
+        value: norm(item.querySelector(valueSelector)),
+    }));
+    const blocks = {
+        specs: rows('div.re__pr-specs-content-item', 'span.re__pr-specs-content-item-title', 'span.re__pr-specs-content-item-value'),
+        post_card: rows('div.re__pr-short-info-item.js__pr-config-item', 'span.title', 'span.value'),
+    };
+
+    const result = {};
+    for (const [name, spec] of Object.entries(fields)) {
+        const needle = spec.label.toLowerCase();
+        const match = (blocks[spec.type] || []).find((item) => item.title.includes(needle) && item.value);
+        result[name] = match ? match.value : '';
+    }
+    result.specs_text = norm(specsBlock);
+    return JSON.stringify(result);
+})(%s)
+"""
+
+
+async def extract_page_fingerprint_parts(page) -> Optional[Dict[str, str]]:
     """
-    Extract value from project card using JavaScript to avoid CBOR stack limit errors.
+    Lấy các node ổn định của tin (CrawlConfig.PAGE_FINGERPRINT_FIELDS + text block thông số) trong 1 lần evaluate,
+    whitespace được chuẩn hóa giống http_fetch.page_fingerprint_parts. Trả về None nếu trang chưa có block thông số.
     """
-    try:
-        js_code = f"""
-        (function() {{
-            const iconClass = {repr(icon_class)};
-            const defaultValue = {repr(default)};
-            const items = document.querySelectorAll('span.re__prj-card-config-value');
-            
-            for (const item of items) {{
-                const icon = item.querySelector('i.' + iconClass);
-                if (icon) {{
-                    const valueElement = item.querySelector('span.re__long-text');
-                    if (valueElement) {{
-                        const value = valueElement.textContent.trim();
-                        return value ? value : defaultValue;
-                    }}
-                }}
-            }}
-            
-            return defaultValue;
-        }})()
-        """
-        
-        result = await page.evaluate(js_code, return_by_value=True)
-        # Ensure we return string, not RemoteObject or None
-        if result is None or (hasattr(result, 'type_') and result.type_ == 'string'):
-            return default
-        return str(result) if result else default
-        
-    except Exception as e:
-        logger.warning(f"Cannot load project card items '{icon_class}': {e} for page {page.url}")
-        return default
-
-
-async def extract_value_from_post_card(page, label: str, default: str = "") -> str:
+    field_specs = {name: CrawlConfig.LISTING_FIELDS[name] for name in CrawlConfig.PAGE_FINGERPRINT_FIELDS}
+    result = await page.evaluate(PAGE_FINGERPRINT_JS % json.dumps(field_specs, ensure_ascii=False), return_by_value=True)
+    if hasattr(result, 'value'):
+        result = result.value
+    if not isinstance(result, str):
+        return None
+    return json.loads(result)
+
+
+RAW_DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "raw"
+# Dòng "seen again" của tin không đổi (không nạp vào bronze)
+SEEN_DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "seen"
+# Trạng thái crawl lưu cục bộ giữa các lần chạy (frontier, ...)
+STATE_DIR = Path(__file__).resolve().parents[2] / "data" / "state"
+
+CSV_FIELDNAMES = [
+    "main_page_url",
+    "subpage_url",
+    "title",
+    "address",
+    "price",
+    "area",
+    "house_direction",
+    "balcony_direction",
+    "facade",
+    "legal",
+    "furniture",
+    "number_bedroom",
+    "number_bathroom",
+    "number_floor",
+    "way_in",
+    "project_name",
+    "project_status",
+    "project_investor",
+    "post_id",
+    "post_start_time",
+    "post_end_time",
+    "post_type",
+    "source",
+    "crawled_at"
+]
+
+
+SEEN_AGAIN_FIELDNAMES = [
+    "main_page_url",
+    "subpage_url",
+    "post_id",
+    "page_fingerprint",
+    "source",
+    "seen_at",
+]
+
+
+def build_csv_row(main_page_url: str, subpage: dict, fieldnames=CSV_FIELDNAMES) -> dict:
+    """Chuyển 1 kết quả subpage thành 1 dòng CSV theo fieldnames (mặc định CSV_FIELDNAMES)"""
+    row = {name: subpage.get(name, "") for name in fieldnames}
+    row["main_page_url"] = main_page_url or ""
+    row["subpage_url"] = subpage.get("url", "")
+    return row
+
+
+class ChunkedCsvWriter:
     """
-    Extract value from post card using JavaScript to avoid CBOR stack limit errors.
-    Includes retry logic for cases where value might load asynchronously.
+    Ghi từng subpage ra CSV ngay khi cào xong (append-only), mỗi file tối đa `chunk_size` dòng.
+    File đang ghi nằm trong thư mục .inprogress và chỉ được chuyển vào output_dir (os.replace, atomic)
+    khi đã đủ chunk hoặc khi đóng writer, nên StagingLoader không bao giờ đọc phải file đang ghi dở.
+    `on_chunk(path)` (nếu có) được gọi sau mỗi chunk được chuyển vào output_dir.
     """
-    try:
-        js_code = f"""
-        (function() {{
-            const label = {repr(label)};
-            const items = document.querySelectorAll('div.re__pr-short-info-item.js__pr-config-item');
-            
-            for (const item of items) {{
-                const titleElement = item.querySelector('span.title');
-                if (titleElement) {{
-                    const titleText = titleElement.textContent.trim();
-                    if (titleText && titleText.toLowerCase().includes(label.toLowerCase())) {{
-                        const valueElement = item.querySelector('span.value');
-                        if (valueElement) {{
-                            const valueText = valueElement.textContent.trim();
-                            if (valueText) {{
-                                return valueText;
-                            }}
-                        }}
-                    }}
-                }}
-            }}
-            
-            return ""; // Return empty string instead of null to avoid RemoteObject
-        }})()
-        """
-        
-        result = await page.evaluate(js_code, return_by_value=True)
-        
-        # Ensure we handle RemoteObject properly
-        if result is None or (hasattr(result, 'type_') and result.type_ == 'string'):
-            result_str = default
-        else:
-            result_str = str(result) if result else ""
-        
-        if result_str:
-            return result_str
-        
-    except Exception as e:
-        logger.warning(f"Not found post card items '{label}': {e} for page {page.url}")
-        return default
-        
-
-def save_results_to_csv(results, suffix=None):
-    RAW_DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "raw"
-    RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
-
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    suffix_part = suffix or ""
-    output_path = RAW_DATA_DIR / f"batdongsan_raw_{timestamp}{suffix_part}.csv"
-
-    fieldnames = [
-        "main_page_url",
-        "subpage_url",
-        "title",
-        "address",
-        "price",
-        "area",
-        "house_direction",
-        "balcony_direction",
-        "facade",
-        "legal",
-        "furniture",
-        "number_bedroom",
-        "number_bathroom",
-        "number_floor",
-        "way_in",
-        "project_name",
-        "project_status",
-        "project_investor",
-        "post_id",
-        "post_start_time",
-        "post_end_time",
-        "post_type",
-        "source",
-        "crawled_at"
-    ]
-
-    rows = []
-    for main_page in results:
-        subpages = main_page.get("subpage_data", [])
-        for subpage in subpages:
-            row = {
-                "main_page_url": main_page.get("main_page_url", ""),
-                "subpage_url": subpage.get("url", ""),
-                "title": subpage.get("title", ""),
-                "address": subpage.get("address", ""),
-                "price": subpage.get("price", ""),
-                "area": subpage.get("area", ""),
-                "house_direction": subpage.get("house_direction", ""),
-                "balcony_direction": subpage.get("balcony_direction", ""),
-                "facade": subpage.get("facade", ""),
-                "legal": subpage.get("legal", ""),
-                "furniture": subpage.get("furniture", ""),
-                "number_bedroom": subpage.get("number_bedroom", ""),
-                "number_bathroom": subpage.get("number_bathroom", ""),
-                "number_floor": subpage.get("number_floor", ""),
-                "way_in": subpage.get("way_in", ""),
-                "project_name": subpage.get("project_name", ""),
-                "project_status": subpage.get("project_status", ""),
-                "project_investor": subpage.get("project_investor", ""),
-                "post_id": subpage.get("post_id", ""),
-                "post_start_time": subpage.get("post_start_time", ""),
-                "post_end_time": subpage.get("post_end_time", ""),
-                "post_type": subpage.get("post_type", ""),
-                "source": subpage.get("source", ""),
-                "crawled_at": subpage.get("crawled_at", "")
-            }
-            rows.append(row)
 
-    with output_path.open("w", newline="", encoding="utf-8-sig") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    def __init__(self, output_dir=None, chunk_size: int = CrawlConfig.SUBPAGE_CHUNK_SIZE,
+                 fieldnames=CSV_FIELDNAMES, file_prefix: str = "batdongsan_raw"):
+        self.output_dir = Path(output_dir) if output_dir else RAW_DATA_DIR
+        self.fieldnames = fieldnames
+        self.file_prefix = file_prefix
+        self.tmp_dir = self.output_dir / ".inprogress"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        self.chunk_index = 0
+        self.rows_in_chunk = 0
+        self.total_rows = 0
+        self.finalized_files = []
+        self._file = None
+        self._writer = None
+        self._tmp_path = None
+        self.on_chunk: Optional[Callable[[Path], None]] = None
+        self._recover_orphans()
+
+    def _recover_orphans(self) -> None:
+        # File dở dang của lần chạy bị crash trước vẫn chứa dữ liệu hợp lệ nên đưa vào output_dir
+        # Chỉ lấy file cùng prefix: writer khác (VD: worker khác) có thể đang ghi chung .inprogress
+        # Đổi tên theo timestamp hiện tại: StagingLoader bỏ qua file có timestamp <= lần xử lý gần nhất
+        index = 0
+        for orphan in sorted(self.tmp_dir.glob(f"{self.file_prefix}_*.csv")):
+            index += 1
+            while (self.output_dir / self._recovered_name(index)).exists():
+                index += 1
+            destination = self.output_dir / self._recovered_name(index)
+            os.replace(orphan, destination)
+            logger.warning(f"Khôi phục file dở dang từ lần chạy trước: {orphan.name} -> {destination}")
+
+    def _recovered_name(self, index: int) -> str:
+        return f"{self.file_prefix}_{self.timestamp}_recovered_{index:02d}.csv"
+
+    def _chunk_name(self) -> str:
+        return f"{self.file_prefix}_{self.timestamp}_chunk_{self.chunk_index:02d}.csv"
+
+    def _open_chunk(self) -> None:
+        self.chunk_index += 1
+        # Không ghi đè file của lần chạy khác trùng giây (VD: resume ngay sau khi crash)
+        while (self.output_dir / self._chunk_name()).exists():
+            self.chunk_index += 1
+        self._tmp_path = self.tmp_dir / self._chunk_name()
+        self._file = self._tmp_path.open("w", newline="", encoding="utf-8-sig")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        self._writer.writeheader()
+        self.rows_in_chunk = 0
+
+    def _finalize_chunk(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        destination = self.output_dir / self._tmp_path.name
+        os.replace(self._tmp_path, destination)
+        self.finalized_files.append(destination)
+        logger.info(f"Đã lưu chunk {self.chunk_index} với {self.rows_in_chunk} subpage vào: {destination}")
+        self._file = None
+        self._writer = None
+        if self.on_chunk is not None:
+            self.on_chunk(destination)
+
+    def write(self, main_page_url: str, subpage: dict) -> None:
+        if self._writer is None:
+            self._open_chunk()
+        self._writer.writerow(build_csv_row(main_page_url, subpage, self.fieldnames))
+        # flush từng dòng để crash giữa chừng không mất dữ liệu đã cào
+        self._file.flush()
+        self.rows_in_chunk += 1
+        self.total_rows += 1
+        if self.rows_in_chunk >= self.chunk_size:
+            self._finalize_chunk()
+
+    def close(self) -> None:
+        self._finalize_chunk()
+
+    def __enter__(self):
+        return self
 
-    logger.info(f"Đã lưu dữ liệu raw vào: {output_path}")
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
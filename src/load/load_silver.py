@@ -1,9 +1,11 @@
-def load_to_silver(supabase, valid_rows, error_rows, on_conflict: str = "subpage_url"):
-    # Cơ chế upsert từ staging sang silver
-    supabase.upsert(table="clean_table", data=valid_rows, on_conflict=on_conflict, schema="silver")
+def load_to_silver(supabase, valid_rows, error_rows, on_conflict: str = "subpage_url", batch_size: int = 1000):
+    # Cơ chế upsert từ staging sang silver, mỗi request tối đa batch_size dòng (chunk transform lớn hơn nhiều)
+    for start in range(0, len(valid_rows), batch_size):
+        supabase.upsert(table="clean_table", data=valid_rows[start:start + batch_size],
+                        on_conflict=on_conflict, schema="silver")
     
-    # Cơ chế insert vào error_table nếu có lỗi
+    # Cơ chế insert vào error_table nếu có lỗi, trả về False nếu ghi lỗi thất bại
     if error_rows:
-        supabase.create(table="error_table", data=error_rows, schema="silver")
+        return supabase.create(table="error_table", data=error_rows, schema="silver")["success"]
     
-    return None
\ No newline at end of file
+    return True
\ No newline at end of file
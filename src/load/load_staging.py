@@ -102,20 +102,41 @@ class StagingLoader:
             logger.error(f"Lỗi khi ghi log processed file: {e}")
             return False
     
-    def load_staging(self, data: List[Dict], batch_size: int = 1000) -> bool:
-        """Tải dữ liệu vào staging table với batch processing"""
+    def load_staging(self, data: List[Dict], batch_size: int = 1000) -> Dict:
+        """
+        Tải dữ liệu vào staging table với batch processing
+        Returns: kết quả của create / batch_insert, failed_ranges là các khoảng dòng chưa tải được
+        """
         try:
             if len(data) <= batch_size:
                 result = self.supabase.create("staging", data)
-                return result["success"]
             else:
-                # Batch processing cho dữ liệu lớn
+                # Batch processing cho dữ liệu lớn, batch lỗi được gửi lại trong batch_insert
                 result = self.supabase.batch_insert("staging", data, batch_size)
-                return result["success"]
+                for failed in result.get("failed_ranges", []):
+                    logger.error(f"Không tải được dòng {failed['start']}-{failed['end'] - 1}: {failed['error']}")
+            return result
         except Exception as e:
             logger.error(f"Lỗi khi tải dữ liệu vào staging: {e}")
-            return False
-    
+            return {"success": False, "error": str(e)}
+
+    def save_failed_rows(self, file_path: Path, data: List[Dict], failed_ranges: List[Dict]) -> Optional[Path]:
+        """
+        Ghi các dòng chưa tải được ra error/<tên file>_failed_rows.csv để tải lại riêng,
+        không tải lại cả file (sẽ nhân đôi các dòng đã commit trong staging)
+        """
+        try:
+            error_dir = self.data_dir.parent / "error"
+            error_dir.mkdir(exist_ok=True)
+            rows = [row for failed in failed_ranges for row in data[failed["start"]:failed["end"]]]
+            destination = error_dir / f"{file_path.stem}_failed_rows.csv"
+            pd.DataFrame(rows).to_csv(destination, index=False)
+            logger.warning(f"Đã ghi {len(rows)} dòng lỗi của {file_path.name} vào {destination.name}")
+            return destination
+        except Exception as e:
+            logger.error(f"Lỗi khi ghi dòng lỗi của {file_path}: {e}")
+            return None
+
     def get_data_from_file(self, file_path: Path) -> Optional[List[Dict]]:
         """Đọc dữ liệu từ file"""
         try:
@@ -156,6 +177,7 @@ class StagingLoader:
             return {"status": "no_files", "processed": 0, "failed": 0}
         
         processed_count = 0
+        partial_count = 0
         failed_count = 0
         
         for file_path, timestamp in unprocessed_files:
@@ -171,14 +193,23 @@ class StagingLoader:
                 continue
             
             # Tải vào staging
-            success = self.load_staging(data)
-            
-            if success:
+            result = self.load_staging(data)
+            failed_rows = sum(failed["end"] - failed["start"] for failed in result.get("failed_ranges", []))
+
+            if result["success"]:
                 # Ghi log thành công
                 self.log_processed_file(file_path, timestamp, len(data), "success")
                 self.move_processed_file(file_path, "success")
                 processed_count += 1
                 logger.info(f"Đã xử lý thành công {file_path.name} với {len(data)} records")
+            elif 0 < failed_rows < len(data) and self.save_failed_rows(file_path, data, result["failed_ranges"]):
+                # Phần lớn batch đã commit: file coi như đã xử lý, chỉ các dòng lỗi nằm lại trong error/
+                self.log_processed_file(file_path, timestamp, len(data) - failed_rows, "partial")
+                self.move_processed_file(file_path, "success")
+                processed_count += 1
+                partial_count += 1
+                logger.warning(f"Đã xử lý {file_path.name}: {len(data) - failed_rows}/{len(data)} records, "
+                               f"{failed_rows} dòng lỗi")
             else:
                 # Ghi log thất bại
                 self.log_processed_file(file_path, timestamp, len(data), "failed")
@@ -189,6 +220,7 @@ class StagingLoader:
         return {
             "status": "completed",
             "processed": processed_count,
+            "partial": partial_count,
             "failed": failed_count,
             "total": processed_count + failed_count
         }
@@ -1,7 +1,10 @@
 
 import os
+import json
 import logging
-from typing import List, Dict, Optional, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
 from supabase import create_client, Client
 from supabase.client import ClientOptions
 from dotenv import load_dotenv
@@ -9,6 +12,14 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class SupabaseManager:
+    # batch_insert: số batch gửi đồng thời và kích thước JSON tối đa mỗi batch
+    BATCH_MAX_IN_FLIGHT = int(os.getenv("SUPABASE_BATCH_IN_FLIGHT", "4"))
+    BATCH_MAX_BYTES = int(os.getenv("SUPABASE_BATCH_MAX_BYTES", str(2 * 1024 * 1024)))
+    # Số lần gửi lại các batch lỗi (chỉ gửi lại khoảng dòng lỗi, không gửi lại cả file)
+    BATCH_RETRIES = int(os.getenv("SUPABASE_BATCH_RETRIES", "2"))
+    # Số dòng mỗi trang khi đọc (nên <= max-rows của PostgREST)
+    PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
     def __init__(self, url: str = None, key: str = None, default_schema: Optional[str] = None):
         """
         Khởi tạo Supabase Manager
@@ -65,9 +76,19 @@ class SupabaseManager:
             return {"success": False, "error": str(e)}
 
     def read(self, table: str, columns: str = "*", filters: Dict = None, 
-             order_by: str = None, limit: int = None, offset: int = None, schema: Optional[str] = None) -> Dict:
-        """Đọc records"""
+             order_by: str = None, limit: int = None, offset: int = None, schema: Optional[str] = None,
+             key_columns: Sequence[str] = ("created_at", "id")) -> Dict:
+        """
+        Đọc records. Không truyền limit / order_by / offset thì đọc hết theo keyset pagination
+        trên key_columns (xem iter_query_pages), có thì query một lần như cũ
+        """
         try:
+            if not limit and not order_by and not offset:
+                data = []
+                for page in self.iter_query_pages(table, filters, columns, key_columns=key_columns, schema=schema):
+                    data.extend(page)
+                return {"success": True, "data": data, "count": len(data)}
+
             client = self._get_client_for_schema(schema or self.default_schema)
             query = client.table(table).select(columns)
             
@@ -148,52 +169,192 @@ class SupabaseManager:
         return {"success": True, "data": result.data}
 
 
-    def batch_insert(self, table: str, data_list: List[Dict], 
-                    batch_size: int = 1000) -> Dict:
-        """Chèn dữ liệu theo batch"""
-        try:
-            results = []
-            for i in range(0, len(data_list), batch_size):
-                batch = data_list[i:i + batch_size]
-                client = self._get_client_for_schema(None)
-                result = client.table(table).insert(batch).execute()
-                results.extend(result.data)
-            
-            self.logger.info(f"Batch insert {len(results)} records")
-            return {"success": True, "data": results}
-        except Exception as e:
-            self.logger.error(f"Lỗi batch insert: {str(e)}")
-            return {"success": False, "error": str(e)}
+    def batch_insert(self, table: str, data_list: List[Dict], batch_size: int = 1000,
+                     schema: Optional[str] = None, max_in_flight: int = None,
+                     max_batch_bytes: int = None, retries: int = None) -> Dict:
+        """
+        Chèn dữ liệu theo batch, nhiều batch chạy song song (dùng chung connection pool của client)
+        Args:
+            batch_size: số dòng tối đa mỗi batch
+            max_in_flight: số batch gửi đồng thời tối đa (cũng là số batch giữ trong bộ nhớ)
+            max_batch_bytes: kích thước JSON tối đa mỗi batch, batch được cắt theo cái nào đạt trước
+            retries: số lần gửi lại, mỗi lần chỉ gửi lại các khoảng dòng còn lỗi
+        Returns:
+            data: kết quả các batch thành công (theo thứ tự gửi, batch gửi lại nằm sau)
+            inserted_count: số dòng đã chèn
+            failed_ranges: [{"start", "end", "error"}] các khoảng dòng [start, end) vẫn lỗi sau khi gửi lại,
+                các dòng ngoài những khoảng này đã được commit
+        """
+        max_in_flight = max_in_flight or self.BATCH_MAX_IN_FLIGHT
+        max_batch_bytes = max_batch_bytes or self.BATCH_MAX_BYTES
+        retries = self.BATCH_RETRIES if retries is None else retries
+        client = self._get_client_for_schema(schema or self.default_schema)
+
+        results = []
+        failed_ranges = []
+        ranges = self._plan_batches(data_list, batch_size, max_batch_bytes)
+        for attempt in range(retries + 1):
+            if attempt:
+                if not failed_ranges:
+                    break
+                self.logger.warning(f"Gửi lại {len(failed_ranges)} batch lỗi vào {table} (lần {attempt}/{retries})")
+                ranges = [(item["start"], item["end"]) for item in failed_ranges]
+            failed_ranges = self._insert_ranges(client, table, data_list, ranges, max_in_flight, results)
+
+        failed_count = sum(item["end"] - item["start"] for item in failed_ranges)
+        self.logger.info(f"Batch insert {len(data_list) - failed_count} records vào {table} "
+                         f"({len(failed_ranges)} khoảng lỗi)")
+        response = {
+            "success": not failed_ranges,
+            "data": results,
+            "inserted_count": len(data_list) - failed_count,
+            "failed_ranges": failed_ranges,
+        }
+        if failed_ranges:
+            response["error"] = "; ".join(
+                f"[{item['start']}:{item['end']}] {item['error']}" for item in failed_ranges
+            )
+        return response
+
+    def _insert_ranges(self, client: Client, table: str, data_list: List[Dict],
+                       ranges: Iterable[Tuple[int, int]], max_in_flight: int, results: List[Dict]) -> List[Dict]:
+        """Gửi các khoảng dòng [start, end) song song, nối kết quả vào results, trả về các khoảng lỗi"""
+        def send(query):
+            return query.execute().data
+
+        failed_ranges = []
+        in_flight = deque()
+
+        def collect(entry):
+            start, end, future = entry
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                self.logger.error(f"Lỗi batch insert dòng {start}-{end - 1} vào {table}: {str(e)}")
+                failed_ranges.append({"start": start, "end": end, "error": str(e)})
 
-    def query_with_conditions(self, table: str, conditions: Dict, schema: Optional[str] = None) -> Dict:
-        """Query với nhiều điều kiện"""
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for start, end in ranges:
+                # Chờ batch cũ nhất xong trước khi gửi thêm để giới hạn bộ nhớ
+                if len(in_flight) >= max_in_flight:
+                    collect(in_flight.popleft())
+                # Tạo query ở thread chính, worker chỉ gửi request
+                query = client.table(table).insert(data_list[start:end])
+                in_flight.append((start, end, executor.submit(send, query)))
+            while in_flight:
+                collect(in_flight.popleft())
+        # Sắp theo vị trí để lần gửi lại và log đi theo thứ tự dòng
+        failed_ranges.sort(key=lambda item: item["start"])
+        return failed_ranges
+
+    @staticmethod
+    def _plan_batches(data_list: List[Dict], batch_size: int, max_batch_bytes: int) -> Iterator[Tuple[int, int]]:
+        """Chia data_list thành các khoảng [start, end) theo số dòng và kích thước JSON"""
+        start = 0
+        batch_bytes = 0
+        for index, row in enumerate(data_list):
+            row_bytes = len(json.dumps(row, default=str).encode("utf-8"))
+            if index > start and (index - start >= batch_size or batch_bytes + row_bytes > max_batch_bytes):
+                yield start, index
+                start, batch_bytes = index, 0
+            batch_bytes += row_bytes
+        if start < len(data_list):
+            yield start, len(data_list)
+
+    @staticmethod
+    def _apply_conditions(query, conditions: Optional[Dict]):
+        """Áp dụng điều kiện dạng {cột: giá trị} hoặc {cột: {"gt": giá trị}, ...} vào query"""
+        for key, condition in (conditions or {}).items():
+            if isinstance(condition, dict):
+                if "eq" in condition:
+                    query = query.eq(key, condition["eq"])
+                elif "neq" in condition:
+                    query = query.neq(key, condition["neq"])
+                elif "gt" in condition:
+                    query = query.gt(key, condition["gt"])
+                elif "gte" in condition:
+                    query = query.gte(key, condition["gte"])
+                elif "lt" in condition:
+                    query = query.lt(key, condition["lt"])
+                elif "lte" in condition:
+                    query = query.lte(key, condition["lte"])
+                elif "like" in condition:
+                    query = query.like(key, condition["like"])
+                elif "in" in condition:
+                    query = query.in_(key, condition["in"])
+            else:
+                query = query.eq(key, condition)
+        return query
+
+    @staticmethod
+    def _keyset_filter(key_columns: Sequence[str], last_row: Dict) -> str:
+        """
+        Điều kiện "sau dòng last_row" theo thứ tự key_columns cho .or_()
+        VD: created_at.gt.X,created_at.is.null,and(created_at.eq.X,id.gt.Y)
+        NULL xếp sau mọi giá trị khi order tăng dần, nên dòng có created_at NULL chỉ còn so theo id:
+        and(created_at.is.null,id.gt.Y). Cột cuối (id) phải là khóa duy nhất, không NULL
+        """
+        def quote(value) -> str:
+            # Giá trị có ký tự đặc biệt (:, +, dấu phẩy) phải nằm trong dấu nháy kép
+            text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            return f'"{text}"'
+
+        def equals(column) -> str:
+            value = last_row[column]
+            return f"{column}.is.null" if value is None else f"{column}.eq.{quote(value)}"
+
+        branches = []
+        for index, column in enumerate(key_columns):
+            if last_row[column] is None:
+                # Không có giá trị nào xếp sau NULL ở cột này, chỉ còn so các cột sau
+                continue
+            after = [f"{column}.gt.{quote(last_row[column])}"]
+            if index < len(key_columns) - 1:
+                after.append(f"{column}.is.null")
+            parts = [equals(prev) for prev in key_columns[:index]]
+            if parts:
+                branches.append(f"and({','.join(parts + after)})" if len(after) == 1
+                                else f"and({','.join(parts)},or({','.join(after)}))")
+            else:
+                branches.extend(after)
+        return ",".join(branches)
+
+    def iter_query_pages(self, table: str, conditions: Dict = None, columns: str = "*",
+                         key_columns: Sequence[str] = ("created_at", "id"), page_size: int = None,
+                         schema: Optional[str] = None) -> Iterator[List[Dict]]:
+        """
+        Đọc từng trang (list các dòng) theo keyset pagination trên key_columns (tăng dần), không dùng offset
+        nên không bỏ sót/lặp dòng và bộ nhớ chỉ phụ thuộc page_size.
+        columns phải chứa key_columns. Lỗi query được raise (generator không trả về dict lỗi được).
+        """
+        page_size = page_size or self.PAGE_SIZE
+        client = self._get_client_for_schema(schema or self.default_schema)
+        last_row = None
+        while True:
+            query = self._apply_conditions(client.table(table).select(columns), conditions)
+            if last_row is not None:
+                keyset = self._keyset_filter(key_columns, last_row)
+                if not keyset:
+                    return
+                query = query.or_(keyset)
+            for column in key_columns:
+                query = query.order(column)
+            page = query.limit(page_size).execute().data
+            # Dừng ở trang rỗng thay vì trang thiếu dòng: PostgREST có thể trả ít hơn page_size (max-rows)
+            if not page:
+                return
+            yield page
+            last_row = page[-1]
+
+    def query_with_conditions(self, table: str, conditions: Dict, schema: Optional[str] = None,
+                              key_columns: Sequence[str] = ("created_at", "id"), page_size: int = None) -> Dict:
+        """Query với nhiều điều kiện (đọc hết theo từng trang, xem iter_query_pages)"""
         try:
-            client = self._get_client_for_schema(schema or self.default_schema)
-            query = client.table(table).select("*")
-            
-            for key, condition in conditions.items():
-                if isinstance(condition, dict):
-                    if "eq" in condition:
-                        query = query.eq(key, condition["eq"])
-                    elif "neq" in condition:
-                        query = query.neq(key, condition["neq"])
-                    elif "gt" in condition:
-                        query = query.gt(key, condition["gt"])
-                    elif "gte" in condition:
-                        query = query.gte(key, condition["gte"])
-                    elif "lt" in condition:
-                        query = query.lt(key, condition["lt"])
-                    elif "lte" in condition:
-                        query = query.lte(key, condition["lte"])
-                    elif "like" in condition:
-                        query = query.like(key, condition["like"])
-                    elif "in" in condition:
-                        query = query.in_(key, condition["in"])
-                else:
-                    query = query.eq(key, condition)
-            
-            result = query.execute()
-            return {"success": True, "data": result.data}
+            data = []
+            for page in self.iter_query_pages(table, conditions, key_columns=key_columns,
+                                              page_size=page_size, schema=schema):
+                data.extend(page)
+            return {"success": True, "data": data}
         except Exception as e:
             self.logger.error(f"Lỗi query: {str(e)}")
             return {"success": False, "error": str(e)}
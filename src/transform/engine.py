@@ -0,0 +1,470 @@
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pickle import PicklingError
+
+import numpy as np
+import pandas as pd
+
+from config import TransformConfig
+from transformators import Transformators
+from validator import REQUIRED_FIELDS, validate
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = 'Không xác định'
+
+
+def process_row(row):
+    """
+    Validate + transform 1 dòng staging
+    Returns: (True, clean_row) hoặc (False, error_row)
+    """
+    if not validate(row):
+        return False, {**row, "error_message": "Thiếu các trường bắt buộc", "retry_status": "pending"}
+    try:
+        return True, Transformators.transform_row(row)
+    except Exception as e:
+        return False, {**row, "error_message": str(e), "retry_status": "pending"}
+
+
+def _process_batch(rows):
+    results = [process_row(row) for row in rows]
+    return [row for ok, row in results if ok], [row for ok, row in results if not ok]
+
+
+def _frame_batch(rows):
+    # Dựng cột bằng row.get giống transform_row: key thiếu là None, còn NaN có sẵn trong dòng vẫn là NaN
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    valid_df, error_df = transform_frame(
+        pd.DataFrame({column: _object_array([row.get(column) for row in rows]) for column in columns})
+    )
+    # Dòng lỗi giữ nguyên dict gốc giống process_row
+    error_rows = [
+        {**rows[index], "error_message": message, "retry_status": "pending"}
+        for index, message in zip(error_df.index, error_df["error_message"])
+    ]
+    return _records(valid_df), error_rows
+
+
+def resolve_workers(workers: int = TransformConfig.WORKERS) -> int:
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+@contextmanager
+def transform_pool(workers: int = TransformConfig.WORKERS):
+    """Process pool dùng chung cho cả lần chạy, None nếu chỉ có 1 worker"""
+    workers = resolve_workers(workers)
+    if workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield pool
+
+
+def _batch_function(vectorized: bool):
+    return _frame_batch if vectorized else _process_batch
+
+
+def _batch_size(total: int, workers: int, max_batch_size: int = None, min_batch_size: int = 1) -> int:
+    """
+    Chia đều rows cho các worker của pool, mỗi batch tối đa max_batch_size dòng và không nhỏ hơn
+    min_batch_size (trừ khi cả rows ít hơn min_batch_size)
+    """
+    batches = max(1, min(max(workers, 1), total // min_batch_size))
+    size = -(-total // batches)
+    return min(size, max_batch_size) if max_batch_size else size
+
+
+def submit_rows(rows, pool=None, batch_size: int = None, vectorized: bool = TransformConfig.VECTORIZED):
+    """
+    Gửi các batch của rows lên process pool rồi trả về ngay (transform chạy nền trong lúc caller làm việc khác,
+    VD: upsert chunk trước), lấy kết quả bằng collect_rows
+    Không truyền batch_size thì rows được chia đều cho số process của pool: tối đa WORKER_BATCH_SIZE dòng
+    mỗi batch khi transform từng dòng, ít nhất FRAME_BATCH_SIZE dòng mỗi frame khi vectorized.
+    rows ít hơn FRAME_MIN_ROWS thì transform từng dòng (frame nhỏ chậm hơn)
+    """
+    vectorized = vectorized and len(rows) >= TransformConfig.FRAME_MIN_ROWS
+    futures = None
+    if pool is not None and rows:
+        if not batch_size:
+            batch_size = (
+                _batch_size(len(rows), pool._max_workers, min_batch_size=TransformConfig.FRAME_BATCH_SIZE)
+                if vectorized else _batch_size(len(rows), pool._max_workers, TransformConfig.WORKER_BATCH_SIZE)
+            )
+        batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+        try:
+            futures = [pool.submit(_batch_function(vectorized), batch) for batch in batches]
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.warning(f"Process pool lỗi, transform tuần tự: {e}")
+            futures = None
+    return rows, vectorized, futures
+
+
+def collect_rows(pending):
+    """
+    Kết quả của submit_rows: (valid_rows, error_rows) giữ đúng thứ tự của rows (giống chạy tuần tự)
+    Không có pool hoặc pool bị lỗi thì chạy tuần tự trong process hiện tại
+    """
+    rows, vectorized, futures = pending
+    if futures is not None:
+        try:
+            valid_rows, error_rows = [], []
+            for future in futures:
+                batch_valid, batch_error = future.result()
+                valid_rows.extend(batch_valid)
+                error_rows.extend(batch_error)
+            return valid_rows, error_rows
+        except (BrokenProcessPool, PicklingError, OSError) as e:
+            logger.warning(f"Process pool lỗi, transform tuần tự: {e}")
+    return _batch_function(vectorized)(rows)
+
+
+def transform_rows(rows, pool=None, batch_size: int = None, vectorized: bool = TransformConfig.VECTORIZED):
+    """
+    Transform danh sách dòng staging, chia thành các batch cho process pool (xem submit_rows)
+    Mỗi batch chạy transform_frame (vectorized) hoặc process_row từng dòng
+    Returns: (valid_rows, error_rows) giữ đúng thứ tự của rows (giống chạy tuần tự)
+    """
+    return collect_rows(submit_rows(rows, pool, batch_size, vectorized))
+
+
+# ---------------------------------------------------------------------------
+# Vectorized: làm sạch theo cột thay vì gọi transform_row cho từng dòng. Mỗi cột được factorize và chỉ làm
+# sạch các giá trị khác nhau (Series.str / mask với cột ít giá trị như hướng, pháp lý, nội thất; cleaner scalar
+# với cột gần như mỗi dòng 1 giá trị như địa chỉ, URL), rồi trả về từng dòng bằng numpy take. Giá trị mà các
+# bước vectorized không chắc chắn (định dạng lạ / lỗi) được chạy lại cleaner scalar để có đúng kết quả
+# hoặc thông báo lỗi như transform_row.
+# ---------------------------------------------------------------------------
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _factorize(series):
+    """
+    (codes theo dòng, các giá trị khác nhau, mask dòng có giá trị không phải chuỗi và không phải None)
+    factorize gộp None với NaN và 1 với 1.0, True nên các dòng trong mask phải chạy lại process_row
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    missing = uniques.isna().to_numpy(dtype=bool)
+    is_str = uniques.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    odd = (~missing & ~is_str)[codes]
+    missing_rows = np.flatnonzero(missing[codes])
+    if len(missing_rows):
+        odd[missing_rows] = [value is not None for value in series.to_numpy(dtype=object)[missing_rows]]
+    return codes, uniques.where(~missing, None), odd
+
+
+def _text(uniques):
+    """(series chỉ gồm chuỗi, mask chuỗi khác rỗng, mask giá trị không phải chuỗi và không phải None)"""
+    values = uniques.to_numpy(dtype=object)
+    is_str = np.array([isinstance(value, str) for value in values], dtype=bool)
+    text = pd.Series(np.where(is_str, values, ""), dtype=object)
+    present = is_str & (text.to_numpy(dtype=object) != "")
+    odd = ~is_str & pd.notna(values)
+    return text, present, odd
+
+
+def _to_float(texts, mask):
+    """float() như bản scalar, không parse được / không hữu hạn thì NaN"""
+    values = np.full(len(texts), np.nan)
+    for index in np.flatnonzero(mask):
+        try:
+            values[index] = float(texts[index])
+        except ValueError:
+            continue
+    values[~np.isfinite(values)] = np.nan
+    return values
+
+
+def _round2(values, mask, default):
+    """round(x, 2) của Python (khác np.round ở các giá trị biên)"""
+    return [round(value, 2) if keep else default for value, keep in zip(values.tolist(), mask.tolist())]
+
+
+def _contains_any(text, keywords):
+    pattern = "|".join(re.escape(keyword) for keyword in keywords)
+    return text.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+
+
+def _resolve(uniques, values, suspect, cleaner):
+    """Chạy cleaner scalar cho các giá trị bị đánh dấu, trả về (giá trị, thông báo lỗi hoặc None)"""
+    errors = [None] * len(values)
+    for index in np.flatnonzero(suspect):
+        try:
+            values[index] = cleaner(uniques[index])
+        except Exception as e:
+            values[index] = None
+            errors[index] = str(e)
+    return values, errors
+
+
+def _scalar(uniques):
+    """Cột chỉ làm sạch bằng cleaner scalar (mỗi giá trị khác nhau 1 lần)"""
+    return [None] * len(uniques), np.ones(len(uniques), dtype=bool)
+
+
+def _clean_number(uniques, normalize):
+    """clean_facade / clean_way_in: rỗng -> -1, còn lại float làm tròn 2 chữ số"""
+    text, present, odd = _text(uniques)
+    values = _to_float(normalize(text).tolist(), present)
+    ok = present & ~np.isnan(values)
+    return _round2(values, ok, -1), (present & ~ok) | odd
+
+
+def _clean_area(uniques):
+    text, present, odd = _text(uniques)
+    normalized = (
+        text.str.lower().str.strip()
+        .str.replace('m²', '', regex=False).str.replace('m2', '', regex=False).str.strip()
+        .str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    )
+    values = _to_float(normalized.tolist(), present)
+    ok = present & ~np.isnan(values)
+    return _round2(values, ok, None), ~ok
+
+
+def _clean_price(prices, codes, area_m2, area_missing):
+    """
+    clean_price theo dòng: số và đơn vị (tỷ / triệu/m² / triệu) được tách 1 lần cho mỗi giá khác nhau,
+    quy đổi ra triệu/m² theo diện tích từng dòng bằng numpy
+    Returns: (giá trị theo dòng, mask dòng cần chạy lại clean_price)
+    """
+    text, present, odd = _text(prices)
+    normalized = text.str.lower().str.strip()
+    negotiable = _contains_any(normalized, ['thỏa thuận', 'thoa thuan'])
+    normalized = normalized.str.replace(',', '.', regex=False)
+    number = normalized.str.extract(r'([\d.]+)', expand=False)
+    values = _to_float(number.tolist(), present & number.notna().to_numpy(dtype=bool))
+    # Đơn vị kiểm tra theo đúng thứ tự của clean_price
+    unit = np.select(
+        [normalized.str.contains(keyword, regex=False).to_numpy(dtype=bool) for keyword in ('tỷ', 'triệu/m²', 'triệu')],
+        [0, 1, 2],
+        default=-1,
+    )
+
+    value, unit = values[codes], unit[codes]
+    # Giống `not price or not area_m2 or area_m2 <= 0` (diện tích NaN vẫn được tính như bản scalar)
+    with np.errstate(invalid="ignore"):
+        minus_one = ~present[codes] | area_missing | (area_m2 <= 0) | negotiable[codes]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        million_per_m2 = np.select(
+            [unit == 0, unit == 1, unit == 2],
+            [value * 1000 / area_m2, value, value / area_m2],
+            default=np.nan,
+        )
+    ok = ~minus_one & ~np.isnan(million_per_m2)
+    return _round2(million_per_m2, ok, -1), (~minus_one & ~ok) | odd[codes]
+
+
+def _clean_direction(uniques):
+    text, present, odd = _text(uniques)
+    has_dash = text.str.contains('-', regex=False)
+    collapsed = text.str.replace('-', ' ', regex=False).str.split().str.join(' ')
+    cleaned = collapsed.where(has_dash, text).str.strip().str.title()
+    return cleaned.where(present, UNKNOWN).tolist(), odd
+
+
+def _clean_legal(uniques):
+    text, present, odd = _text(uniques)
+    lower = text.str.lower()
+    flags = {
+        column: _contains_any(lower, keywords) & present
+        for column, keywords in Transformators.LEGAL_KEYWORDS.items()
+    }
+    any_legal = np.logical_or.reduce(list(flags.values()))
+    values = [dict(zip(flags, row)) for row in zip(*(mask.astype(int).tolist() for mask in flags.values()))]
+    return values, (present & ~any_legal) | odd
+
+
+def _clean_furniture(uniques):
+    text, present, odd = _text(uniques)
+    lower = text.str.lower()
+    full, basic, premium = (
+        _contains_any(lower, Transformators.FURNITURE_KEYWORDS[kind]) & present
+        for kind in ('full', 'basic', 'premium')
+    )
+    furniture_type = np.where(basic, 'basic', np.where(full, 'full', UNKNOWN)).tolist()
+    values = [
+        {'furniture_type': kind, 'has_premium_furniture': flag}
+        for kind, flag in zip(furniture_type, premium.astype(int).tolist())
+    ]
+    return values, (present & ~(full | basic | premium)) | odd
+
+
+def _clean_number_field(uniques):
+    """clean_number_field: số nguyên đầu tiên trong chuỗi, rỗng -> -1"""
+    text, present, odd = _text(uniques)
+    extracted = text.str.extract(r'(\d+)', expand=False)
+    has_number = present & extracted.notna().to_numpy(dtype=bool)
+    values = [int(number) if keep else -1 for number, keep in zip(extracted.tolist(), has_number.tolist())]
+    return values, (present & ~has_number) | odd
+
+
+def _clean_title_text(uniques):
+    """clean_project_name / clean_project_investor"""
+    text, present, odd = _text(uniques)
+    cleaned = text.str.split().str.join(' ').str.title().to_numpy(dtype=object)
+    return np.where(~present | (cleaned == ''), UNKNOWN, cleaned).tolist(), odd
+
+
+def _extract_page_number(uniques):
+    text, present, odd = _text(uniques)
+    extracted = text.str.extract(r'/p(\d+)', expand=False)
+    values = [int(number) if isinstance(number, str) else None for number in extracted.tolist()]
+    # re.search lỗi với None / giá trị không phải chuỗi
+    return values, uniques.isna().to_numpy(dtype=bool) | odd
+
+
+_ADDRESS_COLUMNS = {
+    'specific_area': 'khu_vuc_cu_the',
+    'hamlet_neighborhood': 'thon_to_dan_pho',
+    'ward_commune': 'phuong_xa',
+    'district': 'quan_huyen',
+    'province_city': 'tinh_thanh_pho',
+}
+
+# Các bước của transform_row theo đúng thứ tự (thông báo lỗi là lỗi của bước đầu tiên bị lỗi):
+# (cột staging, hàm vectorized, cleaner scalar, cột kết quả hoặc {cột kết quả: key trong dict kết quả})
+_STEPS = [
+    ('main_page_url', _extract_page_number, Transformators.extract_page_number, 'page_number'),
+    ('address', _scalar, Transformators.parse_address, _ADDRESS_COLUMNS),
+    ('area', _clean_area, Transformators.clean_area, 'area_m2'),
+    ('price', _clean_price, Transformators.clean_price, 'million_per_m2'),
+    ('house_direction', _clean_direction, Transformators.clean_direction, 'house_direction'),
+    ('balcony_direction', _clean_direction, Transformators.clean_direction, 'balcony_direction'),
+    ('facade', lambda uniques: _clean_number(
+        uniques,
+        lambda text: text.str.replace(',', '.', regex=False).str.replace('m', '', regex=False).str.strip(),
+    ), Transformators.clean_facade, 'facade'),
+    ('legal', _clean_legal, Transformators.clean_legal, {column: column for column in Transformators.LEGAL_KEYWORDS}),
+    ('furniture', _clean_furniture, Transformators.clean_furniture,
+     {'furniture_type': 'furniture_type', 'has_premium_furniture': 'has_premium_furniture'}),
+    ('number_bedroom', _clean_number_field, Transformators.clean_number_field, 'number_bedroom'),
+    ('number_bathroom', _clean_number_field, Transformators.clean_number_field, 'number_bathroom'),
+    ('number_floor', _clean_number_field, Transformators.clean_number_field, 'number_floor'),
+    ('way_in', lambda uniques: _clean_number(
+        uniques,
+        lambda text: text.str.lower()
+        .str.replace('"', '', regex=False).str.replace("'", '', regex=False)
+        .str.replace('m', '', regex=False).str.replace(',', '.', regex=False).str.strip(),
+    ), Transformators.clean_way_in, 'way_in_m'),
+    ('project_name', _clean_title_text, Transformators.clean_project_name, 'project_name'),
+    ('project_status', _scalar, Transformators.extract_project_status_stage, 'project_status_stage'),
+    ('project_investor', _clean_title_text, Transformators.clean_project_investor, 'project_investor'),
+    ('post_start_time', _scalar, Transformators.clean_date_field, 'post_start_time'),
+    ('post_end_time', _scalar, Transformators.clean_date_field, 'post_end_time'),
+    ('subpage_url', _scalar, Transformators.extract_property_type, 'loai_bat_dong_san'),
+]
+
+# Thứ tự cột giống transform_row: (cột kết quả, cột staging lấy nguyên giá trị hoặc None nếu do _STEPS tạo)
+_OUTPUT_COLUMNS = [
+    ('main_page_url', 'main_page_url'), ('page_number', None), ('subpage_url', 'subpage_url'), ('title', 'title'),
+    *((column, None) for column in _ADDRESS_COLUMNS), ('area_m2', None), ('million_per_m2', None),
+    ('house_direction', None), ('balcony_direction', None), ('facade', None),
+    *((column, None) for column in Transformators.LEGAL_KEYWORDS),
+    ('furniture_type', None), ('has_premium_furniture', None),
+    ('number_bedroom', None), ('number_bathroom', None), ('number_floor', None), ('way_in_m', None),
+    ('project_name', None), ('project_status_stage', None), ('project_investor', None),
+    ('post_id', 'post_id'), ('post_start_time', None), ('post_end_time', None), ('post_type', 'post_type'),
+    ('source', 'source'), ('store_staging_at', 'created_at'), ('transformed_at', None), ('loai_bat_dong_san', None),
+]
+
+
+def _records(df):
+    """DataFrame -> list dict (nhanh hơn to_dict("records") với cột object)"""
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in df.to_numpy(dtype=object).tolist()]
+
+
+def transform_frame(df):
+    """
+    Bản vectorized của process_row / transform_row cho cả DataFrame staging (nên tạo với dtype=object).
+    Giá trị None được coi như key không có trong dòng, dòng có giá trị không phải chuỗi (kể cả NaN) chạy lại
+    process_row. Kết quả giống hệt chạy process_row từng dòng (trừ transformed_at).
+    Returns: (valid_df, error_df) theo thứ tự dòng của df, error_df có thêm error_message, retry_status
+    và giữ index là vị trí dòng trong df
+    """
+    error_columns = list(df.columns) + ["error_message", "retry_status"]
+    output_columns = [column for column, _ in _OUTPUT_COLUMNS]
+    df = df.reset_index(drop=True)
+    size = len(df)
+    if size == 0:
+        return pd.DataFrame(columns=output_columns), pd.DataFrame(columns=error_columns)
+
+    def column(name):
+        return df[name] if name in df.columns else pd.Series([None] * size, dtype=object)
+
+    # Lỗi của từng dòng: validate trước, sau đó là lỗi của bước đầu tiên bị lỗi
+    error = np.full(size, None, dtype=object)
+    has_error = np.zeros(size, dtype=bool)
+    # Dòng có giá trị không phải chuỗi / None chạy lại process_row (xem _factorize)
+    fallback = np.zeros(size, dtype=bool)
+    for field in REQUIRED_FIELDS:
+        codes, uniques, odd = _factorize(column(field))
+        has_error |= ~uniques.map(bool).to_numpy(dtype=bool)[codes]
+        fallback |= odd
+    error[has_error] = "Thiếu các trường bắt buộc"
+
+    cleaned = {}
+    area = None
+    for source, vectorized, cleaner, output in _STEPS:
+        codes, uniques, odd = _factorize(column(source))
+        fallback |= odd
+
+        if source == 'price':
+            # Giá phụ thuộc diện tích nên tính theo dòng
+            area_codes, area_values = area
+            area_m2 = np.array([np.nan if value is None else value for value in area_values], dtype=float)[area_codes]
+            area_missing = np.array([value is None for value in area_values], dtype=bool)[area_codes]
+            values, suspect = _clean_price(uniques, codes, area_m2, area_missing)
+            prices = uniques.to_numpy(dtype=object)[codes]
+            rows = {index: (prices[index], area_values[area_codes[index]]) for index in np.flatnonzero(suspect)}
+            values, errors = _resolve(rows, values, suspect, lambda pair: cleaner(*pair))
+            codes = np.arange(size)
+        else:
+            values, suspect = vectorized(uniques)
+            values, errors = _resolve(uniques.tolist(), values, suspect, cleaner)
+        if source == 'area':
+            area = (codes, values)
+
+        errors = _object_array(errors)
+        step_error = (errors != None)[codes] & ~has_error  # noqa: E711
+        error[step_error] = errors[codes][step_error]
+        has_error |= step_error
+
+        if isinstance(output, dict):
+            for column_name, key in output.items():
+                cleaned[column_name] = _object_array([value[key] if value else None for value in values])[codes]
+        else:
+            cleaned[output] = _object_array(values)[codes]
+
+    for column_name, source in _OUTPUT_COLUMNS:
+        if source is not None:
+            cleaned[column_name] = column(source).to_numpy(dtype=object).copy()
+    cleaned['transformed_at'] = np.full(size, datetime.now(timezone.utc).isoformat(), dtype=object)
+
+    # Dòng bị đánh dấu: chạy lại bản scalar để có đúng giá trị / thông báo lỗi
+    for index, row in zip(np.flatnonzero(fallback), _records(df[fallback])):
+        ok, result = process_row(row)
+        has_error[index] = not ok
+        if ok:
+            for key, value in result.items():
+                cleaned[key][index] = value
+        else:
+            error[index] = result["error_message"]
+
+    valid = ~has_error
+    valid_df = pd.DataFrame({column_name: cleaned[column_name][valid] for column_name in output_columns})
+    error_df = df[has_error].astype(object)
+    error_df["error_message"] = error[has_error]
+    error_df["retry_status"] = "pending"
+    return valid_df, error_df
@@ -1,68 +1,150 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from transformators import Transformators
-from utils import get_newest_data, update_last_processed, deduplicate_latest
+from engine import collect_rows, submit_rows, transform_pool
+from utils import iter_newest_data, update_last_processed, deduplicate_latest
 import sys
-from validator import validate
+from config import TransformConfig
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 SRC_DIR = BASE_DIR / "src"
 if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
-    
+
 from load.supabase_class import SupabaseManager
 from load.load_silver import load_to_silver
 
 logger = logging.getLogger(__name__)
 
-def main():
-    supabase = SupabaseManager(default_schema="silver")
-    # Read data from staging
-    data = get_newest_data(supabase, "get_last_transform_date")
-    
-    if not data:
-        logger.info("Không có dữ liệu mới để xử lý")
+
+def parse_created_at(row):
+    created_at_str = row.get("created_at")
+    if not created_at_str:
+        logger.warning("Bản ghi thiếu trường created_at, bỏ qua cập nhật thời gian")
         return None
-    
-    # Khởi tạo ngày rất bé (mục tiêu để tìm ra ngày mới nhất ở dưới)
-    last_processed_date = datetime(1000, 1, 1)
-    
-    valid_rows = []
-    error_rows = []
-
-    for row in data:
-        if validate(row):
-            try:
-                clean_row = Transformators.transform_row(row)
-                valid_rows.append(clean_row)
-            except Exception as e:
-                error_rows.append({**row, "error_message": str(e), "retry_status": "pending"})
-        else:
-            error_rows.append({**row, "error_message": "Thiếu các trường bắt buộc", "retry_status": "pending"})
-
-        created_at_str = row.get("created_at")
-        if created_at_str:
-            normalized_created_at = created_at_str.replace("Z", "+00:00")
-            try:
-                created_at_dt = datetime.fromisoformat(normalized_created_at)
-                last_processed_date = max(last_processed_date, created_at_dt)
-            except ValueError:
-                logger.warning("Không parse được created_at '%s'", created_at_str)
-        else:
-            logger.warning("Bản ghi thiếu trường created_at, bỏ qua cập nhật thời gian")
-    
-    
-    valid_rows = deduplicate_latest(valid_rows, id_field="subpage_url")
-
-    # Save data to silver (cơ chế upsert từ staging sang silver)
-    load_to_silver(supabase, valid_rows, error_rows, on_conflict="subpage_url")
-    logger.info(f"Đã xử lý {len(valid_rows)} dữ liệu hợp lệ và {len(error_rows)} dữ liệu lỗi")
-
-    # Cập nhật ngày mới nhất
-    update_last_processed(supabase, last_processed_date)
-    logger.info(f"Đã cập nhật ngày mới nhất: {last_processed_date}")
+    try:
+        return datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning("Không parse được created_at '%s'", created_at_str)
+        return None
+
+
+def transform_chunk(data, pending=None):
+    """
+    Transform 1 chunk staging, trả về (valid_rows, error_rows, created_at của từng dòng)
+    pending: kết quả submit_rows(data, pool) nếu chunk đã được gửi lên process pool từ trước
+    """
+    valid_rows, error_rows = collect_rows(pending or submit_rows(data))
+    created_dates = [date for date in map(parse_created_at, data) if date is not None]
+    return valid_rows, error_rows, created_dates
+
+
+def chunk_watermark(created_dates, next_chunk):
+    """
+    Ngày mới nhất có thể lưu vào last_transform_date sau khi xử lý xong 1 chunk.
+    Các dòng cùng created_at với dòng đầu chunk sau chưa được xử lý hết nên watermark phải nhỏ hơn ngày đó,
+    nếu không lần chạy sau (lọc created_at > watermark) sẽ bỏ sót chúng.
+    """
+    if next_chunk:
+        boundary = parse_created_at(next_chunk[0])
+        if boundary is not None:
+            created_dates = [date for date in created_dates if date < boundary]
+    return max(created_dates, default=None)
+
+
+def next_chunk(chunks):
+    """
+    Đọc chunk tiếp theo, trả về (chunk, read_failed). chunk là None khi hết dữ liệu hoặc đọc lỗi
+    (lỗi query staging được log ở đây thay vì làm dừng main)
+    """
+    try:
+        return next(chunks, None), False
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy dữ liệu mới: {str(e)}")
+        return None, True
+
+
+def split_error_rows(error_rows, watermark):
+    """
+    Tách error_rows thành (dòng ghi vào error_table ngay, dòng để lại cho chunk sau).
+    Dòng có created_at > watermark sẽ được đọc lại nếu lần chạy này dừng trước khi watermark vượt qua nó,
+    nên chỉ ghi cùng chunk có watermark bao được nó để error_table không bị ghi trùng
+    """
+    ready, carried = [], []
+    for row in error_rows:
+        created_at = row.get("created_at")
+        if not created_at:
+            ready.append(row)
+            continue
+        try:
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            ready.append(row)
+            continue
+        (ready if watermark is not None and created_at <= watermark else carried).append(row)
+    return ready, carried
+
+
+def main(chunk_size: int = TransformConfig.CHUNK_SIZE):
+    supabase = SupabaseManager(default_schema="silver")
+    # Đọc staging theo từng chunk chunk_size dòng (created_at, id tăng dần)
+    chunks = iter_newest_data(supabase, "get_last_transform_date", chunk_size=chunk_size)
+
+    total_valid = 0
+    total_error = 0
+    chunk_count = 0
+    # Dòng lỗi ở ranh giới chunk chưa nằm trong watermark, ghi cùng chunk sau
+    carried_errors = []
+
+    # 1 thread đọc trước chunk tiếp theo trong lúc transform / upsert chunk hiện tại,
+    # transform chạy song song trên process pool (TransformConfig.WORKERS)
+    with ThreadPoolExecutor(max_workers=1) as reader, transform_pool() as pool:
+        data, read_failed = next_chunk(chunks)
+        if not data:
+            if not read_failed:
+                logger.info("Không có dữ liệu mới để xử lý")
+            return None
+        pending = submit_rows(data, pool)
+
+        while data:
+            prefetch = reader.submit(next_chunk, chunks) if TransformConfig.PREFETCH else None
+            chunk_count += 1
+
+            valid_rows, error_rows, created_dates = transform_chunk(data, pending)
+            next_data, read_failed = prefetch.result() if prefetch is not None else next_chunk(chunks)
+            # Gửi chunk tiếp theo lên pool trước khi upsert chunk hiện tại để pool không rảnh giữa 2 chunk
+            next_pending = submit_rows(next_data, pool) if next_data else None
+            valid_rows = deduplicate_latest(valid_rows, id_field="subpage_url")
+
+            # Đọc lỗi giữa chừng: các dòng cùng created_at với dòng cuối có thể chưa đọc hết,
+            # nên coi dòng cuối là ranh giới để lần chạy sau đọc lại từ đó
+            boundary = next_data or (data[-1:] if read_failed else None)
+            last_processed_date = chunk_watermark(created_dates, boundary)
+            error_rows = carried_errors + error_rows
+            carried_errors = []
+            if boundary:
+                error_rows, carried_errors = split_error_rows(error_rows, last_processed_date)
+
+            # Save data to silver (cơ chế upsert từ staging sang silver)
+            if not load_to_silver(supabase, valid_rows, error_rows, on_conflict="subpage_url"):
+                logger.error(f"Chunk {chunk_count}: không ghi được dữ liệu lỗi, dừng và giữ nguyên ngày mới nhất")
+                return None
+            total_valid += len(valid_rows)
+            total_error += len(error_rows)
+            logger.info(f"Chunk {chunk_count}: {len(valid_rows)} dữ liệu hợp lệ, {len(error_rows)} dữ liệu lỗi")
+
+            # Cập nhật ngày mới nhất sau khi đã ghi dữ liệu lỗi của chunk: lỗi ở chunk sau
+            # chỉ phải xử lý lại từ chunk đó
+            if last_processed_date is not None:
+                update_last_processed(supabase, last_processed_date)
+                logger.info(f"Đã cập nhật ngày mới nhất: {last_processed_date}")
+            data, pending = next_data, next_pending
+
+    if read_failed:
+        logger.error(f"Dừng sau {chunk_count} chunk do lỗi đọc staging, lần chạy sau xử lý tiếp")
+    logger.info(f"Đã xử lý {total_valid} dữ liệu hợp lệ và {total_error} dữ liệu lỗi trong {chunk_count} chunk")
     return None
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
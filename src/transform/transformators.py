@@ -82,6 +82,20 @@ class Transformators:
         'sap trien khai'
     ]
 
+    # Từ khóa nhận diện giấy tờ pháp lý (clean_legal) và nội thất (clean_furniture), dùng chung với engine.transform_frame
+    LEGAL_KEYWORDS = {
+        'have_red_book': ['sổ đỏ', 'so do'],
+        'have_pink_book': ['sổ hồng', 'so hong'],
+        'have_sale_contract': ['hợp đồng mua bán', 'hop dong mua ban', 'hđmb', 'hdmb'],
+        'have_agreement_document': ['văn bản', 'van ban', 'vbtt'],
+    }
+
+    FURNITURE_KEYWORDS = {
+        'full': ['đầy đủ', 'full', 'hoàn thiện'],
+        'basic': ['cơ bản', 'basic', 'đơn giản'],
+        'premium': ['cao cấp', 'sang trọng', 'premium', 'luxury'],
+    }
+
     def __init__(self):
         pass
     
@@ -279,25 +293,11 @@ class Transformators:
         
         has_any_legal = 0
         
-        # Kiểm tra sổ đỏ
-        if any(keyword in legal for keyword in ['sổ đỏ', 'so do']):
-            result['have_red_book'] = 1
-            has_any_legal = 1
-      
-        # Kiểm tra sổ hồng
-        if any(keyword in legal for keyword in ['sổ hồng', 'so hong']):
-            result['have_pink_book'] = 1
-            has_any_legal = 1
-            
-        # Kiểm tra hợp đồng mua bán
-        if any(keyword in legal for keyword in ['hợp đồng mua bán', 'hop dong mua ban', 'hđmb', 'hdmb']):
-            result['have_sale_contract'] = 1
-            has_any_legal = 1
-            
-        # Kiểm tra văn bản thỏa thuận
-        if any(keyword in legal for keyword in ['văn bản', 'van ban', 'vbtt']):
-            result['have_agreement_document'] = 1
-            has_any_legal = 1
+        # Kiểm tra sổ đỏ, sổ hồng, hợp đồng mua bán, văn bản thỏa thuận
+        for column, keywords in Transformators.LEGAL_KEYWORDS.items():
+            if any(keyword in legal for keyword in keywords):
+                result[column] = 1
+                has_any_legal = 1
         
         # Đánh dấu lỗi nếu không có loại giấy tờ nào
         if not has_any_legal:
@@ -327,9 +327,9 @@ class Transformators:
         has_premium_furniture = 0
         
         # Kiểm tra đầy đủ nội thất
-        if any(keyword in furniture for keyword in ['đầy đủ', 'full', 'hoàn thiện']):
+        if any(keyword in furniture for keyword in Transformators.FURNITURE_KEYWORDS['full']):
             has_full_furniture = 1
-        if any(keyword in furniture for keyword in ['cơ bản', 'basic', 'đơn giản']):
+        if any(keyword in furniture for keyword in Transformators.FURNITURE_KEYWORDS['basic']):
             has_basic_furniture = 1
         
         if has_full_furniture == 1 and has_basic_furniture == 1: # TH này là "đầy đủ nội thất cơ bản"
@@ -340,7 +340,7 @@ class Transformators:
             result['furniture_type'] = 'basic'
             
         # Có nội thất cao cấp không
-        if any(keyword in furniture for keyword in ['cao cấp', 'sang trọng', 'premium', 'luxury']):
+        if any(keyword in furniture for keyword in Transformators.FURNITURE_KEYWORDS['premium']):
             result['has_premium_furniture'] = 1
             has_premium_furniture = 1
         else:
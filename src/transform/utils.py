@@ -3,20 +3,34 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-def get_newest_data(supabase, function_name: str):
-    # B1: Lấy ra ngày cuối cùng đã xử lý 
+def iter_newest_data(supabase, function_name: str, page_size: int = None, chunk_size: int = None):
+    """
+    Generator các trang dữ liệu staging mới hơn last_transform_date (created_at, id tăng dần)
+    để xử lý từng phần, không cần giữ toàn bộ dữ liệu trong bộ nhớ.
+    chunk_size: gộp các trang liên tiếp thành chunk ít nhất chunk_size dòng (mỗi trang bị giới hạn bởi
+    max-rows của PostgREST). Lỗi đọc trang được raise từ generator, người gọi tự log
+    """
     last_processed_date = supabase.call_rpc_function(function_name=function_name)
-    if last_processed_date["success"]:
-        # B2: Lấy ra dữ liệu mới nhất từ staging
-        newest_data = supabase.query_with_conditions(table="staging", conditions={"created_at": {"gt": last_processed_date["data"]}}, schema="bronze")
-        if newest_data["success"]:
-            return newest_data["data"]
-        else:
-            logger.error(f"Lỗi khi lấy dữ liệu mới: {newest_data['error']}")
-            return None
-    else:
+    if not last_processed_date["success"]:
         logger.error(f"Lỗi khi lấy ngày cuối cùng đã xử lý: {last_processed_date['error']}")
-        return None
+        return
+    pages = supabase.iter_query_pages(
+        table="staging",
+        conditions={"created_at": {"gt": last_processed_date["data"]}},
+        page_size=page_size,
+        schema="bronze",
+    )
+    if not chunk_size:
+        yield from pages
+        return
+    chunk = []
+    for page in pages:
+        chunk.extend(page)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 def update_last_processed(supabase, last_processed_date):
     # Chuyển datetime thành string ISO format
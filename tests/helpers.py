@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+# Module phẳng trùng tên (config, utils) của từng package đã import, để khi quay lại package đó
+# các module khác (VD: errors) và test vẫn dùng chung 1 object CrawlConfig
+_saved_modules = {}
+
+
+def use_src(package: str) -> None:
+    """
+    Đưa src/<package> lên đầu sys.path như khi chạy script trong thư mục đó.
+    src/extract và src/transform dùng chung tên module phẳng (config, utils) nên module cùng tên
+    của package khác được cất đi và module của package này (nếu đã import trước đó) được đặt lại
+    """
+    package_dir = SRC_DIR / package
+    if str(package_dir) in sys.path:
+        sys.path.remove(str(package_dir))
+    sys.path.insert(0, str(package_dir))
+    for path in package_dir.glob("*.py"):
+        module = sys.modules.get(path.stem)
+        module_file = getattr(module, "__file__", None)
+        if module is not None and (module_file is None or Path(module_file).parent != package_dir):
+            if module_file is not None:
+                _saved_modules.setdefault(Path(module_file).parent.name, {})[path.stem] = module
+            del sys.modules[path.stem]
+    sys.modules.update(_saved_modules.pop(package, {}))
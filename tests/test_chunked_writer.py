@@ -0,0 +1,54 @@
+import csv
+
+from helpers import use_src
+
+use_src("extract")
+
+from utils import ChunkedCsvWriter  # noqa: E402
+
+
+def read_urls(path):
+    with path.open("r", newline="", encoding="utf-8-sig") as csvfile:
+        return [row["subpage_url"] for row in csv.DictReader(csvfile)]
+
+
+def test_rollover_moves_full_chunks_out_of_inprogress(tmp_path):
+    finalized = []
+    writer = ChunkedCsvWriter(tmp_path, chunk_size=2)
+    writer.on_chunk = finalized.append
+
+    for index in range(3):
+        writer.write("https://x/p1", {"url": f"https://x/a-pr{index}", "title": "t"})
+    # Chunk đầy được chuyển ngay, chunk đang ghi vẫn nằm trong .inprogress
+    assert finalized == writer.finalized_files
+    assert len(finalized) == 1
+    assert len(list(writer.tmp_dir.glob("*.csv"))) == 1
+
+    writer.close()
+    assert len(finalized) == 2
+    assert list(writer.tmp_dir.iterdir()) == []
+    assert [path.parent for path in finalized] == [tmp_path, tmp_path]
+    assert read_urls(finalized[0]) == ["https://x/a-pr0", "https://x/a-pr1"]
+    assert read_urls(finalized[1]) == ["https://x/a-pr2"]
+    assert writer.total_rows == 3
+
+
+def test_close_without_rows_writes_nothing(tmp_path):
+    with ChunkedCsvWriter(tmp_path, chunk_size=2) as writer:
+        pass
+    assert writer.finalized_files == []
+    assert list(tmp_path.glob("*.csv")) == []
+
+
+def test_orphans_of_same_prefix_are_recovered(tmp_path):
+    tmp_dir = tmp_path / ".inprogress"
+    tmp_dir.mkdir()
+    (tmp_dir / "batdongsan_raw_20240101_000000_chunk_01.csv").write_text("subpage_url\nhttps://x/a-pr1\n")
+    # File của writer khác (prefix khác) đang ghi chung .inprogress thì không được động vào
+    (tmp_dir / "batdongsan_seen_p1-2_20240101_000000_chunk_01.csv").write_text("url\n")
+
+    writer = ChunkedCsvWriter(tmp_path, chunk_size=2)
+    recovered = tmp_path / f"batdongsan_raw_{writer.timestamp}_recovered_01.csv"
+
+    assert read_urls(recovered) == ["https://x/a-pr1"]
+    assert [path.name for path in tmp_dir.iterdir()] == ["batdongsan_seen_p1-2_20240101_000000_chunk_01.csv"]
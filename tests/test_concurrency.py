@@ -0,0 +1,88 @@
+import asyncio
+
+from helpers import use_src
+
+use_src("extract")
+
+from concurrency import AdaptiveLimiter  # noqa: E402
+from errors import BLOCKED, NAVIGATION_TIMEOUT, PARTIAL_RENDER  # noqa: E402
+
+
+def make_limiter(**kwargs):
+    options = dict(initial_limit=4, min_limit=1, max_limit=8, latency_target=10, error_rate_threshold=0.5)
+    options.update(kwargs)
+    return AdaptiveLimiter(**options)
+
+
+def complete_window(limiter, latency, error=None):
+    # Giả lập limiter đang dùng hết slot để được phép tăng
+    limiter._active = limiter.limit
+    for _ in range(limiter.limit):
+        limiter._complete(latency, error)
+    limiter._active = 0
+
+
+def test_increase_when_window_is_healthy():
+    limiter = make_limiter()
+    complete_window(limiter, 1.0)
+    assert limiter.limit == 5
+    assert limiter.counters["increase"] == 1
+
+
+def test_decrease_on_slow_window_and_backoff_error():
+    limiter = make_limiter()
+    complete_window(limiter, 30.0)
+    assert limiter.limit == 2
+
+    # 1 đợt lỗi chỉ giảm 1 lần mỗi `limit` listing
+    limiter = make_limiter()
+    limits = []
+    for _ in range(6):
+        limiter._complete(1.0, NAVIGATION_TIMEOUT)
+        limits.append(limiter.limit)
+    assert limits == [4, 4, 2, 2, 1, 1]
+
+
+def test_blocked_is_left_to_rate_limiter_cooldown():
+    limiter = make_limiter()
+    complete_window(limiter, 1.0, BLOCKED)
+    assert limiter.limit == 5
+    assert limiter.counters["errors"] == 4
+    assert limiter.counters["decrease"] == 0
+
+
+def test_error_rate_decrease_but_partial_render_is_not_backoff():
+    limiter = make_limiter()
+    limiter._complete(1.0, PARTIAL_RENDER)
+    assert limiter.limit == 4
+    complete_window(limiter, 1.0, PARTIAL_RENDER)
+    assert limiter.limit == 2
+
+
+def test_limit_is_capped_by_rate_times_latency():
+    limiter = make_limiter(initial_limit=8, max_limit=32, rate_limit_rps=3)
+    complete_window(limiter, 1.0)
+    assert limiter.limit == 3
+
+    # Không tăng vượt cap dù latency/lỗi đều ổn
+    complete_window(limiter, 1.0)
+    assert limiter.limit == 3
+    complete_window(limiter, 2.0)
+    assert limiter.limit == 4
+
+
+def test_token_wait_is_not_latency():
+    limiter = make_limiter(initial_limit=2, min_limit=1, rate_limit_rps=10)
+
+    async def listing():
+        async with limiter:
+            await asyncio.sleep(0.3)
+            limiter.exclude_wait(0.3)
+
+    async def run():
+        await asyncio.gather(listing(), listing())
+
+    asyncio.run(run())
+    # p50 ~ 0 sau khi trừ thời gian chờ token nên cap = min_limit; tính cả 0.3s chờ thì cap sẽ là 3
+    assert limiter.limit == 1
+    assert limiter.counters["completed"] == 2
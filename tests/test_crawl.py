@@ -0,0 +1,151 @@
+import asyncio
+
+from helpers import use_src
+
+use_src("extract")
+
+import crawl  # noqa: E402
+from concurrency import AdaptiveLimiter  # noqa: E402
+from errors import BlockedPageError  # noqa: E402
+
+
+class FakeRateLimiter:
+    def __init__(self):
+        self.cooldowns = []
+        self.acquired = []
+
+    async def acquire(self, url):
+        self.acquired.append(url)
+        return 0.0
+
+    def cooldown(self, url, reason="", seconds=None):
+        self.cooldowns.append(url)
+
+
+class FakeTabPool:
+    def __init__(self, rate_limiter=None):
+        self.rate_limiter = rate_limiter
+        self.tokens_at_acquire = []
+
+    async def acquire(self):
+        if self.rate_limiter is not None:
+            self.tokens_at_acquire.append(len(self.rate_limiter.acquired))
+        return object()
+
+    async def navigate(self, tab, url):
+        return tab
+
+    async def release(self, tab, discard=False):
+        return None
+
+
+def make_limiter():
+    return AdaptiveLimiter(initial_limit=4, min_limit=1, max_limit=8, latency_target=60, error_rate_threshold=0.5)
+
+
+def test_http_block_with_browser_success_does_not_back_off(monkeypatch):
+    async def blocked_fetch(client, url, rate_limiter=None, known_fingerprint=None):
+        raise BlockedPageError(url, 403)
+
+    async def browser_extract(page, rate_limiter=None, known_fingerprint=None, url=None):
+        return {"title": "t"}
+
+    monkeypatch.setattr(crawl, "fetch_listing_http", blocked_fetch)
+    monkeypatch.setattr(crawl, "extract_data_from_page", browser_extract)
+    limiter = make_limiter()
+    rate_limiter = FakeRateLimiter()
+
+    async def run():
+        return await asyncio.gather(*(
+            crawl.scrape_subpage("https://x/p1", f"https://x/a-pr{index}", limiter, FakeTabPool(),
+                                 http_client=object(), rate_limiter=rate_limiter)
+            for index in range(10)
+        ))
+
+    items = asyncio.run(run())
+    assert all("error" not in item for item in items)
+    assert limiter.limit == 4
+    assert limiter.counters["errors"] == 0
+    assert limiter.counters["decrease"] == 0
+    # Bị chặn ở HTTP không được làm cả host dừng RATE_LIMIT_COOLDOWN giây
+    assert rate_limiter.cooldowns == []
+    # 1 token cho HTTP, 1 token cho browser
+    assert len(rate_limiter.acquired) == 20
+
+
+def test_token_is_taken_before_tab(monkeypatch):
+    async def no_http(client, url, rate_limiter=None, known_fingerprint=None):
+        return None
+
+    async def browser_extract(page, rate_limiter=None, known_fingerprint=None, url=None):
+        return {"title": "t"}
+
+    monkeypatch.setattr(crawl, "fetch_listing_http", no_http)
+    monkeypatch.setattr(crawl, "extract_data_from_page", browser_extract)
+    rate_limiter = FakeRateLimiter()
+    tab_pool = FakeTabPool(rate_limiter)
+
+    asyncio.run(crawl.scrape_subpage("https://x/p1", "https://x/a-pr1", make_limiter(), tab_pool,
+                                     http_client=object(), rate_limiter=rate_limiter))
+    # Token của HTTP và của browser đều đã lấy trước khi lấy tab
+    assert tab_pool.tokens_at_acquire == [2]
+
+
+def test_browser_block_cools_down_without_decrease(monkeypatch):
+    async def blocked_fetch(client, url, rate_limiter=None, known_fingerprint=None):
+        raise BlockedPageError(url, 403)
+
+    async def blocked_extract(page, rate_limiter=None, known_fingerprint=None, url=None):
+        raise BlockedPageError("https://x/a-pr0", 200)
+
+    monkeypatch.setattr(crawl, "fetch_listing_http", blocked_fetch)
+    monkeypatch.setattr(crawl, "extract_data_from_page", blocked_extract)
+    limiter = make_limiter()
+    rate_limiter = FakeRateLimiter()
+
+    async def run():
+        return await asyncio.gather(*(
+            crawl.scrape_subpage("https://x/p1", f"https://x/a-pr{index}", limiter, FakeTabPool(),
+                                 http_client=object(), rate_limiter=rate_limiter)
+            for index in range(10)
+        ))
+
+    items = asyncio.run(run())
+    assert all(item["error"] == "blocked" for item in items)
+    assert limiter.counters["errors"] == 10
+    # Trang chặn chỉ cooldown cả host, không giảm concurrency lần nữa
+    assert limiter.limit == 4
+    assert limiter.counters["decrease"] == 0
+    assert len(rate_limiter.cooldowns) == 10
+
+
+class StalePage:
+    """Tab dùng lại: page.url vẫn là tin trước"""
+    url = "https://x/ban-nha-rieng-pr999"
+
+
+def test_seen_again_uses_requested_url(monkeypatch):
+    parts = {"specs_text": "Diện tích 75 m²", "title": "t", "price": "5 tỷ"}
+
+    async def ready(page, selector, timeout):
+        return True
+
+    async def fingerprint_parts(page):
+        return parts
+
+    monkeypatch.setattr(crawl, "wait_for_selector", ready)
+    monkeypatch.setattr(crawl, "extract_page_fingerprint_parts", fingerprint_parts)
+    monkeypatch.setattr(crawl.CrawlConfig, "FINGERPRINT_PRECHECK", True)
+    known = crawl.page_fingerprint(parts)
+
+    item = asyncio.run(crawl.extract_data_from_page(StalePage(), known_fingerprint=known, url="https://x/ban-nha-rieng-pr123"))
+    assert item["url"] == "https://x/ban-nha-rieng-pr123"
+    assert item["post_id"] == "123"
+    assert item["unchanged"]
+
+
+def test_main_page_url_uses_given_base_url():
+    assert crawl.main_page_url("/ban-nha-rieng?gcn=5-ty", 2, "http://127.0.0.1:8000") == (
+        "http://127.0.0.1:8000/ban-nha-rieng/p2?gcn=5-ty"
+    )
+    assert crawl.main_page_url("/nha-dat-ban", 1).startswith(crawl.CrawlConfig.BASE_URL)
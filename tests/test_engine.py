@@ -0,0 +1,195 @@
+import math
+import random
+from concurrent.futures import Future
+
+from helpers import use_src
+
+use_src("transform")
+
+import engine  # noqa: E402
+
+# Mảnh để ghép giá trị ngẫu nhiên: đúng định dạng, gần đúng và rác
+NUMBERS = ["0", "5", "12", "1.234", "3,5", "0,005", "2.675", "1.2.3", "nan", "inf", "-3", "1e3", "٣", "9" * 40, "..."]
+UNITS = {
+    "area": ["m²", "m2", "M²", " m²", ""],
+    "price": ["tỷ", "Tỷ", "triệu", "triệu/m²", "triệu / m²", "thỏa thuận", "Thoa thuan", ""],
+    "facade": ["m", "M", " m", ""],
+    "way_in": ["m", "mét", '"', "'", ""],
+    "number": ["phòng", "tầng", "+ phòng", ""],
+}
+TEXTS = {
+    "address": [
+        "Đường ABC, Phường 11, Quận 1, Hồ Chí Minh", "Nhà An Khê, Lỗ Khê, Liên Hà, Đông Anh, Hà Nội",
+        "Liên Hà, Đông Anh, TP. Hà Nội", "a, b", "x, Quận 3, 123", "P7, Q2, Tỉnh Bình Dương", "  ",
+    ],
+    "direction": ["Đông - Nam", "tây  -  bắc", "Nam", " đông bắc ", "-", "BẮC", "đông\t-\tnam"],
+    "legal": ["Sổ đỏ/ Sổ hồng", "Hợp đồng mua bán", "HĐMB", "Đang chờ sổ", "văn bản thỏa thuận", "so do, vbtt"],
+    "furniture": ["Đầy đủ", "Cơ bản", "Đầy đủ nội thất cơ bản", "Cao cấp", "không", "FULL luxury"],
+    "project": ["  vinhomes   grand park ", "ABC xyz", "tập đoàn  vingroup", "   "],
+    "project_status": ["Đã bàn giao", "đang mở bán", "Dự kiến 2025", "(blank)", "sắp bàn giao", "xyz"],
+    "date": ["01/01/2024", "2024-01-05", "2024-01-05T10:00:00Z", "32/01/2024", "1/2/2024", "hôm nay"],
+    "main_page_url": ["https://batdongsan.com.vn/nha-dat-ban/p{n}", "https://x/nha-dat-ban", "/p", "/p{n}x"],
+    "subpage_url": [
+        "https://batdongsan.com.vn/ban-can-ho-chung-cu-x/a-pr{n}", "https://batdongsan.com.vn/BAN-NHA-RIENG-x-pr{n}",
+        "https://x/ban-dat-nen-ban-dat-xa", "https://x/khac-{n}", "https://x/ban-condotel-{n}",
+    ],
+}
+# Giá trị đúng định dạng cho nửa số dòng, để phần lớn các dòng đó hợp lệ
+WELL_FORMED = {
+    "main_page_url": ["https://batdongsan.com.vn/nha-dat-ban/p3", "https://batdongsan.com.vn/nha-dat-ban/p12"],
+    "subpage_url": ["https://batdongsan.com.vn/ban-can-ho-chung-cu-x/a-pr1", "https://x/ban-nha-rieng-x-pr2"],
+    "address": TEXTS["address"][:3],
+    "area": ["75 m²", "1.234,5 m²", "50m2", "0,005 m²", " 12 M²", "nan", "33,335 m²"],
+    "price": ["5,2 tỷ", "120 triệu/m²", "Thỏa thuận", "850 triệu", "2.675 tỷ", "0,285 triệu/m²", "3.5 Tỷ"],
+    "facade": ["5 m", "5,5m", "10", "", None],
+    "way_in": ["6 m", "'4,5' m", "", None],
+    "number_bedroom": ["3 phòng", "10+ phòng", None],
+    "legal": ["Sổ đỏ/ Sổ hồng", "Hợp đồng mua bán", "so do, vbtt", None],
+    "furniture": ["Đầy đủ", "Cơ bản", "FULL luxury", None],
+}
+
+# Giá trị không phải chuỗi (dòng chạy lại process_row) nên để ít để phần lớn dòng đi qua bản vectorized
+ODD_VALUES = [0, 7, 1.5, True, float("nan")]
+
+
+def random_measure(rng, units):
+    return f"{rng.choice(['', ' '])}{rng.choice(NUMBERS)}{rng.choice(['', ' '])}{rng.choice(units)}"
+
+
+def random_value(rng, field, well_formed=False):
+    if well_formed and field in WELL_FORMED:
+        return rng.choice(WELL_FORMED[field])
+    if well_formed and field in ("post_start_time", "post_end_time"):
+        return rng.choice(["01/01/2024", "1/2/2024"])
+    if well_formed and field == "number_floor":
+        return rng.choice(["5 tầng", None])
+    if rng.random() < 0.06:
+        return rng.choice([None, "", " "])
+    if rng.random() < 0.003:
+        return rng.choice(ODD_VALUES)
+    if field in ("area", "price", "facade", "way_in"):
+        return random_measure(rng, UNITS[field])
+    if field in ("number_bedroom", "number_bathroom", "number_floor"):
+        return random_measure(rng, UNITS["number"])
+    if field in ("house_direction", "balcony_direction"):
+        return rng.choice(TEXTS["direction"])
+    if field in ("project_name", "project_investor"):
+        return rng.choice(TEXTS["project"])
+    if field in ("post_start_time", "post_end_time"):
+        return rng.choice(TEXTS["date"])
+    if field in TEXTS:
+        return rng.choice(TEXTS[field]).format(n=rng.randrange(100))
+    return f"{field}-{rng.randrange(50)}"
+
+
+FIELDS = [
+    "main_page_url", "subpage_url", "title", "address", "area", "price", "house_direction", "balcony_direction",
+    "facade", "legal", "furniture", "number_bedroom", "number_bathroom", "number_floor", "way_in", "project_name",
+    "project_status", "project_investor", "post_id", "post_start_time", "post_end_time", "post_type", "source",
+]
+
+
+def random_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        if rng.random() < 0.5:
+            row = {field: random_value(rng, field, well_formed=True) for field in FIELDS}
+        else:
+            row = {field: random_value(rng, field) for field in FIELDS if rng.random() > 0.02}
+        row["created_at"] = f"2024-01-01T00:00:{index % 60:02d}+00:00"
+        row["id"] = index
+        rows.append(row)
+    return rows
+
+
+def same_value(left, right):
+    if isinstance(left, float) and isinstance(right, float) and math.isnan(left) and math.isnan(right):
+        return True
+    return type(left) is type(right) and left == right
+
+
+def assert_same_rows(expected, actual):
+    assert len(expected) == len(actual)
+    for left, right in zip(expected, actual):
+        left = {key: value for key, value in left.items() if key != "transformed_at"}
+        right = {key: value for key, value in right.items() if key != "transformed_at"}
+        assert list(left) == list(right)
+        mismatched = {key: (left[key], right[key]) for key in left if not same_value(left[key], right[key])}
+        assert not mismatched, mismatched
+
+
+def test_transform_frame_matches_process_row():
+    rows = random_rows(20000)
+    serial_valid, serial_error = engine.transform_rows(rows, vectorized=False)
+    frame_valid, frame_error = engine.transform_rows(rows, vectorized=True)
+
+    assert serial_valid and serial_error
+    assert_same_rows(serial_valid, frame_valid)
+    assert_same_rows(serial_error, frame_error)
+
+
+def test_nan_area_is_kept():
+    row = {
+        "main_page_url": "https://batdongsan.com.vn/nha-dat-ban/p2", "subpage_url": "https://x/ban-nha-rieng-pr1",
+        "title": "t", "address": "Đường ABC, Phường 11, Quận 1, Hồ Chí Minh", "area": "nan", "price": "5 tỷ",
+        "post_id": "1", "post_start_time": "01/01/2024", "post_end_time": "31/01/2024", "post_type": "VIP",
+    }
+    serial_valid, _ = engine.transform_rows([row], vectorized=False)
+    frame_valid, _ = engine._frame_batch([row])
+    assert math.isnan(serial_valid[0]["area_m2"])
+    assert_same_rows(serial_valid, frame_valid)
+
+
+def test_empty_batch():
+    assert engine.transform_rows([], vectorized=True) == ([], [])
+
+
+class InlinePool:
+    """Pool chạy batch ngay trong process hiện tại, ghi lại kích thước các batch và hàm được gọi"""
+
+    def __init__(self, workers):
+        self._max_workers = workers
+        self.batches = []
+        self.functions = set()
+
+    def submit(self, function, batch):
+        self.batches.append(len(batch))
+        self.functions.add(function)
+        future = Future()
+        future.set_result(function(batch))
+        return future
+
+
+def test_vectorized_chunk_is_not_split_below_frame_batch_size():
+    rows = random_rows(12000, seed=1)
+    pool = InlinePool(workers=8)
+    frame_valid, frame_error = engine.transform_rows(rows, pool=pool, vectorized=True)
+    serial_valid, serial_error = engine.transform_rows(rows, vectorized=False)
+
+    # 12000 dòng chỉ đủ 2 frame >= FRAME_BATCH_SIZE dù pool có 8 process
+    assert engine.TransformConfig.FRAME_BATCH_SIZE == 5000
+    assert pool.batches == [6000, 6000]
+    assert pool.functions == {engine._frame_batch}
+    assert_same_rows(serial_valid, frame_valid)
+    assert_same_rows(serial_error, frame_error)
+
+
+def test_batch_size_spreads_rows_over_workers():
+    pool = InlinePool(workers=4)
+    engine.submit_rows([{}] * 30000, pool=pool, vectorized=False)
+    assert pool.batches == [250] * 120
+    assert engine._batch_size(30000, 4, min_batch_size=5000) == 7500
+    assert engine._batch_size(4999, 4, min_batch_size=5000) == 4999
+
+
+def test_small_vectorized_chunk_is_transformed_row_by_row():
+    rows = random_rows(1000, seed=1)
+    pool = InlinePool(workers=8)
+    frame_valid, frame_error = engine.transform_rows(rows, pool=pool, vectorized=True)
+    serial_valid, serial_error = engine.transform_rows(rows, vectorized=False)
+
+    assert pool.batches == [125] * 8
+    assert pool.functions == {engine._process_batch}
+    assert_same_rows(serial_valid, frame_valid)
+    assert_same_rows(serial_error, frame_error)
@@ -0,0 +1,40 @@
+import asyncio
+
+from nodriver.core.connection import ProtocolException
+from websockets.exceptions import ConnectionClosed
+
+from helpers import use_src
+
+use_src("extract")
+
+import errors  # noqa: E402
+from config import CrawlConfig  # noqa: E402
+
+
+def test_classify_error():
+    assert errors.classify_error(errors.BlockedPageError("https://x/a", 429)) == errors.BLOCKED
+    assert errors.classify_error(errors.ListingNotFoundError("https://x/a", 404)) == errors.NOT_FOUND
+    assert errors.classify_error(errors.PartialRenderError("thiếu title", "https://x/a")) == errors.PARTIAL_RENDER
+    assert errors.classify_error(errors.BrowserDeadError("restart", "https://x/a")) == errors.BROWSER_DEAD
+    assert errors.classify_error(errors.ScrapeError("x", kind=errors.PROTOCOL)) == errors.PROTOCOL
+    assert errors.classify_error(asyncio.TimeoutError()) == errors.NAVIGATION_TIMEOUT
+    assert errors.classify_error(ConnectionResetError()) == errors.BROWSER_DEAD
+    assert errors.classify_error(ConnectionClosed(None, None)) == errors.BROWSER_DEAD
+    assert errors.classify_error(ProtocolException("Target closed")) == errors.PROTOCOL
+    assert errors.classify_error(ValueError("x")) == errors.UNEXPECTED
+
+
+def test_retry_budget_follows_policy():
+    assert errors.retry_budget(errors.NOT_FOUND) == 0
+    assert errors.retry_budget(errors.BLOCKED) == CrawlConfig.RETRY_POLICY[errors.BLOCKED]["retries"]
+    assert errors.retry_budget("unknown") == 0
+
+
+def test_retry_delay_doubles_with_jitter_and_cap(monkeypatch):
+    monkeypatch.setitem(CrawlConfig.RETRY_POLICY, "test", {"retries": 5, "backoff": 4.0})
+    monkeypatch.setattr(CrawlConfig, "RETRY_BACKOFF_MAX", 20.0)
+
+    for attempt, expected in [(1, 4.0), (2, 8.0), (3, 16.0), (4, 20.0), (10, 20.0)]:
+        delays = [errors.retry_delay("test", attempt) for _ in range(200)]
+        assert all(expected * 0.9 <= delay <= expected * 1.1 for delay in delays)
+    assert errors.retry_delay(errors.NOT_FOUND, 1) == 0.0
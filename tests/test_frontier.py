@@ -0,0 +1,46 @@
+from helpers import use_src
+
+use_src("extract")
+
+from frontier import UrlFrontier  # noqa: E402
+
+
+def test_resume_keeps_only_unfinished_subpages(tmp_path):
+    frontier = UrlFrontier(tmp_path / "frontier.sqlite")
+    assert frontier.add_subpages("https://x/p1", ["a", "b", "c", "d"]) == ["a", "b", "c", "d"]
+    # URL đã có không được đẩy lại
+    assert frontier.add_subpages("https://x/p2", ["a", "e"]) == ["e"]
+    frontier.mark_main_page_done("https://x/p1")
+    frontier.mark_done("a")
+    frontier.mark_failed("b", "blocked")
+    frontier.mark_failed("c", "not_found", permanent=True)
+    frontier.close()
+
+    resumed = UrlFrontier(tmp_path / "frontier.sqlite")
+    assert resumed.is_main_page_done("https://x/p1")
+    assert not resumed.is_main_page_done("https://x/p2")
+    assert resumed.unfinished_subpages() == [("https://x/p1", "b"), ("https://x/p1", "d"), ("https://x/p2", "e")]
+    assert resumed.stats() == {"done": 1, "failed": 1, "gone": 1, "pending": 2}
+    resumed.close()
+
+
+def test_unfinished_subpages_of_one_worker(tmp_path):
+    frontier = UrlFrontier(tmp_path / "frontier.sqlite")
+    frontier.add_subpages("https://x/p1", ["a"])
+    frontier.add_subpages("https://x/p2", ["b"])
+    assert frontier.unfinished_subpages(["https://x/p2"]) == [("https://x/p2", "b")]
+    frontier.close()
+
+
+def test_reset_and_last_page(tmp_path):
+    frontier = UrlFrontier(tmp_path / "frontier.sqlite")
+    frontier.add_subpages("https://x/p1", ["a"])
+    frontier.mark_main_page_done("https://x/p1", last=True)
+    assert frontier.main_page_state("https://x/p1") == UrlFrontier.LAST
+    assert frontier.is_main_page_done("https://x/p1")
+    frontier.close()
+
+    fresh = UrlFrontier(tmp_path / "frontier.sqlite", reset=True)
+    assert fresh.main_page_state("https://x/p1") is None
+    assert fresh.unfinished_subpages() == []
+    fresh.close()
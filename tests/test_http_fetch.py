@@ -0,0 +1,91 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from helpers import use_src
+
+use_src("extract")
+
+import http_fetch  # noqa: E402
+from errors import BlockedPageError  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def fixture(name):
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+class FakeResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeClient:
+    def __init__(self, status_code, text):
+        self.response = FakeResponse(status_code, text)
+
+    async def get(self, url):
+        return self.response
+
+
+def fetch(html, status_code=200):
+    return asyncio.run(http_fetch.fetch_listing_http(FakeClient(status_code, html), "https://x/ban-nha-rieng-pr41234567"))
+
+
+def test_parse_listing_without_project():
+    fields = http_fetch.parse_listing_html(fixture("listing_basic.html"))
+
+    assert fields["title"] == "Bán nhà riêng 4 tầng hẻm xe hơi Quận 1"
+    assert fields["address"] == "Đường ABC, Phường 11, Quận 1, Hồ Chí Minh"
+    assert fields["price"] == "5,2 tỷ"
+    assert fields["area"] == "75 m²"
+    assert fields["house_direction"] == "Đông - Nam"
+    assert fields["number_bathroom"] == "2 phòng"
+    assert fields["post_id"] == "41234567"
+    assert fields["post_end_time"] == "31/10/2026"
+    # Trường không có trên trang: specs/post_card/project_card là "", selector là None
+    assert fields["facade"] == ""
+    assert fields["project_status"] == ""
+    assert fields["project_name"] is None
+    assert http_fetch.missing_required_fields(fields) == []
+
+
+def test_parse_listing_with_project_block():
+    fields = http_fetch.parse_listing_html(fixture("listing_project.html"))
+
+    assert fields["project_name"] == "Vinhomes Grand Park"
+    assert fields["project_status"] == "Đã bàn giao"
+    assert fields["project_investor"] == "Tập đoàn Vingroup"
+
+
+def test_http_item_keeps_project_fields():
+    item = fetch(fixture("listing_project.html"))
+    assert item["project_investor"] == "Tập đoàn Vingroup"
+    assert item["url"] == "https://x/ban-nha-rieng-pr41234567"
+
+
+def test_listing_without_project_stays_on_http():
+    assert fetch(fixture("listing_basic.html"))["post_id"] == "41234567"
+
+
+def test_unrendered_project_block_falls_back_to_browser():
+    html = fixture("listing_project_lazy.html")
+    assert http_fetch.missing_lazy_fields(http_fetch.parse_listing_html(html), http_fetch.parse_html(html)) == [
+        "project_name", "project_status", "project_investor",
+    ]
+    assert fetch(html) is None
+
+
+def test_missing_required_field_falls_back_to_browser():
+    html = fixture("listing_basic.html").replace("re__pr-title pr-title js__pr-title", "re__pr-title")
+    assert fetch(html) is None
+
+
+def test_challenge_page_is_blocked():
+    with pytest.raises(BlockedPageError):
+        fetch("<html><head><title>Just a moment...</title></head></html>", status_code=200)
+    with pytest.raises(BlockedPageError):
+        fetch(fixture("listing_basic.html"), status_code=429)
@@ -0,0 +1,41 @@
+from helpers import use_src
+
+use_src("extract")
+
+from metrics import CrawlTracer, PhaseStats, percentile  # noqa: E402
+
+
+def test_percentile_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) is None
+
+
+def test_phase_stats_memory_is_bounded():
+    stats = PhaseStats(size=1000)
+    for value in range(100000):
+        stats.add(value / 1000)
+
+    assert len(stats.samples) == 1000
+    assert stats.count == 100000
+    assert stats.max == 99.999
+    assert round(stats.total, 3) == round(sum(value / 1000 for value in range(100000)), 3)
+    # Mẫu ngẫu nhiên đều trên cả lần chạy nên p50 gần giá trị thật (50s)
+    assert 45 < percentile(sorted(stats.samples), 0.5) < 55
+
+
+def test_tracer_summary_and_span_cap():
+    tracer = CrawlTracer(enabled=True, max_spans=10, reservoir_size=100)
+    for index in range(1000):
+        tracer.observe("navigate", 1.0 + index % 2, url=f"https://x/a-pr{index}")
+    tracer.observe("navigate", 5.0, status="error")
+
+    summary = tracer.summary()["navigate"]
+    assert summary["count"] == 1001
+    assert summary["errors"] == 1
+    assert summary["max"] == 5.0
+    assert summary["total"] == 1505.0
+    assert len(tracer.spans) == 10
+    assert tracer.dropped_spans == 991
+    assert 'crawl_phase_seconds_count{phase="navigate"} 1001' in tracer.to_openmetrics()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from helpers import use_src
+
+use_src("extract")
+
+from rate_limiter import HostRateLimiter, TokenBucket  # noqa: E402
+
+
+def acquire_times(bucket, count):
+    async def run():
+        started = time.monotonic()
+        times = []
+        for _ in range(count):
+            await bucket.acquire()
+            times.append(time.monotonic() - started)
+        return times
+
+    return asyncio.run(run())
+
+
+def test_burst_then_steady_rate():
+    times = acquire_times(TokenBucket(rate=20, burst=2), 4)
+    assert times[1] < 0.02
+    # Hết burst thì mỗi request cách nhau ~1/rate giây
+    assert 0.04 <= times[2] < 0.09
+    assert 0.09 <= times[3] < 0.14
+
+
+def test_zero_rate_disables_limit():
+    bucket = TokenBucket(rate=0)
+    assert acquire_times(bucket, 50)[-1] < 0.02
+    assert bucket.counters["acquired"] == 0
+
+
+def test_cooldown_pauses_and_drops_burst():
+    bucket = TokenBucket(rate=50, burst=5)
+    bucket.cooldown(0.1, "blocked")
+    # Cooldown ngắn hơn không rút ngắn cooldown đang chạy
+    bucket.cooldown(0.01, "blocked")
+    assert bucket.cooling_down
+    times = acquire_times(bucket, 2)
+    assert times[0] >= 0.1
+    assert times[1] - times[0] >= 0.015
+    assert bucket.counters["cooldowns"] == 1
+
+
+def test_host_rate_limiter_shares_bucket_per_host():
+    limiter = HostRateLimiter(rate=1, burst=1)
+    waits = []
+    limiter.on_wait = waits.append
+    assert limiter.bucket("https://a.vn/x") is limiter.bucket("https://A.vn/y")
+    assert limiter.bucket("https://a.vn/x") is not limiter.bucket("https://b.vn/x")
+
+    asyncio.run(limiter.acquire("https://a.vn/x"))
+    limiter.cooldown("https://b.vn/x", "blocked", seconds=5)
+    assert not limiter.bucket("https://a.vn/x").cooling_down
+    assert limiter.bucket("https://b.vn/x").cooling_down
+    assert len(waits) == 1
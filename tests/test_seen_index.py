@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+from helpers import use_src
+
+use_src("extract")
+
+from seen_index import SeenIndex, page_fingerprint, post_id_from_url  # noqa: E402
+
+URL = "https://batdongsan.com.vn/ban-nha-rieng-duong-abc/nha-dep-pr41234567"
+PARTS = {"post_id": "41234567", "price": "5 tỷ", "area": "75 m²", "specs_text": "Diện tích 75 m² Mức giá 5 tỷ"}
+
+
+def test_post_id_from_url():
+    assert post_id_from_url(URL) == "41234567"
+    assert post_id_from_url(URL + "?utm=1") == "41234567"
+    assert post_id_from_url("https://x/ban-nha-rieng") is None
+    assert post_id_from_url(None) is None
+
+
+def test_page_fingerprint_is_stable_and_needs_specs():
+    assert page_fingerprint(PARTS) == page_fingerprint(dict(reversed(list(PARTS.items()))))
+    assert page_fingerprint({**PARTS, "price": "5,2 tỷ"}) != page_fingerprint(PARTS)
+    # Chưa có block thông số (trang chưa render xong) thì không so sánh được
+    assert page_fingerprint({**PARTS, "specs_text": ""}) is None
+    assert page_fingerprint(None) is None
+
+
+def test_record_and_lookup_by_post_id(tmp_path):
+    index = SeenIndex(tmp_path / "seen.sqlite", freshness_hours=0)
+    item = {"url": URL, "title": "Nhà đẹp", "price": "5 tỷ"}
+
+    assert index.record(item, page_fingerprint(PARTS))
+    assert not index.record(item)
+    assert index.record({**item, "price": "5,2 tỷ"})
+    # Slug đổi nhưng mã tin giữ nguyên vẫn tìm được, page_fingerprint cũ được giữ khi không truyền
+    moved = "https://batdongsan.com.vn/ban-nha-rieng-duong-xyz/nha-dep-pr41234567"
+    assert index.get_page_fingerprint(moved) == page_fingerprint(PARTS)
+    assert index.get(URL)["crawl_count"] == 3
+    assert index.is_known(moved)
+    assert not index.is_known("https://x/khac-pr1")
+    index.close()
+
+
+def test_freshness_window(tmp_path):
+    crawled_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    item = {"url": URL, "title": "t", "crawled_at": crawled_at.isoformat()}
+
+    disabled = SeenIndex(tmp_path / "seen.sqlite", freshness_hours=0)
+    disabled.record(item)
+    assert not disabled.is_fresh(URL, now=crawled_at + timedelta(minutes=1))
+    disabled.close()
+
+    index = SeenIndex(tmp_path / "seen.sqlite", freshness_hours=4)
+    assert index.is_fresh(URL, now=crawled_at + timedelta(hours=3))
+    assert not index.is_fresh(URL, now=crawled_at + timedelta(hours=4))
+    # touch: tin không đổi vẫn được tính là vừa cào
+    index.touch(URL, seen_at=(crawled_at + timedelta(hours=5)).isoformat())
+    assert index.is_fresh(URL, now=crawled_at + timedelta(hours=6))
+    index.close()
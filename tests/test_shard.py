@@ -0,0 +1,57 @@
+import csv
+
+from helpers import use_src
+
+use_src("extract")
+
+import shard  # noqa: E402
+from utils import CSV_FIELDNAMES  # noqa: E402
+
+
+def write_csv(path, urls):
+    with path.open("w", newline="", encoding="utf-8-sig") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        for url in urls:
+            writer.writerow({"subpage_url": url, "title": url})
+
+
+def read_urls(paths):
+    urls = []
+    for path in paths:
+        with path.open("r", newline="", encoding="utf-8-sig") as csvfile:
+            urls.extend(row["subpage_url"] for row in csv.DictReader(csvfile))
+    return urls
+
+
+def test_split_page_range_covers_every_page_once():
+    assert shard.split_page_range(0, 9, 3) == [(0, 3), (4, 6), (7, 9)]
+    assert shard.split_page_range(5, 6, 4) == [(5, 5), (6, 6)]
+    assert shard.split_page_range(3, 2, 2) == []
+    assert shard.split_page_range(0, 9, 0) == []
+
+    ranges = shard.split_page_range(1, 200, 7)
+    pages = [page for first, last in ranges for page in range(first, last + 1)]
+    assert pages == list(range(1, 201))
+
+
+def test_split_shards_round_robin():
+    assert shard.split_shards(["/a", "/b", "/c"], 2) == [["/a", "/c"], ["/b"]]
+    assert shard.split_shards(["/a"], 3) == [["/a"]]
+    assert shard.split_shards(["/a"], 0) == []
+
+
+def test_merge_shard_outputs_dedupes_and_rolls_over(tmp_path):
+    first, second, output = tmp_path / "w0", tmp_path / "w1", tmp_path / "raw"
+    first.mkdir()
+    second.mkdir()
+    write_csv(first / "a.csv", ["u1", "u2", "u3"])
+    write_csv(second / "a.csv", ["u3", "u4", "u5"])
+
+    written = shard.merge_shard_outputs([first, second], output_dir=output, chunk_size=2)
+
+    assert [path.parent for path in written] == [output] * 3
+    assert all(path.name.startswith("batdongsan_raw_") and path.name.endswith(".csv") for path in written)
+    assert read_urls(written) == ["u1", "u2", "u3", "u4", "u5"]
+    # Không còn file tạm sau khi gộp xong
+    assert list((output / ".inprogress").iterdir()) == []
@@ -0,0 +1,213 @@
+import json
+import logging
+
+import pytest
+
+from helpers import use_src
+
+pytest.importorskip("supabase")
+pytest.importorskip("dotenv")
+use_src("load")
+
+from supabase_class import SupabaseManager  # noqa: E402
+from load_staging import StagingLoader  # noqa: E402
+
+
+def row_bytes(row):
+    return len(json.dumps(row, default=str).encode("utf-8"))
+
+
+def test_plan_batches_splits_by_row_count():
+    rows = [{"id": index} for index in range(10)]
+    assert list(SupabaseManager._plan_batches(rows, 4, 10**6)) == [(0, 4), (4, 8), (8, 10)]
+    assert list(SupabaseManager._plan_batches(rows, 10, 10**6)) == [(0, 10)]
+    assert list(SupabaseManager._plan_batches([], 4, 10**6)) == []
+
+
+def test_plan_batches_splits_by_bytes():
+    rows = [{"id": index, "text": "x" * 50} for index in range(6)]
+    limit = row_bytes(rows[0]) * 2
+    assert list(SupabaseManager._plan_batches(rows, 100, limit)) == [(0, 2), (2, 4), (4, 6)]
+
+
+def test_plan_batches_keeps_oversized_row_alone():
+    rows = [{"id": 0}, {"id": 1, "text": "x" * 500}, {"id": 2}, {"id": 3}]
+    batches = list(SupabaseManager._plan_batches(rows, 100, 100))
+    assert batches == [(0, 1), (1, 2), (2, 4)]
+    # Các khoảng phủ đủ, không lặp dòng nào
+    assert [index for start, end in batches for index in range(start, end)] == list(range(len(rows)))
+
+
+class FakeQuery:
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+
+    def execute(self):
+        ids = tuple(row["id"] for row in self.rows)
+        self.client.sent.append(ids)
+        if self.client.failures.get(ids, 0) > 0:
+            self.client.failures[ids] -= 1
+            raise RuntimeError(f"lỗi {ids[0]}")
+        self.client.committed.extend(ids)
+        return type("Response", (), {"data": self.rows})()
+
+
+class FakeClient:
+    def __init__(self, failures=None):
+        # {ids của batch: số lần lỗi}
+        self.failures = dict(failures or {})
+        self.sent = []
+        self.committed = []
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows):
+        return FakeQuery(self, rows)
+
+
+def make_manager(client):
+    manager = object.__new__(SupabaseManager)
+    manager.default_schema = None
+    manager._clients = {None: client}
+    manager.logger = logging.getLogger("test_supabase_class")
+    return manager
+
+
+def test_batch_insert_retries_only_failed_ranges():
+    rows = [{"id": index} for index in range(10)]
+    client = FakeClient({(4, 5, 6, 7): 1})
+    result = make_manager(client).batch_insert("staging", rows, batch_size=4, max_in_flight=2, retries=2)
+
+    assert result["success"] and result["failed_ranges"] == []
+    assert result["inserted_count"] == 10
+    assert sorted(client.committed) == list(range(10))
+    # Chỉ batch lỗi được gửi lại
+    assert sorted(client.sent) == [(0, 1, 2, 3), (4, 5, 6, 7), (4, 5, 6, 7), (8, 9)]
+
+
+def test_batch_insert_reports_ranges_still_failing():
+    rows = [{"id": index} for index in range(10)]
+    client = FakeClient({(4, 5, 6, 7): 5})
+    result = make_manager(client).batch_insert("staging", rows, batch_size=4, retries=1)
+
+    assert not result["success"]
+    assert [(item["start"], item["end"]) for item in result["failed_ranges"]] == [(4, 8)]
+    assert result["inserted_count"] == 6
+    assert client.sent.count((4, 5, 6, 7)) == 2
+
+
+class FakeManager:
+    def __init__(self, result):
+        self.result = result
+        self.logged = []
+
+    def read(self, **kwargs):
+        return {"success": True, "data": []}
+
+    def batch_insert(self, table, data, batch_size):
+        return self.result
+
+    def create(self, table, data):
+        if table == "staging":
+            return self.result
+        self.logged.append(data)
+        return {"success": True}
+
+
+def make_loader(tmp_path, result, rows=1500):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    lines = ["id,title"] + [f"{index},t{index}" for index in range(rows)]
+    (raw_dir / "data_20240101_000000.csv").write_text("\n".join(lines), encoding="utf-8")
+    loader = object.__new__(StagingLoader)
+    loader.supabase = FakeManager(result)
+    loader.data_dir = raw_dir
+    loader.processed_files_table = "processed_files_log"
+    return loader
+
+
+def test_partial_load_keeps_file_processed_and_saves_failed_rows(tmp_path):
+    loader = make_loader(tmp_path, {
+        "success": False, "data": [], "failed_ranges": [{"start": 1000, "end": 1500, "error": "timeout"}],
+    })
+    summary = loader.process_latest_files()
+
+    assert summary["processed"] == 1 and summary["partial"] == 1 and summary["failed"] == 0
+    assert (tmp_path / "processed" / "data_20240101_000000.csv").exists()
+    failed_rows = (tmp_path / "error" / "data_20240101_000000_failed_rows.csv").read_text().splitlines()
+    assert failed_rows[0] == "id,title" and len(failed_rows) == 501
+    assert failed_rows[1].startswith("1000,")
+    assert loader.supabase.logged[0]["status"] == "partial"
+    assert loader.supabase.logged[0]["record_count"] == 1000
+
+
+def test_load_with_nothing_committed_moves_file_to_error(tmp_path):
+    loader = make_loader(tmp_path, {
+        "success": False, "data": [], "failed_ranges": [{"start": 0, "end": 1500, "error": "down"}],
+    })
+    summary = loader.process_latest_files()
+
+    assert summary["failed"] == 1 and summary["partial"] == 0
+    assert (tmp_path / "error" / "data_20240101_000000.csv").exists()
+    assert not (tmp_path / "error" / "data_20240101_000000_failed_rows.csv").exists()
+
+
+def test_keyset_filter_orders_by_all_key_columns():
+    last_row = {"created_at": "2024-01-01T00:00:00+00:00", "id": 5}
+    assert SupabaseManager._keyset_filter(("created_at", "id"), last_row) == (
+        'created_at.gt."2024-01-01T00:00:00+00:00",created_at.is.null,'
+        'and(created_at.eq."2024-01-01T00:00:00+00:00",id.gt."5")'
+    )
+    assert SupabaseManager._keyset_filter(("id",), {"id": 7}) == 'id.gt."7"'
+
+
+def test_keyset_filter_falls_back_to_id_for_null_key():
+    last_row = {"created_at": None, "id": 5}
+    assert SupabaseManager._keyset_filter(("created_at", "id"), last_row) == 'and(created_at.is.null,id.gt."5")'
+    assert SupabaseManager._keyset_filter(("id",), {"id": None}) == ""
+
+
+def test_keyset_filter_quotes_special_characters():
+    last_row = {"title": 'a,b "c"', "id": 1}
+    assert SupabaseManager._keyset_filter(("title", "id"), last_row).startswith('title.gt."a,b \\"c\\"",')
+
+
+class FakeSelect:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        self.calls.append(("select", columns))
+        return self
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name, *args))
+            return self
+        return record
+
+    def execute(self):
+        data = self.pages.pop(0) if self.pages else []
+        return type("Response", (), {"data": data})()
+
+
+def test_read_with_order_by_and_no_limit_runs_single_query():
+    client = FakeSelect([[{"processed_at": "b"}, {"processed_at": "a"}]])
+    result = make_manager(client).read("log", columns="processed_at", order_by="processed_at desc")
+
+    assert result["success"] and result["count"] == 2
+    assert client.calls == [("select", "processed_at"), ("order", "processed_at desc")]
+
+
+def test_read_without_limit_pages_by_key_columns():
+    client = FakeSelect([[{"id": 1}, {"id": 2}], [{"id": 3}]])
+    result = make_manager(client).read("staging", key_columns=("id",))
+
+    assert [row["id"] for row in result["data"]] == [1, 2, 3]
+    assert ("or_", 'id.gt."2"') in client.calls and ("or_", 'id.gt."3"') in client.calls
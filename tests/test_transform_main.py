@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+
+import pytest
+
+from helpers import use_src
+
+pytest.importorskip("supabase")
+pytest.importorskip("dotenv")
+use_src("transform")
+
+import main  # noqa: E402
+
+
+def row(index, created_at):
+    # Thiếu các trường bắt buộc nên luôn thành dòng lỗi
+    return {"id": index, "created_at": f"2024-01-01T00:00:0{created_at}+00:00"}
+
+
+class FakeRun:
+    def __init__(self, monkeypatch, chunks, fail_at=None, error_write_ok=True):
+        self.written_errors = []
+        self.watermarks = []
+
+        def iter_chunks(supabase, function_name, chunk_size=None):
+            for index, chunk in enumerate(chunks):
+                if index == fail_at:
+                    raise RuntimeError("staging timeout")
+                yield chunk
+
+        def load_to_silver(supabase, valid_rows, error_rows, on_conflict):
+            if not error_write_ok:
+                return False
+            self.written_errors.append([item["id"] for item in error_rows])
+            return True
+
+        @contextmanager
+        def no_pool():
+            yield None
+
+        monkeypatch.setattr(main, "SupabaseManager", lambda default_schema: None)
+        monkeypatch.setattr(main, "iter_newest_data", iter_chunks)
+        monkeypatch.setattr(main, "load_to_silver", load_to_silver)
+        monkeypatch.setattr(main, "update_last_processed", lambda supabase, date: self.watermarks.append(date.second))
+        monkeypatch.setattr(main, "transform_pool", no_pool)
+
+
+def test_boundary_error_rows_are_written_with_the_chunk_that_covers_them(monkeypatch):
+    run = FakeRun(monkeypatch, [[row(1, 1), row(2, 2)], [row(3, 2), row(4, 3)]])
+    main.main()
+
+    # Dòng 2 cùng created_at với đầu chunk sau nên được ghi cùng chunk sau
+    assert run.written_errors == [[1], [2, 3, 4]]
+    assert run.watermarks == [1, 3]
+
+
+def test_read_error_is_logged_and_rows_past_watermark_are_not_written(monkeypatch, caplog):
+    run = FakeRun(monkeypatch, [[row(1, 1), row(2, 2)], [row(3, 2), row(4, 3)], [row(5, 4)]], fail_at=2)
+    main.main()
+
+    # Dòng 4 ở sau watermark sẽ được đọc lại ở lần chạy sau, không ghi ở lần này để tránh trùng
+    assert run.written_errors == [[1], [2, 3]]
+    assert run.watermarks == [1, 2]
+    assert "staging timeout" in caplog.text
+
+
+def test_first_read_error_stops_without_raising(monkeypatch, caplog):
+    run = FakeRun(monkeypatch, [[row(1, 1)]], fail_at=0)
+    assert main.main() is None
+    assert run.written_errors == [] and run.watermarks == []
+    assert "staging timeout" in caplog.text
+
+
+def test_watermark_is_kept_when_error_rows_are_not_written(monkeypatch):
+    run = FakeRun(monkeypatch, [[row(1, 1)], [row(2, 2)]], error_write_ok=False)
+    main.main()
+    assert run.watermarks == []
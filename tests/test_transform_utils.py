@@ -0,0 +1,49 @@
+from helpers import use_src
+
+use_src("transform")
+
+from utils import iter_newest_data  # noqa: E402
+
+
+class FakeSupabase:
+    def __init__(self, last_date, pages):
+        self.last_date = last_date
+        self.pages = pages
+        self.queries = []
+
+    def call_rpc_function(self, function_name):
+        if self.last_date is None:
+            return {"success": False, "error": "rpc lỗi"}
+        return {"success": True, "data": self.last_date}
+
+    def iter_query_pages(self, **kwargs):
+        self.queries.append(kwargs)
+        yield from self.pages
+
+
+def test_iter_newest_data_pages_after_last_transform_date():
+    pages = [[{"id": 1}, {"id": 2}], [{"id": 3}]]
+    supabase = FakeSupabase("2024-01-01T00:00:00+00:00", pages)
+
+    assert list(iter_newest_data(supabase, "get_last_transform_date", page_size=2)) == pages
+    assert supabase.queries == [{
+        "table": "staging",
+        "conditions": {"created_at": {"gt": "2024-01-01T00:00:00+00:00"}},
+        "page_size": 2,
+        "schema": "bronze",
+    }]
+
+
+def test_iter_newest_data_is_empty_when_rpc_fails():
+    supabase = FakeSupabase(None, [[{"id": 1}]])
+    assert list(iter_newest_data(supabase, "get_last_transform_date")) == []
+    assert supabase.queries == []
+
+
+def test_iter_newest_data_groups_pages_into_chunks():
+    pages = [[{"id": 1}, {"id": 2}], [{"id": 3}], [{"id": 4}, {"id": 5}], [{"id": 6}]]
+    supabase = FakeSupabase("2024-01-01T00:00:00+00:00", pages)
+
+    chunks = list(iter_newest_data(supabase, "get_last_transform_date", chunk_size=3))
+    assert [[row["id"] for row in chunk] for chunk in chunks] == [[1, 2, 3], [4, 5, 6]]
+    assert supabase.queries[0]["page_size"] is None